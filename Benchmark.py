@@ -0,0 +1,250 @@
+"""
+Benchmark module
+measures the throughput of the hot paths
+
+suite() runs every benchmark for a list of scales (number of deals) with fixed
+seeds and returns a dictionary, which the command line writes as JSON, e.g.
+    python Benchmark.py --scales 1000 10000 100000 1000000 --output results.json
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import io
+import json
+import math
+import platform
+import random
+import time
+
+import Bridge
+import SquashedOrder
+
+# ---------------------------------------------------------------------------------------
+"""Reference implementation (factorial based), kept to compare against
+"""
+
+def _choose(n, k):
+    return 0 if n < k else math.factorial(n) // math.factorial(n - k) // math.factorial(k)
+
+_max26 = _choose(26, 13)
+_max39 = _choose(39, 13) * _max26
+
+def _index(seq):
+    return sum(_choose(x, i) for i, x in enumerate(seq, start=1))
+
+def _index52_13(sets):
+    A = sorted(sets[0])
+    B = sorted(sets[1])
+    C = sorted(sets[2])
+    a, b, c = 0, 0, 0
+    for element in range(52):
+        if a < 13 and element == A[a]:
+            a += 1
+        elif b < 13 and element == B[b]:
+            B[b] -= a
+            b += 1
+        elif c < 13 and element == C[c]:
+            C[c] -= a + b
+            c += 1
+    return _index(A) * _max39 + _index(B) * _max26 + _index(C)
+
+def _seq(index, n, l):
+    set = []
+    c = _choose(n - 1, l)
+    for n in range(n - 1, 0, -1):
+        if index < c:
+            c = (c * (n - l)) // n
+            continue
+        set.append(n)
+        index -= c
+        c = (c * l) // n
+        l -= 1
+    set = [e for e in range(l)] + sorted(set)
+    return sorted(set)
+
+def _seq52_13(index):
+    i52, i39 = divmod(index, _max39)
+    i39, i26 = divmod(i39, _max26)
+    A = _seq(i52, 52, 13)
+    B = _seq(i39, 39, 13)
+    C = _seq(i26, 26, 13)
+    D = []
+    a, b, c = 0, 0, 0
+    for element in range(52):
+        if a < 13 and A[a] == element:
+            a += 1
+        elif b < 13 and B[b] == (element - a):
+            B[b] = element
+            b += 1
+        elif c < 13 and C[c] == (element - a - b):
+            C[c] = element
+            c += 1
+        else:
+            D.append(element)
+    return [A, B, C, D]
+
+# ---------------------------------------------------------------------------------------
+
+def deals(count, seed=0):
+    """ Returns count random deals (4 sorted lists of cards) for a fixed seed."""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        s = rng.sample(range(52), 52)
+        result.append([sorted(s[i:i+13]) for i in range(0, 52, 13)])
+    return result
+
+def measure(function, data):
+    """ Calls function for every element of data and returns the count, the seconds and the rate."""
+    start = time.perf_counter()
+    for x in data:
+        function(x)
+    seconds = time.perf_counter() - start
+    return {'count': len(data), 'seconds': seconds, 'rate': len(data) / seconds if seconds else None}
+
+def squashedOrder(count=10000, seed=0):
+    """ Measures index52_13 and seq52_13, before (reference implementation) and after."""
+    sets = deals(count, seed)
+    indices = [SquashedOrder.index52_13(s) for s in sets]
+    return { 'index52_13': { 'before': measure(_index52_13, sets),
+                             'after':  measure(SquashedOrder.index52_13, sets) },
+             'seq52_13':   { 'before': measure(_seq52_13, indices),
+                             'after':  measure(SquashedOrder.seq52_13, indices) } }
+
+def pbn(count=10000, seed=0):
+    """ Measures writing and reading PBN per board (tags only and with boards)."""
+    import Pbn
+    rng = random.Random(seed)
+    boards = []
+    for id in range(1, count + 1):
+        board = Bridge.Board(id, rng.randrange(SquashedOrder.max52))
+        board.addScore(Bridge.Score([1, 2], Bridge.Contract(Bridge.SOUTH, 4, Bridge.SPADES), 0, 420))
+        boards.append(board)
+    text = io.StringIO()
+    result = {'write': measure(lambda board: Pbn.write(text, [board]), boards)}
+    games = [game.splitlines() for game in text.getvalue().split('\n\n') if game] # a game per board
+    result['read'] = measure(lambda lines: list(Pbn.read(lines)), games)
+    result['boards'] = measure(lambda lines: list(Pbn.boards(Pbn.read(lines))), games)
+    return result
+
+def numbers(count, seed=0):
+    """ Returns count uniform deal numbers for a fixed seed."""
+    return SquashedOrder.sample(count, seed)
+
+def _boards(count, seed, scores=0):
+    """ Returns count boards from fixed deal numbers, each with scores random scores."""
+    rng = random.Random(seed)
+    boards = []
+    for id, index in enumerate(numbers(count, seed), start=1):
+        board = Bridge.Board(id, index)
+        for pair in range(scores):
+            board.addScore(Bridge.Score([2 * pair + 1, 2 * pair + 2],
+                                        Bridge.Contract(Bridge.SOUTH, 4, Bridge.SPADES),
+                                        0, rng.randrange(-1000, 1000, 10), (0, 0)))
+        boards.append(board)
+    return boards
+
+def squashedOrderSuite(count, seed=0):
+    """ Measures index52_13 and seq52_13."""
+    indices = numbers(count, seed)
+    sets = [SquashedOrder.seq52_13(index) for index in indices]
+    return { 'index52_13': measure(SquashedOrder.index52_13, sets),
+             'seq52_13':   measure(SquashedOrder.seq52_13, indices) }
+
+def handSuite(count, seed=0):
+    """ Measures Hand construction (from cards) and Rating and Type of new hands."""
+    cards = [SquashedOrder.seq52_13(index)[0] for index in numbers(count, seed)]
+    hands = [Bridge.Hand(cards=c) for c in cards]
+    masks = [hand.masks for hand in hands]
+    return { 'Hand':   measure(lambda c: Bridge.Hand(cards=c), cards),
+             'Rating': measure(lambda m: Bridge.Rating(masks=m), masks),
+             'Type':   measure(lambda m: Bridge.Type(masks=m), masks),
+             'Hand.rating': measure(lambda c: Bridge.Hand(cards=c).rating, cards) }
+
+def boardSuite(count, seed=0):
+    """ Measures Board construction from a deal number, decoding on first access
+    (with an empty cache and again with the deals cached) and Board.index.
+    """
+    indices = numbers(count, seed)
+    first = lambda index: Bridge.Board(1, index)[Bridge.NORTH]
+    Bridge.decode.cache_clear()
+    result = { 'Board': measure(lambda index: Bridge.Board(1, index), indices),
+               'Board.decode': measure(first, indices) }
+    # the cache only keeps Bridge.DEALS deals: warm it with the deals measured
+    cached = indices[:Bridge.DEALS]
+    Bridge.decode.cache_clear()
+    for index in cached:
+        Bridge.decode(index)
+    hits = Bridge.decode.cache_info().hits
+    result['Board.decode cached'] = measure(first, cached)
+    assert Bridge.decode.cache_info().hits - hits == len(cached)
+    boards = [Bridge.Board(1, [Bridge.Hand(cards=c) for c in SquashedOrder.seq52_13(index)])
+              for index in cached]
+    result['Board.index'] = measure(lambda board: board.index, boards)
+    Bridge.decode.cache_clear()
+    return result
+
+def renderSuite(count, seed=0):
+    """ Measures Board.__str__ and Board.formatForPair."""
+    boards = _boards(count, seed, scores=1)
+    str(boards[0]) # warm up
+    return { 'Board.__str__': measure(str, boards),
+             'Board.formatForPair': measure(lambda board: board.formatForPair(1), boards) }
+
+def scoreSuite(count, seed=0, scores=15):
+    """ Measures sorting the scores of boards with scores scores each (count scores in total)."""
+    boards = _boards(max(count // scores, 1), seed, scores)
+    return { 'Board.sortScores': measure(lambda board: board.sortScores(), boards),
+             'Board.scores': measure(lambda board: board.scores, boards) }
+
+SUITES = { 'SquashedOrder': squashedOrderSuite, 'Hand': handSuite, 'Board': boardSuite,
+           'render': renderSuite, 'score': scoreSuite }
+
+SCALES = (1000, 10000, 100000, 1000000)
+
+def suite(scales=SCALES, seed=0, suites=None):
+    """ Runs the suites (names, default all) for every scale and returns the results,
+    results[suite][benchmark][scale] = {'count', 'seconds', 'rate'}.
+    """
+    results = {}
+    for name in suites or SUITES:
+        results[name] = {}
+        for scale in scales:
+            for benchmark, result in SUITES[name](scale, seed).items():
+                results[name].setdefault(benchmark, {})[str(scale)] = result
+    return { 'version': Bridge.__version__,
+             'python': platform.python_version(),
+             'machine': platform.machine(),
+             'seed': seed,
+             'scales': list(scales),
+             'results': results }
+
+# ---------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--suites', nargs='+', choices=list(SUITES))
+    parser.add_argument('--output', help="JSON file (default: stdout), "
+                                         "the comparisons with the reference implementation follow")
+    arguments = parser.parse_args()
+
+    results = suite(arguments.scales, arguments.seed, arguments.suites)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    for name, result in squashedOrder().items():
+        before, after = result['before']['rate'], result['after']['rate']
+        print(F"{name:12} {before:10.0f} -> {after:10.0f} deals/s  ({after / before:.1f}x)")
+    for name, result in pbn().items():
+        print(F"pbn {name:8} {result['rate']:10.0f} boards/s")
@@ -7,8 +7,10 @@ Michael Sube (@msube) 2018
 __version__ = '0.5'
 __author__ = "Michael Sube"
 
+import functools
 import logging
 import re
+from collections.abc import Mapping
 import SquashedOrder
 
 # ---------------------------------------------------------------------------------------
@@ -121,6 +123,9 @@ class Direction:
     @property
     def factor(self):
         return self._factor
+    @property
+    def index(self):
+        return self._index
 
 NS = Direction(0, 'N/S', +1)
 EW = Direction(1, 'O/W', -1)
@@ -147,6 +152,9 @@ class Position():
     @property
     def direction(self):
         return self._direction
+    @property
+    def index(self):
+        return self._index
 
 NORTH = Position(0, 'N', NS)
 EAST  = Position(1, 'O', EW)
@@ -174,6 +182,9 @@ class Vulnerable:
     @property
     def directions(self):
         return self._directions
+    @property
+    def index(self):
+        return self._index
 
 VUL_NONE = Vulnerable(0, 'None', set())
 VUL_NS   = Vulnerable(1, 'N/S',  {NS})
@@ -197,6 +208,9 @@ class Risk:
         return self._index < other._index
     def __str__(self):
         return self.name
+    @property
+    def index(self):
+        return self._index
 
 UNDOUBLED = Risk(0, '')
 DOUBLED   = Risk(1, 'x')
@@ -244,6 +258,15 @@ class Contract:
     @property
     def declarer(self):
         return self._declarer
+    @property
+    def level(self):
+        return self._level
+    @property
+    def denomination(self):
+        return self._denomination
+    @property
+    def risk(self):
+        return self._risk
 
 PASS = Contract(None)
 
@@ -271,94 +294,163 @@ class Score:
         value = F"{self.value:+}" if self.contract else ""
         return F"{value:>5}{ns:>8}   {contract:12} {ew:>8}"
 
-class Hand(dict):
+class Hand(Mapping):
     """ A hand holds the cards, the type and a rating.
+    The cards are kept in a 52 bit mask (bit = card, 13 bits per suit),
+    the ranks per suit, the rating and the type are computed when first needed.
+    A hand is immutable.
     """
-    def __init__(self, cards=None, suits=None):
+    __slots__ = ('_bits', '_ranks', '_rating', '_type')
+
+    def __init__(self, cards=None, suits=None, bits=None):
         if cards: # list of cards
-            suits = [[] for suit in Suits]
-            for card in sorted(cards, reverse=True):
-                suits[Card.suit(card).index].append(Card.rank(card))
+            bits = 0
+            for card in cards:
+                bits |= 1 << card
         elif suits: # list of ranks per suit
-            suits = [sorted(suit, reverse=True) for suit in suits]
-        else:
-            suits = [[] for suit in Suits]
-        self.update(dict(zip(Suits, suits)))
-        self._length = sum(len(ranks) for ranks in suits)
-        self.rating = Rating(suits)
-        self.type = Type(suits)
+            bits = 0
+            for suit, ranks in zip(Suits, suits):
+                for rank in ranks:
+                    bits |= 1 << Card.card(suit, rank)
+        self._bits = bits or 0
+        self._ranks = None
+        self._rating = None
+        self._type = None
+
+    def __getitem__(self, suit): # ranks of a suit, descending
+        if not isinstance(suit, Suit) or suit.index >= len(Suits):
+            raise KeyError(suit)
+        return self.ranks[suit.index]
+
+    def __iter__(self):
+        return iter(Suits)
 
     def __bool__(self):
-        return self._length == 13
+        return len(self) == 13
 
     def __len__(self):
-        return self._length
+        return bin(self._bits).count('1')
+
+    def __eq__(self, other):
+        if isinstance(other, Hand):
+            return self._bits == other._bits
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self._bits)
+
+    def __repr__(self):
+        return F"{self.__class__.__name__}({self!s})"
 
     def __str__(self):
         suits = [str(suit) + ''.join(Ranks[rank] for rank in self[suit]) for suit in sorted(Suits, reverse=True)]
         return ''.join(F"{suit:10}" for suit in suits)
 
+    @property
+    def bits(self): # 52 bit mask of the cards
+        return self._bits
+
+    @property
+    def masks(self): # 13 bit mask of the ranks per suit
+        return [(self._bits >> (suit.index * len(RANKS))) & 0x1FFF for suit in Suits]
+
+    @property
+    def ranks(self): # tuple of ranks per suit, descending
+        if self._ranks is None:
+            self._ranks = tuple(tuple(rank for rank in reversed(RANKS) if mask >> rank & 1)
+                                for mask in self.masks)
+        return self._ranks
+
     @property
     def cards(self): # combines suits into list of cards
-        return list( sorted( (Card.card(suit, rank) for suit in Suits
-                                                    for rank in self[suit]),
-                             reverse=True ) )
+        return [card for card in reversed(CARDS) if self._bits >> card & 1]
 
     @property
     def suits(self): # returns a dictionary of the suits
         return { suit:self[suit] for suit in Suits }
 
+    @property
+    def rating(self):
+        if self._rating is None:
+            self._rating = Rating(masks=self.masks)
+        return self._rating
+
+    @property
+    def type(self):
+        if self._type is None:
+            self._type = Type(masks=self.masks)
+        return self._type
+
+def _suitRating(ranks):
+    """ Computes the share of one suit (ranks descending) in the rating:
+    hcp, loser, ds, adjust, dp and the counts needed across the suits:
+    aces, queens within the top 3 of a 3+ suit, honor balance (A + T - Q - J).
+    """
+    length = len(ranks)
+    hcp = sum(max(rank - TEN, 0) for rank in ranks)
+    loser = min(length, 3) - sum(rank > (ACE - min(length, 3)) for rank in ranks)
+    aces = sum(rank == ACE for rank in ranks[:1])
+    queens = sum(rank == QUEEN for rank in ranks[:3]) if length > 2 else 0
+    # AK = 2, AD = 1, KD = 1 : ([1]-'B')
+    # Ax = 1, Kx = 1, Dx = 0 : ([0]-'D')/2
+    ds = ( max(ranks[1] - JACK, 0, (ranks[0] - QUEEN) / 2) if length > 1
+           else max(ranks[0] - KING, 0) if length == 1 else 0 )
+    honors = sum((rank in [ACE, TEN]) - (rank in [QUEEN, JACK]) for rank in ranks)
+    # + suit length
+    adjust = length - 4 if length >= 4 else 0
+    # - double with honor, downgrade xJ, KD, Qx, Jx
+    if length == 2:
+        adjust -= ( ranks[1] == JACK
+                    or ranks == [KING, QUEEN]
+                    or ranks[0] in [QUEEN, JACK] and ranks[1] < JACK )
+    # - single honors, downgrade K, Q, J
+    if length == 1:
+        adjust -= ranks[0] in [KING, QUEEN, JACK]
+    # + suit quality (4+er mit min 3 von 5)
+    if length > 3:
+        adjust += ranks[2] >= TEN
+    dp = max(3 - length, 0)
+    return (hcp, loser, ds, int(adjust), dp, aces, queens, honors)
+
+# share of a suit in the rating for every 13 bit mask of ranks
+SuitRatings = [_suitRating([rank for rank in reversed(RANKS) if mask >> rank & 1])
+               for mask in range(1 << len(RANKS))]
+
 class Rating:
     """ The rating holds informtion about a set of cards.
+    The suits are looked up in SuitRatings and combined with the terms across the suits.
     """
-    def __init__(self, suits=None):
+    def __init__(self, suits=None, masks=None):
         self.hcp = 0
         self.loser = 0
         self.ds = 0
         self.adjust = 0
         self.dp = 0
-        if not suits: return
-        # count HCPs
-        self.hcp = sum(max(rank - TEN, 0) for ranks in suits for rank in ranks)
-        # count loser
-        self.loser = ( sum(min(len(ranks), 3) for ranks in suits)
-                     - sum( rank > (ACE - min(len(ranks), 3))
-                            for ranks in suits for rank in ranks) )
-        # count A's and D's and adjust the losers
-        numA = sum(rank == ACE for ranks in suits for rank in ranks[:1])
-        numQ = sum(rank == QUEEN for ranks in suits if len(ranks) > 2
-                                 for rank in ranks[:3])
+        if suits: # list of ranks per suit
+            masks = [sum(1 << rank for rank in ranks) for ranks in suits]
+        if not masks: return
+        hcp, loser, ds, adjust, dp, numA, numQ, honors = SuitRatings[masks[0]]
+        for mask in masks[1:]:
+            h, l, d, a, p, na, nq, ho = SuitRatings[mask]
+            hcp += h
+            loser += l
+            ds += d
+            adjust += a
+            dp += p
+            numA += na
+            numQ += nq
+            honors += ho
         # extra D's are loser
-        self.loser += max(numQ - numA, 0)
+        loser += max(numQ - numA, 0)
         # some extra A's reduce the losers
-        self.loser -= (numA > 2) * max(numA - max(numQ, 2), 0)
-        # count DS
-        # AK = 2, AD = 1, KD = 1 : ([1]-'B')
-        # Ax = 1, Kx = 1, Dx = 0 : ([0]-'D')/2
-        self.ds = ( sum( max(ranks[1] - JACK, 0, (ranks[0] - QUEEN) / 2 )
-                         for ranks in suits if len(ranks) > 1)
-                  + sum( max(ranks[0] - KING, 0)
-                         for ranks in suits if len(ranks) == 1))
-        # compute adjustment for starter points
-        numQ = sum(rank == QUEEN for ranks in suits for rank in ranks)
-        numJ = sum(rank == JACK for ranks in suits for rank in ranks)
-        numT = sum(rank == TEN for ranks in suits for rank in ranks)
+        loser -= (numA > 2) * max(numA - max(numQ, 2), 0)
         # +- overrated/underrated honors
-        self.adjust = (numA + numT - numQ - numJ) // 3
-        # + suit length
-        self.adjust += sum(len(ranks) - 4 for ranks in suits if len(ranks) >= 4)
-        # - double with honor, downgrade xJ, KD, Qx, Jx
-        self.adjust -= sum( ( ranks[1] == JACK
-                              or ranks == [KING, QUEEN]
-                              or ranks[0] in [QUEEN, JACK] and ranks[1] < JACK )
-                            for ranks in suits if len(ranks) == 2 )
-        # - single honors, downgrade K, Q, J
-        self.adjust -= sum( ranks[0] in [KING, QUEEN, JACK]
-                            for ranks in suits if len(ranks) == 1 )
-        # + suit quality (4+er mit min 3 von 5)
-        self.adjust += sum( ranks[2] >= TEN for ranks in suits if len(ranks) > 3 )
-        # compute distribution points
-        self.dp = sum(max(3 - len(ranks), 0) for ranks in suits)
+        adjust += honors // 3
+        self.hcp = hcp
+        self.loser = loser
+        self.ds = ds
+        self.adjust = adjust
+        self.dp = dp
 
     def __add__(self, other):
         rating = self.__class__()
@@ -376,8 +468,13 @@ class Rating:
 class Type:
     """ A type hold information on how a set of cards is distributed across the suits.
     """
-    def __init__(self, suits=None):
-        self.type = [len(ranks) for ranks in suits] if suits else [0,0,0,0]
+    def __init__(self, suits=None, masks=None):
+        if suits: # list of ranks per suit
+            self.type = [len(ranks) for ranks in suits]
+        elif masks: # 13 bit mask of ranks per suit
+            self.type = [bin(mask).count('1') for mask in masks]
+        else:
+            self.type = [0,0,0,0]
         self.isFlat = sum(max(3 - l, 0) for l in self.type) < 2
 
     def __add__(self, other):
@@ -391,20 +488,32 @@ class Type:
 
 # ---------------------------------------------------------------------------------------
 
+DEALS = 1 << 16 # deals kept decoded, shared by all boards
+
+@functools.lru_cache(maxsize=DEALS)
+def decode(index):
+    """ The 4 hands of a deal number, the hands (with their rating and type) are shared."""
+    return tuple(Hand(cards=cards) for cards in SquashedOrder.seq52_13(index))
+
 class Board(dict):
     """ A board combines the hands, the scores and the board specific informations.
+    A board built from a deal number decodes the hands when they are first accessed.
     """
 
-    def __init__(self, id, hands=None, dd=None):
+    def __init__(self, id, hands=None, dd=None, dealer=None, vulnerable=None):
         super().__init__()
         self.id = id # integer
-        self._dealer = Position.get(  (int(id) - 1) % 4  )
+        # dealer and vulnerability follow the board id unless given
+        self._dealer = dealer or Position.get(  (int(id) - 1) % 4  )
 
-        self._vulnerable = Vulnerable.get(((int(id)-1)%4 + (int(id)-1)//4)%4)
+        self._vulnerable = vulnerable or Vulnerable.get(((int(id)-1)%4 + (int(id)-1)//4)%4)
         self._length = 0
+        self._index = None
+        self._decoded = True
         self.addHands(hands)
         self.dd = dd
         self._scores = []
+        self._pairs = {} # pair -> score
         self.results = {}
 
     def __bool__(self):  # true iff all 4 hands are complete
@@ -413,6 +522,60 @@ class Board(dict):
     def __len__(self): # number of complete hands
         return self._length
 
+    def __missing__(self, position):
+        if self._decoded: raise KeyError(position)
+        self._decode()
+        return dict.__getitem__(self, position)
+
+    def __iter__(self):
+        self._decode()
+        return super().__iter__()
+
+    def __contains__(self, position):
+        self._decode()
+        return super().__contains__(position)
+
+    def get(self, position, default=None):
+        self._decode()
+        return super().get(position, default)
+
+    def keys(self):
+        self._decode()
+        return super().keys()
+
+    def values(self):
+        self._decode()
+        return super().values()
+
+    def items(self):
+        self._decode()
+        return super().items()
+
+    def __setitem__(self, position, hand):
+        self._decode() # a later decode must not overwrite the hand
+        super().__setitem__(position, hand)
+        self._changed()
+
+    def __delitem__(self, position):
+        self._decode()
+        super().__delitem__(position)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        self._decode()
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def _changed(self):
+        """ The hands were changed: the index is computed again when needed."""
+        self._index = None
+        self._length = sum(bool(hand) for hand in super().values())
+
+    def _decode(self):
+        if not self._decoded:
+            self._decoded = True
+            super().update(zip(Positions, decode(self._index)))
+
     def __str__(self):
         return ( F"Board: {self.id:2}  ({self.index})"
                   "\n\n"
@@ -437,47 +600,74 @@ class Board(dict):
 
 
     def formatForPair(self, pair):
-        for score in self._scores:
-            if not pair in score.pairs: continue # not played by pair
-            dir = NS if pair == score.pairs[0] else EW
-            result = F"{score.result:+}" if score.result else "="
-            contract = F"{score.contract!s:7}{result:>2}" if score.contract else 'Pass'
-            pos = dir.positions
-            declared = [' ', ' ', ' ']
-            if score.contract.declarer in pos:
-                declared[0] = '*'
-                declared[1 if score.contract.declarer == pos[0] else 2] = '*'
-            value = score.value if dir == NS else -score.value
-            points = score.points[0] if dir == NS else score.points[1]
-            return ( F"{self.id:3}   {contract:9} {value:+5}  {int(points):+4}"
-                   F"  {declared[0]!s:1}{dir!s:3}: {self.rating(dir)}{self.type(dir)}"
-                   F"  {declared[1]!s:1}{pos[0]!s:1}: {self[pos[0]].rating}"
-                   F" {self[pos[0]].type}"
-                   F"  {declared[2]!s:1}{pos[1]!s:1}: {self[pos[1]].rating}"
-                   F" {self[pos[1]].type}"
-                 )
+        score = self._pairs.get(pair)
+        if score is None: return # not played by pair
+        dir = NS if pair == score.pairs[0] else EW
+        result = F"{score.result:+}" if score.result else "="
+        contract = F"{score.contract!s:7}{result:>2}" if score.contract else 'Pass'
+        pos = dir.positions
+        declared = [' ', ' ', ' ']
+        if score.contract.declarer in pos:
+            declared[0] = '*'
+            declared[1 if score.contract.declarer == pos[0] else 2] = '*'
+        value = score.value if dir == NS else -score.value
+        points = score.points[0] if dir == NS else score.points[1]
+        return ( F"{self.id:3}   {contract:9} {value:+5}  {int(points):+4}"
+               F"  {declared[0]!s:1}{dir!s:3}: {self.rating(dir)}{self.type(dir)}"
+               F"  {declared[1]!s:1}{pos[0]!s:1}: {self[pos[0]].rating}"
+               F" {self[pos[0]].type}"
+               F"  {declared[2]!s:1}{pos[1]!s:1}: {self[pos[1]].rating}"
+               F" {self[pos[1]].type}"
+             )
 
     def playedBy(self, pair):
-        for score in self._scores:
-            if pair in score.pairs: return True
+        return pair in self._pairs
 
     def addScore(self, score):
         self._scores.append(score)
+        for pair in score.pairs:
+            if pair is not None: self._pairs[pair] = score
 
     def sortScores(self):
         self._scores.sort(reverse=True)
 
     def addHands(self, hands):
-        if isinstance(hands, int):  # an index: 0 .. ~10**29
-            hands = [Hand(cards=cards) for cards in SquashedOrder.seq52_13(hands)]
-        if isinstance(hands, list):  # either passed in or computed from an index
-            self.update(zip(Positions, hands))
-        self._length = sum(bool(self[index]) for index in self)
+        if isinstance(hands, int):  # an index: 0 .. ~10**29, decoded when first needed
+            self.clear()
+            self._index = hands
+            self._decoded = False
+            self._length = len(Positions)
+            return
+        self._decode()
+        if isinstance(hands, list):
+            super().update(zip(Positions, hands))
+        self._changed()
+
+    def clearScores(self):
+        """ Removes all scores, returns them in the order they were added."""
+        scores, self._scores, self._pairs = self._scores, [], {}
+        return scores
 
     @property
     def scores(self):
         return sorted(self._scores, reverse=True)
 
+    @property
+    def entries(self): # the scores in the order they were added
+        return tuple(self._scores)
+
+    @property
+    def pairs(self): # pair -> score
+        return dict(self._pairs)
+
+    @property
+    def dealer(self):
+        return self._dealer
+
+    @property
+    def vulnerable(self):
+        return self._vulnerable
+
     @property
     def hands(self): # returns a dictionary of the hands
         return { position: self[position] for position in Positions }
@@ -490,7 +680,9 @@ class Board(dict):
     def index(self):
         if not bool(self):  # can't compute index if cards are missing
             return None
-        return SquashedOrder.index52_13([self[pos].cards for pos in Positions])
+        if self._index is None:
+            self._index = SquashedOrder.index52_13([self[pos].cards for pos in Positions])
+        return self._index
 
     def type(self, dir):
         positions = dir.positions
@@ -552,5 +744,22 @@ if __name__ == '__main__':
             print(Board(i, hands=i))
             print()
 
+        # a hand set before the first access is kept, the index follows the hands
+        board = Board(1, 35817416954748550972957151064)
+        north, east = decode(35817416954748550972957151064)[:2]
+        board[NORTH], board[EAST] = east, north
+        assert board[NORTH] == east and board[EAST] == north
+        assert board.index == SquashedOrder.index52_13([board[position].cards for position in Positions])
+        assert board.index != 35817416954748550972957151064
+
+
 
 
+        # the hands of decoded deals are shared, their ranks can't be changed
+        spades = decode(35817416954748550972957151064)[0][SPADES]
+        try:
+            spades.append(ACE)
+            assert False
+        except AttributeError:
+            pass
+        assert decode(35817416954748550972957151064)[0][SPADES] == spades
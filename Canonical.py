@@ -0,0 +1,120 @@
+"""
+Canonical module
+computes the canonical form of a deal under seat rotation and suit symmetries
+
+A symmetry is a rotation of the seats and a permutation of the suits. The
+canonical deal number is the smallest deal number (SquashedOrder) of all
+images of the deal under a group of symmetries, so equivalent deals have the
+same canonical number. The symmetry which maps a deal to its canonical form
+is returned as well, so results computed for the canonical deal (e.g. double
+dummy tables) can be mapped back.
+
+Groups:
+  SEATS   the 4 rotations
+  CLASSES the rotations and swapping clubs/diamonds and hearts/spades (16)
+  SUITS   the rotations and all permutations of the suits (96), for analyses
+          which don't depend on the rank of the suits (e.g. shape or NT only)
+
+The images of a batch of deals are computed with SquashedBatch.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import itertools
+import numpy as np
+
+import SquashedBatch
+
+_RANKS = 13
+
+def _group(permutations):
+    """ The symmetries (rotation, suits) with suits[old suit] = new suit."""
+    return [(rotation, suits) for rotation in range(4) for suits in permutations]
+
+IDENTITY = (0, (0, 1, 2, 3))
+
+SEATS = _group([(0, 1, 2, 3)])
+CLASSES = _group([(0, 1, 2, 3), (1, 0, 2, 3), (0, 1, 3, 2), (1, 0, 3, 2)])
+SUITS = _group(list(itertools.permutations(range(4))))
+
+def _columns(suits):
+    """ The old card of every new card for a permutation of the suits."""
+    columns = np.empty(4 * _RANKS, dtype=np.intp)
+    for old, new in enumerate(suits):
+        columns[new * _RANKS:(new + 1) * _RANKS] = np.arange(old * _RANKS, (old + 1) * _RANKS)
+    return columns
+
+def apply(seats, symmetry):
+    """ The (N, 52) seats of the images of seats under a symmetry:
+    the hand of position p moves to position p - rotation.
+    """
+    rotation, suits = symmetry
+    seats = np.asarray(seats)[:, _columns(suits)]
+    return ((seats.astype(np.int16) - rotation) % 4).astype(np.uint8)
+
+def inverse(symmetry):
+    rotation, suits = symmetry
+    back = [0] * 4
+    for old, new in enumerate(suits):
+        back[new] = old
+    return ((4 - rotation) % 4, tuple(back))
+
+# ---------------------------------------------------------------------------------------
+
+def canonicalBatch(deals, group=CLASSES):
+    """ The canonical deal numbers (DEAL array) of deals (DEAL array) and the number of the
+    symmetry of group mapping each deal to it.
+    """
+    seats = SquashedBatch.seq52_13(deals)
+    images = np.stack([SquashedBatch.index52_13(apply(seats, symmetry)) for symmetry in group], axis=1)
+    hi, lo = images['hi'], images['lo']
+    # the smallest (hi, lo) per row
+    lowest = hi == hi.min(axis=1, keepdims=True)
+    lo = np.where(lowest, lo, np.iinfo(np.uint64).max)
+    best = lo.argmin(axis=1)
+    return images[np.arange(len(images)), best], best
+
+def canonical(index, group=CLASSES):
+    """ The canonical deal number of a deal number and the symmetry (rotation, suits) mapping
+    the deal to it.
+    """
+    deals, best = canonicalBatch(SquashedBatch.fromInt([index]), group)
+    return SquashedBatch.toInt(deals)[0], group[best[0]]
+
+def isCanonical(index, group=CLASSES):
+    return canonical(index, group)[0] == index
+
+def mapTable(dd, symmetry):
+    """ The double dummy table of a deal from the table of its image under symmetry,
+    dd[denomination][position] as DoubleDummy.table.
+    """
+    rotation, suits = symmetry
+    return ( [ [dd[suits[suit]][(position - rotation) % 4] for position in range(4)] for suit in range(4) ]
+             + [ [dd[4][(position - rotation) % 4] for position in range(4)] ] )
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+
+    index = 35817416954748550972957151064
+    for group, name in [(SEATS, 'seats'), (CLASSES, 'classes'), (SUITS, 'suits')]:
+        number, symmetry = canonical(index, group)
+        print(F"{name:8} {number:30} {symmetry}")
+        # every image has the same canonical form
+        seats = SquashedBatch.seq52_13(SquashedBatch.fromInt([index]))
+        for other in group:
+            image = SquashedBatch.toInt(SquashedBatch.index52_13(apply(seats, other)))[0]
+            assert canonical(image, group)[0] == number
+        # the symmetry maps the deal to its canonical form
+        image = SquashedBatch.toInt(SquashedBatch.index52_13(apply(seats, symmetry)))[0]
+        assert image == number
+        back = SquashedBatch.toInt(SquashedBatch.index52_13(apply(apply(seats, symmetry), inverse(symmetry))))[0]
+        assert back == index
+
+    deals = SquashedBatch.sample(100000, seed=0)
+    start = time.perf_counter()
+    canonicalBatch(deals)
+    print(F"{len(deals) / (time.perf_counter() - start):10.0f} deals/s (classes)")
@@ -0,0 +1,205 @@
+"""
+DealArchive module
+implements a binary file of fixed size records keyed by the deal number (SquashedOrder)
+
+A file has a header of 64 bytes followed by the records:
+  deal   12 bytes  deal number (SquashedBatch.DEAL)
+  board   4 bytes  board id
+and optionally the rating and the type of the 4 positions (flag RATING):
+  hcp, loser, ds, adjust, dp, isFlat (4 values each), type (4 x 4 suit lengths)
+
+The writer updates the count of the header after every batch, so the records
+appended before a crash can be read. The reader maps the file into memory,
+nothing is read before it is used.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import operator
+import os
+import numpy as np
+
+import Bridge
+import RatingBatch
+import SquashedBatch
+
+MAGIC = b'BRDA'
+VERSION = 1
+
+RATING = 1 # flag: rating and type columns
+
+HEADER = np.dtype([ ('magic', 'S4'), ('version', '<u2'), ('flags', '<u2'),
+                    ('count', '<u8'), ('reserved', 'V48') ])
+
+_POSITIONS = len(Bridge.Positions)
+_SUITS = len(Bridge.Suits)
+
+def record(flags=0):
+    """ Returns the dtype of a record."""
+    fields = [('deal', SquashedBatch.DEAL), ('board', '<u4')]
+    if flags & RATING:
+        fields += [ ('hcp',    'u1', (_POSITIONS,)),
+                    ('loser',  'i1', (_POSITIONS,)),
+                    ('ds',     '<f2', (_POSITIONS,)),  # halves are exact
+                    ('adjust', 'i1', (_POSITIONS,)),
+                    ('dp',     'u1', (_POSITIONS,)),
+                    ('type',   'u1', (_POSITIONS, _SUITS)),
+                    ('isFlat', '?',  (_POSITIONS,)) ]
+    return np.dtype(fields)
+
+class ArchiveError(Exception):
+    pass
+
+# ---------------------------------------------------------------------------------------
+
+class DealArchiveWriter:
+    """ Writes an archive, records are appended in batches.
+    with DealArchiveWriter(path, rating=True) as archive:
+        archive.append(deals, boards)
+    """
+    def __init__(self, path, rating=False):
+        self.flags = RATING if rating else 0
+        self.dtype = record(self.flags)
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._file.write(self._header().tobytes())
+
+    def _header(self):
+        header = np.zeros((), dtype=HEADER)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['flags'] = self.flags
+        header['count'] = self.count
+        return header
+
+    def append(self, deals, boards=None):
+        """ Appends deals (DEAL array or deal numbers) with their board ids (default 1, 2, ...)."""
+        if not isinstance(deals, np.ndarray):
+            deals = SquashedBatch.fromInt(list(deals))
+        records = np.zeros(len(deals), dtype=self.dtype)
+        records['deal'] = deals
+        records['board'] = ( np.arange(self.count + 1, self.count + len(deals) + 1)
+                             if boards is None else boards )
+        if self.flags & RATING:
+            columns = RatingBatch.rateSeats(SquashedBatch.seq52_13(deals))
+            for name in RatingBatch.METRICS:
+                records[name] = columns[name]
+        self._file.write(records.tobytes())
+        self.count += len(records)
+        self.flush()
+
+    def flush(self):
+        """ Writes the records appended and the count to the file."""
+        self._file.seek(0)
+        self._file.write(self._header().tobytes())
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed: return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def write(path, deals, boards=None, rating=False):
+    """ Writes an archive in one go."""
+    with DealArchiveWriter(path, rating) as archive:
+        archive.append(deals, boards)
+
+# ---------------------------------------------------------------------------------------
+
+class DealArchive:
+    """ Reads an archive, the records are mapped into memory.
+    archive[i] is the board of record i, the columns are numpy views (no copies).
+    """
+    def __init__(self, path):
+        size = os.path.getsize(path)
+        if size < HEADER.itemsize:
+            raise ArchiveError(F"{path}: no deal archive")
+        header = np.fromfile(path, dtype=HEADER, count=1)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ArchiveError(F"{path}: no deal archive of version {VERSION}")
+        self.flags = int(header['flags'])
+        self.dtype = record(self.flags)
+        count = int(header['count'])
+        if HEADER.itemsize + count * self.dtype.itemsize > size:
+            raise ArchiveError(F"{path}: truncated, {count} records expected")
+        self.records = ( np.memmap(path, dtype=self.dtype, mode='r', offset=HEADER.itemsize, shape=(count,))
+                         if count else np.zeros(0, dtype=self.dtype) )
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, number):
+        """ The board of record number, a list of boards for a slice."""
+        if isinstance(number, slice):
+            return [self[number] for number in range(*number.indices(len(self)))]
+        number = operator.index(number) # TypeError for other keys
+        record = self.records[number]
+        return Bridge.Board(int(record['board']), self.index(number))
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+    @property
+    def hasRating(self):
+        return bool(self.flags & RATING)
+
+    def index(self, number):
+        """ The deal number of record number."""
+        deal = self.records['deal'][number]
+        return int(deal['hi']) << 64 | int(deal['lo'])
+
+    def column(self, name):
+        """ A column (board, deal, hcp, loser, ds, adjust, dp, type, isFlat) as view into the file."""
+        return self.records[name]
+
+    def seats(self, numbers=slice(None)):
+        """ The (N, 52) array of seats of the records."""
+        return SquashedBatch.seq52_13(self.records['deal'][numbers])
+
+# ============================================================================
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    count = 1000000
+    path = os.path.join(tempfile.mkdtemp(), 'deals.brda')
+    deals = SquashedBatch.sample(count, seed=0)
+
+    start = time.perf_counter()
+    with DealArchiveWriter(path, rating=True) as writer:
+        for chunk in range(0, count, 100000):
+            writer.append(deals[chunk:chunk + 100000])
+    print(F"write: {count / (time.perf_counter() - start):10.0f} deals/s, {os.path.getsize(path)} bytes")
+
+    start = time.perf_counter()
+    archive = DealArchive(path)
+    hcp = archive.column('hcp')
+    strong = ((hcp[:, 0] + hcp[:, 2]) >= 25).sum()
+    print(F"query: {time.perf_counter() - start:.3f}s, N/S 25+ hcp: {strong / len(archive):.3f}")
+
+    board = archive[123456]
+    print(board)
+    assert board.index == archive.index(123456) == SquashedBatch.toInt(deals[123456:123457])[0]
+    assert [board[position].rating.hcp for position in Bridge.Positions] == list(hcp[123456])
+    assert [board.index for board in archive[123455:123458]] == [archive.index(n) for n in range(123455, 123458)]
+
+    # the records of a writer not closed are read with the count of the last batch
+    crashed = os.path.join(os.path.dirname(path), 'crashed.brda')
+    writer = DealArchiveWriter(crashed)
+    writer.append(deals[:1000])
+    writer.append(deals[1000:1500])
+    assert len(DealArchive(crashed)) == 1500
+    writer.close()
+    os.remove(crashed)
+    os.remove(path)
@@ -0,0 +1,230 @@
+"""
+DealGenerator module
+generates random deals matching constraints on the hands
+
+The work is split into chunks of random deals. Every chunk has its own seed,
+derived from the generator's seed and the chunk number, and the chunks are
+collected in order, so the accepted deals only depend on the seed,
+not on the number of worker processes. A chunk is dealt and rated as a
+whole (RatingBatch), Constraints are checked on the columns of the chunk,
+other predicates only get the hands of the deals matching the Constraints.
+Constraints whose hcp ranges cannot add up to the 40 hcp of a deal are rejected
+at once, otherwise dealing gives up after ATTEMPTS deals per deal wanted.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import collections
+import multiprocessing
+import random
+
+import numpy as np
+
+import Bridge
+import RatingBatch
+import SquashedBatch
+
+ATTEMPTS = 1000 # deals dealt per matching deal wanted, at most
+
+# ---------------------------------------------------------------------------------------
+
+class Constraint:
+    """ A constraint on the rating and the type of one position.
+    Ranges are given as (min, max), both inclusive, a single value means (value, value).
+    length maps suits to the range of their length.
+    """
+    def __init__(self, position, hcp=None, loser=None, ds=None, adjust=None, dp=None,
+                 length=None, isFlat=None):
+        self.position = position.index # positions are kept as index to be picklable
+        self.ranges = [ (name, value if isinstance(value, tuple) else (value, value))
+                        for name, value in [ ('hcp', hcp), ('loser', loser), ('ds', ds),
+                                             ('adjust', adjust), ('dp', dp) ]
+                        if value is not None ]
+        self.length = [ (suit.index, value if isinstance(value, tuple) else (value, value))
+                        for suit, value in (length or {}).items() ]
+        self.isFlat = isFlat
+
+    def __call__(self, hands):
+        hand = hands[self.position]
+        rating = hand.rating
+        for name, (low, high) in self.ranges:
+            if not low <= getattr(rating, name) <= high: return False
+        type = hand.type
+        for suit, (low, high) in self.length:
+            if not low <= type.type[suit] <= high: return False
+        return self.isFlat is None or type.isFlat == self.isFlat
+
+    def select(self, columns):
+        """ The deals matching the constraint, for the columns [deal, position] of RatingBatch."""
+        match = np.ones(len(columns['hcp']), dtype=bool)
+        for name, (low, high) in self.ranges:
+            column = columns[name][:, self.position]
+            match &= (low <= column) & (column <= high)
+        for suit, (low, high) in self.length:
+            column = columns['type'][:, self.position, suit]
+            match &= (low <= column) & (column <= high)
+        if self.isFlat is not None:
+            match &= columns['isFlat'][:, self.position] == self.isFlat
+        return match
+
+    def __str__(self):
+        terms = [F"{low}-{high} {name}" for name, (low, high) in self.ranges]
+        terms += [F"{low}-{high} {Bridge.Suit.get(suit)}" for suit, (low, high) in self.length]
+        if self.isFlat is not None:
+            terms.append('flat' if self.isFlat else 'not flat')
+        return F"{Bridge.Position.get(self.position)}: {', '.join(terms)}"
+
+# ---------------------------------------------------------------------------------------
+
+_work = None # the chunk parameters within a worker process
+
+def _init(predicates, fixed, seed, size):
+    global _work
+    _work = (predicates, fixed, seed, size)
+
+def _chunk(number):
+    """ Deals one chunk and returns the number of deals and the accepted deal numbers."""
+    predicates, fixed, seed, size = _work
+    rng = np.random.default_rng(random.Random(F"{seed}:{number}").getrandbits(128))
+    seats = np.empty((size, len(Bridge.CARDS)), dtype=np.uint8)
+    for position, cards in enumerate(fixed):
+        seats[:, cards] = position
+    unknown = np.array([card for card in Bridge.CARDS if not any(card in cards for cards in fixed)], dtype=np.intp)
+    missing = np.repeat(np.arange(len(fixed), dtype=np.uint8), [len(Bridge.RANKS) - len(cards) for cards in fixed])
+    shuffled = unknown[np.argsort(rng.random((size, len(unknown))), axis=1)]
+    np.put_along_axis(seats, shuffled, missing[np.newaxis, :], axis=1)
+    match = np.ones(size, dtype=bool)
+    constraints = [predicate for predicate in predicates if isinstance(predicate, Constraint)]
+    if constraints:
+        columns = RatingBatch.rateSeats(seats)
+        for constraint in constraints:
+            match &= constraint.select(columns)
+    others = [predicate for predicate in predicates if not isinstance(predicate, Constraint)]
+    if others:
+        for row in np.flatnonzero(match):
+            hands = [Bridge.Hand(cards=np.flatnonzero(seats[row] == position).tolist())
+                     for position in range(len(fixed))]
+            match[row] = all(predicate(hands) for predicate in others)
+    return size, SquashedBatch.toInt(SquashedBatch.index52_13(seats[match]))
+
+class DealGenerator:
+    """ Generates deal numbers (SquashedOrder) of random deals matching all predicates.
+    A predicate is a picklable callable taking the 4 hands (in the order of Positions),
+    e.g. a Constraint. fixed maps positions to cards they are known to hold.
+    processes = 0 deals within the calling process.
+    """
+    def __init__(self, predicates=(), fixed=None, seed=0, processes=None, chunk=1000):
+        self.predicates = list(predicates)
+        self.fixed = [list((fixed or {}).get(position, [])) for position in Bridge.Positions]
+        cards = [card for cards in self.fixed for card in cards]
+        assert len(cards) == len(set(cards)) and all(card in Bridge.CARDS for card in cards)
+        assert all(len(cards) <= len(Bridge.RANKS) for cards in self.fixed)
+        low, high = [0] * len(self.fixed), [40] * len(self.fixed)
+        for constraint in self.predicates:
+            if isinstance(constraint, Constraint):
+                for name, (first, last) in constraint.ranges:
+                    if name == 'hcp':
+                        low[constraint.position] = max(low[constraint.position], first)
+                        high[constraint.position] = min(high[constraint.position], last)
+        if sum(low) > 40 or sum(high) < 40 or any(first > last for first, last in zip(low, high)):
+            raise ValueError(F"no deal matches the hcp ranges {list(zip(low, high))}")
+        self.seed = seed
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.chunk = chunk
+        self.dealt = 0
+        self.accepted = 0
+
+    def _args(self):
+        return (self.predicates, self.fixed, self.seed, self.chunk)
+
+    def _chunks(self):
+        """ Yields the results of the chunks 0, 1, 2, ... in order."""
+        if self.processes < 1:
+            _init(*self._args())
+            number = 0
+            while True:
+                yield _chunk(number)
+                number += 1
+        with multiprocessing.Pool(self.processes, _init, self._args()) as pool:
+            pending = collections.deque()
+            number = 0
+            while True:
+                while len(pending) < 2 * self.processes:
+                    pending.append(pool.apply_async(_chunk, (number,)))
+                    number += 1
+                yield pending.popleft().get()
+
+    def deals(self, count, attempts=ATTEMPTS):
+        """ Yields count deal numbers.
+        Dealing stops after attempts * count deals, with fewer deal numbers,
+        and raises ValueError if none of them matches the predicates.
+        """
+        if count <= 0: return
+        chunks = self._chunks()
+        limit, total, found = attempts * count, 0, 0
+        try:
+            for dealt, accepted in chunks:
+                self.dealt += dealt
+                total += dealt
+                for index in accepted:
+                    self.accepted += 1
+                    found += 1
+                    yield index
+                    if found == count: return
+                if total >= limit:
+                    if not found:
+                        raise ValueError(F"no deal of {total} matches the predicates")
+                    return
+        finally:
+            chunks.close()
+
+    def boards(self, count, first=1, attempts=ATTEMPTS):
+        """ Yields count boards numbered from first."""
+        for id, index in enumerate(self.deals(count, attempts), start=first):
+            yield Bridge.Board(id, index)
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+
+    strong = Constraint(Bridge.NORTH, hcp=(15, 17), isFlat=True)
+    spades = Constraint(Bridge.SOUTH, hcp=(5, 9), length={Bridge.SPADES: (5, 13)})
+    print(strong)
+    print(spades)
+
+    start = time.perf_counter()
+    generator = DealGenerator([strong, spades], seed=42)
+    deals = list(generator.deals(200))
+    print(F"{len(deals)} deals, {generator.dealt} dealt, {time.perf_counter() - start:.1f}s")
+    assert deals == list(DealGenerator([strong, spades], seed=42, processes=1).deals(200))
+
+    # the constraints on the columns of a chunk select the same deals as on the hands
+    seats = SquashedBatch.seq52_13(SquashedBatch.sample(2000, seed=3))
+    columns = RatingBatch.rateSeats(seats)
+    for constraint in [strong, spades, Constraint(Bridge.EAST, loser=(5, 7), ds=(1, 3), dp=0)]:
+        hands = [ [Bridge.Hand(cards=np.flatnonzero(row == position).tolist()) for position in range(4)]
+                  for row in seats ]
+        assert constraint.select(columns).tolist() == [constraint(deal) for deal in hands]
+    # other predicates get the hands of the deals matching the constraints
+    east = lambda hands: hands[Bridge.EAST.index].rating.hcp >= 10
+    for board in DealGenerator([east, strong], seed=2, processes=0).boards(5):
+        hands = [board[position] for position in Bridge.Positions]
+        assert east(hands) and strong(hands)
+
+    fixed = {Bridge.NORTH: [Bridge.Card.card(Bridge.SPADES, Bridge.ACE)]}
+    for board in DealGenerator([strong], fixed=fixed, seed=1, processes=0).boards(2):
+        print(board)
+        print()
+        assert Bridge.ACE in board[Bridge.NORTH][Bridge.SPADES]
+
+    # impossible constraints raise instead of dealing forever
+    for predicates in ( [Constraint(Bridge.NORTH, hcp=(21, 37)), Constraint(Bridge.SOUTH, hcp=(20, 37))],
+                        [lambda hands: hands[Bridge.NORTH.index].rating.hcp > 37] ):
+        try:
+            list(DealGenerator(predicates, processes=0).deals(5, 10))
+            assert False
+        except ValueError as error:
+            print(error)
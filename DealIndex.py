@@ -0,0 +1,206 @@
+"""
+DealIndex module
+implements an on-disk hash table of deal numbers (SquashedOrder) with a value per deal
+
+A file has a header of 64 bytes followed by 2^bits slots:
+  deal   12 bytes  deal number (SquashedBatch.DEAL), hi = EMPTY for a free slot
+  value   4 bytes  e.g. the record of the first deal in an archive
+The table uses open addressing with linear probing; batches of deals are
+inserted and looked up together, one probe step for all pending deals at a time.
+The file is mapped into memory.
+
+Combined with Canonical, the index finds equivalent deals across archives:
+dedupe() assigns every record of an archive the first record of its class.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import math
+import os
+import numpy as np
+
+import Canonical
+import SquashedBatch
+from DealArchive import ArchiveError
+
+MAGIC = b'BRDI'
+VERSION = 1
+
+HEADER = np.dtype([ ('magic', 'S4'), ('version', '<u2'), ('bits', '<u2'),
+                    ('count', '<u8'), ('reserved', 'V48') ])
+SLOT = np.dtype([('deal', SquashedBatch.DEAL), ('value', '<u4')])
+
+EMPTY = np.uint32(0xFFFFFFFF) # hi of a free slot, deal numbers are below 2^96
+LOAD = 0.75                   # the highest fill ratio
+
+_FIBONACCI = np.uint64(0x9E3779B97F4A7C15)
+
+class DealIndex:
+    """ A hash table of deal numbers in a file.
+    index = DealIndex.create(path, capacity); values, new = index.insert(deals, values)
+    """
+    def __init__(self, path, mode='r'):
+        size = os.path.getsize(path)
+        if size < HEADER.itemsize:
+            raise ArchiveError(F"{path}: no deal index")
+        self.header = np.memmap(path, dtype=HEADER, mode=mode, shape=(1,))
+        header = self.header[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ArchiveError(F"{path}: no deal index of version {VERSION}")
+        self.bits = int(header['bits'])
+        if HEADER.itemsize + (SLOT.itemsize << self.bits) > size:
+            raise ArchiveError(F"{path}: truncated, {1 << self.bits} slots expected")
+        self.slots = np.memmap(path, dtype=SLOT, mode=mode, offset=HEADER.itemsize, shape=(1 << self.bits,))
+
+    @staticmethod
+    def create(path, capacity):
+        """ Creates an empty index for capacity deals."""
+        bits = max(4, math.ceil(math.log2(capacity / LOAD)))
+        header = np.zeros((), dtype=HEADER)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['bits'] = bits
+        with open(path, 'wb') as file:
+            file.write(header.tobytes())
+            file.truncate(HEADER.itemsize + (SLOT.itemsize << bits))
+        slots = np.memmap(path, dtype=SLOT, mode='r+', offset=HEADER.itemsize, shape=(1 << bits,))
+        for start in range(0, len(slots), 1 << 20):
+            slots['deal']['hi'][start:start + (1 << 20)] = EMPTY
+        slots.flush()
+        del slots
+        return DealIndex(path, 'r+')
+
+    def __len__(self):
+        return int(self.header[0]['count'])
+
+    @property
+    def capacity(self):
+        return int(LOAD * (1 << self.bits))
+
+    def flush(self):
+        self.slots.flush()
+        self.header.flush()
+
+    def _slot(self, deals):
+        lo, hi = deals['lo'], deals['hi'].astype(np.uint64)
+        return ((lo ^ (hi << np.uint64(32)) ^ hi) * _FIBONACCI) >> np.uint64(64 - self.bits)
+
+    def _probe(self, deals, claim):
+        """ The slots of the deals, -1 if not found (claim: free slots are taken)."""
+        slots = self.slots
+        mask = np.uint64((1 << self.bits) - 1)
+        slot = self._slot(deals)
+        found = np.full(len(deals), -1, dtype=np.int64)
+        pending = np.arange(len(deals))
+        while len(pending):
+            at = slot[pending].astype(np.int64)
+            current = slots['deal'][at]
+            key = deals[pending]
+            equal = (current['lo'] == key['lo']) & (current['hi'] == key['hi'])
+            found[pending[equal]] = at[equal]
+            free = ~equal & (current['hi'] == EMPTY)
+            if claim and free.any(): # the first deal of a slot takes it, the others probe on
+                _, first = np.unique(at[free], return_index=True)
+                taking = np.flatnonzero(free)[first]
+                slots['deal'][at[taking]] = key[taking]
+                found[pending[taking]] = -2 - at[taking] # new
+                equal[taking] = True
+                free[:] = False # the others see the slot taken in the next step
+            done = equal | free
+            moved = ~done & (current['hi'] != EMPTY)
+            slot[pending[moved]] = (slot[pending[moved]] + np.uint64(1)) & mask
+            pending = pending[~done]
+        return found
+
+    def insert(self, deals, values):
+        """ Inserts deals (DEAL array) with values, deals already in the index keep their value.
+        Returns the values of the deals in the index and which deals were new.
+        """
+        values = np.asarray(values, dtype=np.uint32)
+        if len(self) + len(deals) > self.capacity: # count the deals not yet in the index
+            unique = len(np.unique(deals[self._probe(deals, claim=False) < 0]))
+            if len(self) + unique > self.capacity:
+                raise ArchiveError(F"index full: {len(self)} + {unique} new deals > {self.capacity}")
+        found = self._probe(deals, claim=True)
+        new = found <= -2
+        at = np.where(new, -2 - found, found)
+        # duplicates within the batch: the first occurrence sets the value
+        order = np.flatnonzero(new)
+        self.slots['value'][at[order]] = values[order]
+        self.header['count'] += len(order)
+        return self.slots['value'][at], new
+
+    def lookup(self, deals):
+        """ The values of deals (DEAL array) and which deals were found."""
+        found = self._probe(deals, claim=False)
+        known = found >= 0
+        return np.where(known, self.slots['value'][np.maximum(found, 0)], 0).astype(np.uint32), known
+
+    def __contains__(self, index):
+        return bool(self.lookup(SquashedBatch.fromInt([index]))[1][0])
+
+# ---------------------------------------------------------------------------------------
+
+def dedupe(archive, path, group=Canonical.CLASSES, chunk=100000):
+    """ Indexes the canonical deals of an archive (DealArchive) in a new index at path.
+    Returns the first record of the class of every record.
+    """
+    index = DealIndex.create(path, len(archive))
+    first = np.empty(len(archive), dtype=np.uint32)
+    for start in range(0, len(archive), chunk):
+        deals = np.asarray(archive.column('deal')[start:start + chunk])
+        canonical, _ = Canonical.canonicalBatch(deals, group)
+        first[start:start + len(deals)], _ = index.insert(canonical, np.arange(start, start + len(deals)))
+    index.flush()
+    return first
+
+# ============================================================================
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'deals.brdi')
+    count = 1000000
+    deals = SquashedBatch.sample(count, seed=0)
+    deals[count // 2:count // 2 + 1000] = deals[:1000] # duplicates
+
+    start = time.perf_counter()
+    index = DealIndex.create(path, count)
+    values, new = index.insert(deals, np.arange(count))
+    print(F"insert: {count / (time.perf_counter() - start):10.0f} deals/s, {len(index)} deals")
+    assert len(index) == count - 1000 and not new[count // 2:count // 2 + 1000].any()
+    assert (values[count // 2:count // 2 + 1000] == np.arange(1000)).all()
+
+    del index
+    index = DealIndex(path)
+    start = time.perf_counter()
+    values, known = index.lookup(deals)
+    print(F"lookup: {count / (time.perf_counter() - start):10.0f} deals/s")
+    assert known.all()
+    assert SquashedBatch.toInt(deals[5:6])[0] in index and 12345 not in index
+
+    import DealArchive
+    archive = os.path.join(folder, 'deals.brda')
+    rotated = Canonical.apply(SquashedBatch.seq52_13(deals[:1000]), Canonical.CLASSES[5])
+    DealArchive.write(archive, np.concatenate([deals[:10000], SquashedBatch.index52_13(rotated)]))
+    first = dedupe(DealArchive.DealArchive(archive), os.path.join(folder, 'canonical.brdi'))
+    assert (first[10000:] == np.arange(1000)).all()
+    print(F"dedupe: {len(np.unique(first))} classes in {len(first)} records")
+    # a full index takes the deals it already holds, but no new deals
+    small = DealIndex.create(os.path.join(folder, 'small.brdi'), 12)
+    small.insert(deals[:small.capacity], np.arange(small.capacity))
+    values, new = small.insert(deals[:small.capacity], np.zeros(small.capacity))
+    assert not new.any() and (values == np.arange(small.capacity)).all()
+    try:
+        small.insert(deals[:small.capacity + 1], np.zeros(small.capacity + 1))
+        assert False
+    except ArchiveError as error:
+        print(error)
+    del small
+    del index
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
@@ -0,0 +1,248 @@
+"""
+DealStore module
+implements an in-memory columnar table of deals with their ratings and types (numpy)
+
+The store keeps the deal numbers (SquashedBatch.DEAL), the board ids and per
+position the columns of Rating and Type (RatingBatch), e.g. hcp[deal, position].
+Queries are numpy expressions over the columns of a position or of a
+partnership, combined with &, | and ~:
+
+    ns = store.select(NS)
+    strong = (ns.hcp >= 25) & (ns.fit >= 8)
+    store.frequency(strong)
+    store.groupBy(ns.hcp, where=ns.fit >= 8)
+    store.groupBy((store.select(NORTH).hcp, store.select(SOUTH).hcp), value=ns.loser, aggregate='mean')
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import numpy as np
+
+import Bridge
+import DealArchive
+import RatingBatch
+import SquashedBatch
+
+COLUMNS = ('hcp', 'loser', 'ds', 'adjust', 'dp', 'type', 'isFlat')
+
+# the column types of DealArchive
+_DTYPES = { name: DealArchive.record(DealArchive.RATING)[name].base for name in COLUMNS }
+
+CHUNK = 100000 # deals rated at once
+
+AGGREGATES = { 'count': None, 'sum': np.add, 'min': np.minimum, 'max': np.maximum, 'mean': np.add }
+
+# ---------------------------------------------------------------------------------------
+
+class Selection:
+    """ The columns of one position or of a partnership (the sums as Rating.__add__,
+    isFlat if both hands are flat, type as the sums of the suit lengths, fit the longest suit).
+    """
+    def __init__(self, store, who):
+        self._store = store
+        self._who = who
+        self._positions = ( [who.index] if isinstance(who, Bridge.Position)
+                            else [position.index for position in who.positions] )
+
+    def _column(self, name):
+        column = self._store.columns[name]
+        if len(self._positions) == 1:
+            return column[:, self._positions[0]]
+        first, second = (column[:, position] for position in self._positions)
+        if name == 'isFlat':
+            return first & second
+        if name == 'ds':
+            return first.astype(np.float32) + second
+        return first + second # the sums fit into the column types
+
+    def __getattr__(self, name):
+        if name not in COLUMNS:
+            raise AttributeError(name)
+        return self._column(name)
+
+    def length(self, suit):
+        """ The length of suit."""
+        return self.type[:, suit.index]
+
+    @property
+    def fit(self):
+        """ The longest suit."""
+        return self.type.max(axis=1)
+
+    @property
+    def shape(self):
+        """ The suit lengths, descending."""
+        return -np.sort(-self.type, axis=1)
+
+# ---------------------------------------------------------------------------------------
+
+class DealStore:
+    """ A columnar table of deals, the columns are numpy arrays with one row per deal.
+    """
+    def __init__(self, columns=None):
+        self.columns = columns or { 'deal':  np.zeros(0, dtype=SquashedBatch.DEAL),
+                                    'board': np.zeros(0, dtype=np.uint32) }
+        for name in COLUMNS:
+            if name not in self.columns:
+                shape = (0, len(Bridge.Positions)) + ((len(Bridge.Suits),) if name == 'type' else ())
+                self.columns[name] = np.zeros(shape, dtype=_DTYPES[name])
+
+    def __len__(self):
+        return len(self.columns['deal'])
+
+    def __getitem__(self, number):
+        """ The board of row number."""
+        return Bridge.Board(int(self.columns['board'][number]), self.index(number))
+
+    @staticmethod
+    def fromDeals(deals, boards=None):
+        """ A store of an array of DEAL records, rated in chunks."""
+        deals = np.asarray(deals, dtype=SquashedBatch.DEAL).reshape(-1)
+        columns = { 'deal': deals.copy(),
+                    'board': np.zeros(len(deals), dtype=np.uint32) if boards is None
+                             else np.asarray(boards, dtype=np.uint32) }
+        for name in COLUMNS:
+            shape = (len(deals), len(Bridge.Positions)) + ((len(Bridge.Suits),) if name == 'type' else ())
+            columns[name] = np.empty(shape, dtype=_DTYPES[name])
+        for start in range(0, len(deals), CHUNK):
+            rating = RatingBatch.rateSeats(SquashedBatch.seq52_13(deals[start:start + CHUNK]))
+            for name in COLUMNS:
+                columns[name][start:start + CHUNK] = rating[name]
+        return DealStore(columns)
+
+    @staticmethod
+    def fromArchive(archive):
+        """ A store of a DealArchive, the columns of an archive with rating are copied."""
+        if not archive.hasRating:
+            return DealStore.fromDeals(archive.column('deal'), archive.column('board'))
+        return DealStore({ name: np.array(archive.column(name))
+                           for name in ('deal', 'board') + COLUMNS })
+
+    @staticmethod
+    def fromBoards(boards):
+        """ A store of complete boards."""
+        return DealStore.fromDeals(SquashedBatch.fromInt([board.index for board in boards]),
+                                   [int(board.id) for board in boards])
+
+    def append(self, other):
+        """ Appends the rows of another store."""
+        for name in self.columns:
+            self.columns[name] = np.concatenate([self.columns[name], other.columns[name]])
+
+    def index(self, number):
+        """ The deal number of row number."""
+        deal = self.columns['deal'][number]
+        return int(deal['hi']) << 64 | int(deal['lo'])
+
+    # -- queries
+
+    def select(self, who):
+        """ The columns of a position or of a partnership (Direction)."""
+        return Selection(self, who)
+
+    def count(self, where=None):
+        """ The number of deals matching where (a boolean column)."""
+        return len(self) if where is None else int(np.count_nonzero(where))
+
+    def frequency(self, where):
+        """ The share of the deals matching where."""
+        return self.count(where) / len(self) if len(self) else 0.0
+
+    def rows(self, where):
+        """ The row numbers matching where."""
+        return np.flatnonzero(where)
+
+    def boards(self, where, limit=None):
+        """ Yields the boards matching where (at most limit)."""
+        for number in self.rows(where)[:limit]:
+            yield self[number]
+
+    def groupBy(self, keys, value=None, aggregate='count', where=None):
+        """ Groups the deals (matching where) by keys (a column or a tuple of columns)
+        and aggregates value (count, sum, min, max, mean) per group.
+        Returns a dictionary key -> aggregate, keys are tuples for several columns.
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError(F"unknown aggregate {aggregate}")
+        if value is None and aggregate != 'count':
+            raise ValueError(F"value required for {aggregate}")
+        several = isinstance(keys, tuple)
+        columns = [np.asarray(key) for key in (keys if several else (keys,))]
+        if where is not None:
+            columns = [column[where] for column in columns]
+            value = None if value is None else np.asarray(value)[where]
+        if not len(columns[0]): return {}
+        if all(column.dtype.kind in 'biu' for column in columns):
+            # integer keys: counted by bincount of a mixed radix code of the keys
+            lows = [int(column.min()) for column in columns]
+            sizes = [int(column.max()) - low + 1 for column, low in zip(columns, lows)]
+            code = np.zeros(len(columns[0]), dtype=np.int64)
+            for column, low, size in zip(columns, lows, sizes):
+                code = code * size + (column.astype(np.int64) - low)
+            counts = np.bincount(code)
+            inverse, used = code, np.flatnonzero(counts) # the groups are the used codes
+            codes = used
+            groups = []
+            for column, low, size in reversed(list(zip(columns, lows, sizes))):
+                codes, digit = np.divmod(codes, size)
+                groups.insert(0, (digit + low).astype(column.dtype))
+        else:
+            keys = np.stack(columns, axis=1) if several else columns[0]
+            unique, inverse = np.unique(keys, axis=0 if several else None, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            counts = np.bincount(inverse, minlength=len(unique))
+            used = slice(None)
+            groups = list(unique.T) if several else [unique]
+        if aggregate == 'count':
+            result = counts[used]
+        else:
+            value = np.asarray(value, dtype=np.float64)
+            if aggregate in ('sum', 'mean'):
+                result = np.bincount(inverse, weights=value, minlength=len(counts))[used]
+                if aggregate == 'mean': result = result / counts[used]
+            else:
+                ufunc = AGGREGATES[aggregate]
+                result = np.full(len(counts), np.inf if ufunc is np.minimum else -np.inf)
+                ufunc.at(result, inverse, value)
+                result = result[used]
+        names = list(zip(*(group.tolist() for group in groups))) if several else groups[0].tolist()
+        return dict(zip(names, result.tolist()))
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+
+    count = 1000000
+    start = time.perf_counter()
+    store = DealStore.fromDeals(SquashedBatch.sample(count, seed=0))
+    print(F"build: {count / (time.perf_counter() - start):10.0f} deals/s")
+
+    start = time.perf_counter()
+    ns = store.select(Bridge.NS)
+    north, south = store.select(Bridge.NORTH), store.select(Bridge.SOUTH)
+    fit44 = ( (north.length(Bridge.HEARTS) == 4) & (south.length(Bridge.HEARTS) == 4)
+            | (north.length(Bridge.SPADES) == 4) & (south.length(Bridge.SPADES) == 4) )
+    strong = (ns.hcp >= 25) & (ns.fit >= 8)
+    print(F"N/S 25+ hcp and an 8+ fit: {store.frequency(strong):.4f}, 4-4 major fit: {store.frequency(fit44):.4f}")
+    byHcp = store.groupBy(ns.hcp, value=ns.loser, aggregate='mean', where=ns.fit >= 8)
+    print(F"query: {time.perf_counter() - start:.3f}s")
+    for hcp in range(20, 31, 2):
+        print(F"{hcp} hcp with a fit: {byHcp[hcp]:.2f} loser")
+
+    for number in store.rows(strong)[:100]:
+        board = store[number]
+        rating = board.rating(Bridge.NS)
+        assert rating.hcp == ns.hcp[number] and rating.loser == ns.loser[number]
+        assert max(board.type(Bridge.NS).type) == ns.fit[number]
+    assert store.groupBy((ns.isFlat, ns.fit >= 8))[(True, True)] == store.count(ns.isFlat & (ns.fit >= 8))
+    assert sum(store.groupBy(ns.ds).values()) == len(store)
+    try:
+        store.groupBy(ns.hcp, aggregate='sum')
+        assert False
+    except ValueError as error:
+        print(error)
+    bySeats = store.groupBy((north.hcp, south.hcp), value=ns.hcp, aggregate='max')
+    assert all(max(key) <= sum(key) == value for key, value in bySeats.items())
@@ -0,0 +1,472 @@
+"""
+DoubleDummy module
+computes the tricks of all contracts with all cards known (double dummy)
+
+The search answers "can N/S take at least n more tricks?" with alpha-beta
+on the cards of a trick. Positions at the start of a trick are stored with
+the bound found for them in a transposition table (partition search):
+besides the leader and the suit lengths of the hands, an entry only keeps
+the owners of the relevant top cards per suit - the cards which won a trick
+by rank somewhere in the proof. Cards are compared by their rank among the
+remaining cards of the suit (relative ranks), so the entry holds for every
+position with the same lengths and the same owners of these top cards.
+Cards in sequence (no other remaining card between them) are equivalent and
+only one of them is tried; the moves are tried in a plausible order.
+After a card failed, the other cards of its suit below the lowest relevant card
+of that proof fail as well and are skipped. Before a trick is played, the top
+tricks the side on lead can cash and the trumps above all trumps of the
+opponents bound the result. table shares the transposition table between its
+20 searches: a position without trumps left is the same in every denomination.
+
+Hands are 52 bit masks (Bridge.Hand.bits), players are Position indices (N, E, S, W).
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import multiprocessing
+
+import Bridge
+import SquashedOrder
+
+_RANKS = len(Bridge.RANKS)
+_SUIT = (1 << _RANKS) - 1
+
+def _bits(mask):
+    return bin(mask).count('1')
+
+def _equivalent(card, other, relevant):
+    """ Whether card and other (of the same hand) are of the same suit and below all
+    relevant cards of the suit: playing one or the other leads to the same result.
+    """
+    suit = card // _RANKS
+    if suit != other // _RANKS: return False
+    shift = suit * _RANKS
+    lowest = (relevant >> shift) & _SUIT
+    lowest &= -lowest
+    return not lowest or (lowest >> (card - shift) > 1 and lowest >> (other - shift) > 1)
+
+class Solver:
+    """ A solver for the hands (52 bit masks of the Positions) and a trump suit (index, None = NT).
+    The transposition table is kept between the calls; solvers of the same hands in other
+    denominations may share it (tt), positions without trumps left are stored as NT positions.
+    """
+    def __init__(self, hands, trump=None, tt=None):
+        self.hands = list(hands)
+        assert len({_bits(hand) for hand in self.hands}) == 1
+        self.trump = trump
+        self.tt = {} if tt is None else tt  # (trump, leader, lengths) -> lower bounds, upper bounds
+        self._suits = {}    # suit of the 4 hands -> owners in rank order, lengths
+        self._tops = {}     # (cards, count) -> highest count cards
+        self._runs = {}     # representatives of the cards in sequence
+        self._trick = 0     # cards played to the current trick
+        self._left = _bits(self.hands[0])
+        self.nodes = 0
+
+    @property
+    def left(self): # tricks to play
+        return self._left
+
+    # -----------------------------------------------------------------------------------
+
+    def tricks(self, leader, guess=None):
+        """ The number of tricks N/S take with leader to lead.
+        With a guess (e.g. the tricks with another leader) the search steps from the guess
+        towards the result, else it bisects.
+        """
+        low, high = 0, self._left
+        if guess is not None:
+            need = min(max(guess, 1), high)
+        while low < high: # can N/S take more than low tricks?
+            if guess is None:
+                need = (low + high + 1) // 2
+            if self._search(leader, need)[0]:
+                low = need
+                need += 1
+            else:
+                high = need - 1
+                need -= 1
+        return low
+
+    # -----------------------------------------------------------------------------------
+
+    def _position(self):
+        """ The owners of the remaining cards per suit (string, highest first)
+        and the suit lengths of the hands.
+        """
+        hands = self.hands
+        owners, lengths = [], []
+        for shift in range(0, 4 * _RANKS, _RANKS):
+            suit = ( (hands[0] >> shift) & _SUIT, (hands[1] >> shift) & _SUIT,
+                     (hands[2] >> shift) & _SUIT, (hands[3] >> shift) & _SUIT )
+            entry = self._suits.get(suit)
+            if entry is None:
+                entry = ( ''.join( str(player) for rank in range(_RANKS - 1, -1, -1)
+                                   for player in range(4) if suit[player] >> rank & 1 ),
+                          tuple(_bits(cards) for cards in suit) )
+                self._suits[suit] = entry
+            owners.append(entry[0])
+            lengths.append(entry[1])
+        return owners, tuple(lengths)
+
+    def _top(self, cards, count):
+        """ The count highest cards of a suit."""
+        top = self._tops.get((cards, count))
+        if top is None:
+            top, rest = 0, cards
+            for _ in range(count):
+                high = 1 << (rest.bit_length() - 1)
+                top |= high
+                rest ^= high
+            self._tops[(cards, count)] = top
+        return top
+
+    def _relevant(self, prefixes):
+        """ The cards of the top cards given by prefixes (owners per suit)."""
+        hands = self.hands
+        remaining = hands[0] | hands[1] | hands[2] | hands[3]
+        relevant = 0
+        for suit, prefix in enumerate(prefixes):
+            if prefix:
+                shift = suit * _RANKS
+                relevant |= self._top((remaining >> shift) & _SUIT, len(prefix)) << shift
+        return relevant
+
+    def _prefixes(self, relevant, owners):
+        """ The owners of the top cards down to the lowest relevant card per suit."""
+        hands = self.hands
+        remaining = hands[0] | hands[1] | hands[2] | hands[3]
+        prefixes = []
+        for suit in range(4):
+            shift = suit * _RANKS
+            cards = (relevant >> shift) & _SUIT
+            if cards:
+                lowest = (cards & -cards).bit_length() - 1
+                cards = _bits(((remaining >> shift) & _SUIT) >> lowest)
+            prefixes.append(owners[suit][:cards])
+        return tuple(prefixes)
+
+    def _store(self, key, lower, bound, relevant, owners):
+        entry = self.tt.get(key)
+        if entry is None:
+            entry = self.tt[key] = ([], [])
+        entry[0 if lower else 1].append((bound, self._prefixes(relevant, owners)))
+
+    def _cash(self, player):
+        """ Tricks player can cash with top cards from his own hand when on lead,
+        these cards and the suits in which they are cashed.
+        """
+        hands = self.hands
+        trump = self.trump
+        mine = hands[player]
+        left, right = hands[(player + 1) & 3], hands[(player + 3) & 3]
+        others = left | right | hands[(player + 2) & 3]
+        ruffers = [] # the opponents holding trumps
+        if trump is not None:
+            ruffers = [ opponent for opponent in (left, right)
+                        if (opponent >> (trump * _RANKS)) & _SUIT ]
+        tricks, relevant, suits = 0, 0, 0
+        for suit in range(4):
+            shift = suit * _RANKS
+            cards = (mine >> shift) & _SUIT
+            if not cards: continue
+            top = ((others >> shift) & _SUIT).bit_length() # ranks above all other cards
+            count = _bits(cards >> top)
+            if ruffers and suit != trump:
+                count = min([count] + [_bits((opponent >> shift) & _SUIT) for opponent in ruffers])
+            if count:
+                tricks += count
+                relevant |= self._top(cards, count) << shift
+                suits |= 1 << suit
+        return tricks, relevant, suits
+
+    def _quick(self, leader):
+        """ Tricks the leader's side can cash with top cards, either from the leader's hand
+        or from partner's hand after a lead to one of partner's top cards; and these cards.
+        """
+        tricks, relevant, _ = self._cash(leader)
+        partner = (leader + 2) & 3
+        other, cards, suits = self._cash(partner)
+        if other > tricks:
+            mine = self.hands[leader]
+            for suit in range(4): # an entry: a suit partner cashes and leader holds
+                if suits >> suit & 1 and (mine >> (suit * _RANKS)) & _SUIT:
+                    return other, cards
+        return tricks, relevant
+
+    def _trumps(self):
+        """ Tricks of N/S and E/W with the trumps of one hand above all trumps of the opponents
+        (each wins the trick it is played to), and these trumps.
+        """
+        hands = self.hands
+        shift = self.trump * _RANKS
+        suit = [(hand >> shift) & _SUIT for hand in hands]
+        remaining = suit[0] | suit[1] | suit[2] | suit[3]
+        if not remaining: return 0, 0, 0
+        top = remaining.bit_length() - 1
+        side = 0 if (suit[0] | suit[2]) >> top else 1
+        others = (suit[side ^ 1] | suit[side ^ 3]).bit_length() # ranks above the opponents' trumps
+        count, holder = max((_bits(suit[side] >> others), side), (_bits(suit[side + 2] >> others), side + 2))
+        tricks = [0, 0]
+        tricks[side] = count
+        return tricks[0], tricks[1], self._top(suit[holder], count) << shift
+
+    def _search(self, leader, need):
+        """ Can N/S take need more tricks, leader to lead to a new trick?
+        Returns the answer and the relevant cards.
+        """
+        if need <= 0: return True, 0
+        left = self._left
+        if need > left: return False, 0
+        self.nodes += 1
+        owners, lengths = self._position()
+        trump = self.trump
+        if trump is not None and not any(lengths[trump]):
+            trump = None
+        key = (trump, leader, lengths)
+        entry = self.tt.get(key)
+        if entry is not None:
+            clubs, diamonds, hearts, spades = owners
+            for bound, prefixes in entry[0]:
+                if ( bound >= need and clubs.startswith(prefixes[0]) and diamonds.startswith(prefixes[1])
+                     and hearts.startswith(prefixes[2]) and spades.startswith(prefixes[3]) ):
+                    return True, self._relevant(prefixes)
+            for bound, prefixes in entry[1]:
+                if ( bound < need and clubs.startswith(prefixes[0]) and diamonds.startswith(prefixes[1])
+                     and hearts.startswith(prefixes[2]) and spades.startswith(prefixes[3]) ):
+                    return False, self._relevant(prefixes)
+        if left == 1:
+            tricks, relevant = self._last(leader)
+            self._store(key, True, tricks, relevant, owners)
+            self._store(key, False, tricks, relevant, owners)
+            return tricks >= need, relevant
+        if self.trump is not None:
+            ns, ew, relevant = self._trumps()
+            if ns >= need:
+                self._store(key, True, ns, relevant, owners)
+                return True, relevant
+            if left - ew < need:
+                self._store(key, False, left - ew, relevant, owners)
+                return False, relevant
+        quick, relevant = self._quick(leader)
+        if leader & 1: # E/W lead
+            if left - quick < need:
+                self._store(key, False, left - quick, relevant, owners)
+                return False, relevant
+        elif quick >= need:
+            self._store(key, True, quick, relevant, owners)
+            return True, relevant
+        result, relevant = self._play(0, leader, None, 0, leader, need)
+        self._store(key, result, need if result else need - 1, relevant, owners)
+        return result, relevant
+
+    def _last(self, leader):
+        """ The tricks of N/S in the last trick and the relevant card."""
+        hands = self.hands
+        winner, card = leader, hands[leader].bit_length() - 1
+        cards = hands[leader]
+        for player in ((leader + 1) & 3, (leader + 2) & 3, (leader + 3) & 3):
+            other = hands[player].bit_length() - 1
+            cards |= hands[player]
+            if self._beats(other, card):
+                winner, card = player, other
+        suit = card // _RANKS
+        byRank = ((cards ^ (1 << card)) >> (suit * _RANKS)) & _SUIT
+        return 0 if winner & 1 else 1, (1 << card) if byRank else 0
+
+    def _beats(self, card, winner):
+        suit, other = card // _RANKS, winner // _RANKS
+        if suit == other:
+            return card > winner
+        return suit == self.trump
+
+    def _sequences(self, cards, others):
+        """ The lowest rank of every sequence of cards within others, descending."""
+        runs = self._runs.get((cards, others))
+        if runs is None:
+            runs, previous = [], False
+            for rank in range(_RANKS - 1, -1, -1):
+                if not others >> rank & 1: continue
+                if cards >> rank & 1:
+                    if previous: runs[-1] = rank
+                    else: runs.append(rank)
+                    previous = True
+                else:
+                    previous = False
+            self._runs[(cards, others)] = runs
+        return runs
+
+    def _moves(self, count, player, lead, winner, winning):
+        """ The cards to try in order, one card per sequence."""
+        hands = self.hands
+        hand = hands[player]
+        remaining = hands[0] | hands[1] | hands[2] | hands[3] | self._trick
+        trump = self.trump
+        moves = []
+        if not count:
+            partner = hands[(player + 2) & 3]
+            for suit in range(4):
+                shift = suit * _RANKS
+                cards = (hand >> shift) & _SUIT
+                if not cards: continue
+                others = (remaining >> shift) & _SUIT
+                top = others.bit_length() - 1
+                runs = self._sequences(cards, others)
+                for rank in runs:
+                    if cards >> top & 1 and rank == runs[0]: # cash a winner
+                        score = 100 + (10 if suit == trump else 0)
+                    elif (partner >> shift) >> top & 1: # lead to partner's winner
+                        score = 80 - rank
+                    elif ( trump is not None and suit != trump and not (partner >> shift) & _SUIT
+                           and (partner >> (trump * _RANKS)) & _SUIT ): # partner ruffs
+                        score = 60 - rank
+                    else:
+                        score = -rank
+                    moves.append((score, shift + rank))
+        else:
+            shift = lead * _RANKS
+            cards = (hand >> shift) & _SUIT
+            if cards:
+                runs = self._sequences(cards, (remaining >> shift) & _SUIT)
+                if len(runs) == 1: # one way to follow suit
+                    return [shift + runs[0]]
+            suits = [lead] if cards else range(4)
+            partner = (winning & 1) == (player & 1)
+            if count == 2 and partner: # partner only wins if the last player can't beat him
+                last = hands[(player + 1) & 3]
+                cards = (last >> (lead * _RANKS)) & _SUIT
+                if cards:
+                    partner = self._beats(winner, lead * _RANKS + cards.bit_length() - 1)
+                elif trump is not None:
+                    cards = (last >> (trump * _RANKS)) & _SUIT
+                    partner = not cards or self._beats(winner, trump * _RANKS + cards.bit_length() - 1)
+            for suit in suits:
+                shift = suit * _RANKS
+                cards = (hand >> shift) & _SUIT
+                if not cards: continue
+                others = (remaining >> shift) & _SUIT
+                for rank in self._sequences(cards, others):
+                    card = shift + rank
+                    if partner: # partner wins, play low, don't ruff
+                        score = -rank - (50 if suit == trump and suit != lead else 0)
+                    elif self._beats(card, winner): # win as cheap as possible
+                        score = 100 - rank - (20 if suit != lead else 0)
+                        if count == 1 and rank < others.bit_length() - 1:
+                            score -= 60 # second hand low unless it's a winner
+                    else: # play low, keep the trumps
+                        score = -rank - (50 if suit == trump else 0)
+                    moves.append((score, card))
+        moves.sort(reverse=True)
+        return [card for score, card in moves]
+
+    def _play(self, count, player, lead, winner, winning, need):
+        """ Plays the count-th card of the trick (0..3), winner is the card winning so far.
+        Returns the answer and the relevant cards.
+        """
+        hands = self.hands
+        hand = hands[player]
+        ns = not player & 1
+        trump = self.trump
+        relevant = 0
+        tried = [] # the moves which failed and their relevant cards
+        for card in self._moves(count, player, lead, winner, winning):
+            suit = card // _RANKS
+            if tried and any(_equivalent(card, other, cards) for other, cards in tried):
+                continue
+            bit = 1 << card
+            hands[player] = hand ^ bit
+            if not count:
+                lead, best, taker = suit, card, player
+            elif card > winner if suit == winner // _RANKS else suit == trump:
+                best, taker = card, player
+            else:
+                best, taker = winner, winning
+            if count == 3: # trick complete
+                trick = self._trick | bit
+                self._trick = 0
+                self._left -= 1
+                result, cards = self._search(taker, need - (not taker & 1))
+                self._left += 1
+                self._trick = trick ^ bit
+                if ((trick ^ (1 << best)) >> (best // _RANKS * _RANKS)) & _SUIT: # won by rank
+                    cards |= 1 << best
+            else:
+                self._trick |= bit
+                result, cards = self._play(count + 1, (player + 1) & 3, lead, best, taker, need)
+                self._trick ^= bit
+            hands[player] = hand
+            if result == ns: # N/S found a way or E/W found a defense
+                return result, cards
+            relevant |= cards
+            tried.append((card, cards))
+        return not ns, relevant
+
+# ---------------------------------------------------------------------------------------
+
+def _hands(hands):
+    """ 52 bit masks from a Board, a list of Hand or of masks."""
+    if isinstance(hands, Bridge.Board):
+        hands = [hands[position] for position in Bridge.Positions]
+    return [hand.bits if isinstance(hand, Bridge.Hand) else hand for hand in hands]
+
+def tricks(hands, denomination, declarer):
+    """ The tricks declarer takes in denomination."""
+    trump = None if denomination == Bridge.NT else denomination.index
+    solver = Solver(_hands(hands), trump)
+    ns = solver.tricks((declarer.index + 1) & 3)
+    return ns if declarer.direction == Bridge.NS else solver.left - ns
+
+def table(hands):
+    """ The tricks of every declarer in every denomination:
+    table[denomination.index][position.index]
+    """
+    hands = _hands(hands)
+    tt = {} # shared by the 20 searches
+    result = []
+    for denomination in Bridge.Denominations:
+        trump = None if denomination == Bridge.NT else denomination.index
+        solver = Solver(hands, trump, tt)
+        row, ns = [], None
+        for declarer in Bridge.Positions:
+            ns = solver.tricks((declarer.index + 1) & 3, ns)
+            row.append(ns if declarer.direction == Bridge.NS else solver.left - ns)
+        result.append(row)
+    return result
+
+def solve(board):
+    """ Computes and sets board.dd."""
+    board.dd = table(board)
+    return board.dd
+
+def _table(index):
+    sets = SquashedOrder.seq52_13(index)
+    return table([sum(1 << card for card in cards) for cards in sets])
+
+def tables(indices, processes=None, chunksize=1):
+    """ Yields the tables for deal numbers, in order, solved on a pool of processes."""
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(_table, indices, chunksize)
+
+def solveBoards(boards, processes=None):
+    """ Computes and sets dd for boards (with all 4 hands) on a pool of processes."""
+    boards = list(boards)
+    for board, dd in zip(boards, tables([board.index for board in boards], processes)):
+        board.dd = dd
+    return boards
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+
+    board = Bridge.Board(21, 35817416954748550972957151064)
+    for position, hand in board.hands.items():
+        print(F"{position}:  {hand}")
+    start = time.perf_counter()
+    solve(board)
+    print(F"{time.perf_counter() - start:.1f}s")
+    print('   ' + ''.join(F"{position!s:>3}" for position in Bridge.Positions))
+    for denomination, row in zip(Bridge.Denominations, board.dd):
+        print(F"{denomination!s:>3}" + ''.join(F"{tricks:3}" for tricks in row))
+    assert board.dd == [[3, 9, 3, 9], [7, 6, 7, 6], [4, 9, 4, 9], [7, 6, 7, 6], [3, 9, 3, 9]]
@@ -0,0 +1,211 @@
+"""
+Event module
+holds the boards and scores of an event with indexes by pair and by board
+
+Scores are added one at a time, as they arrive. A new score is compared
+with the scores of its board only: their points and the totals of their
+pairs are updated by the difference, so totals, percentages and rankings
+are always current and no query scans the scores.
+
+Points are matchpoints (2 per score beaten, 1 per tie) or cross-IMPs, as Points.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+from Bridge import *
+import Points
+
+class Total:
+    """ The running total of a pair."""
+    __slots__ = ('pair', 'points', 'top', 'boards')
+
+    def __init__(self, pair):
+        self.pair = pair
+        self.points = 0 # matchpoints or IMPs
+        self.top = 0    # the matchpoints possible
+        self.boards = 0
+
+    @property
+    def percent(self):
+        return 100 * self.points / self.top if self.top else 50.0
+
+    def __str__(self):
+        return F"{self.pair!s:>6} {self.points:8.1f} {self.percent:6.2f}% {self.boards:3}"
+
+class Event:
+    """ An event: boards by id, scores by board and by pair, totals by pair.
+    event.addScore(id, score) adds a score and updates all points and totals.
+    """
+    def __init__(self, name='', method=Points.MATCHPOINTS):
+        if method not in (Points.MATCHPOINTS, Points.CROSS_IMPS):
+            raise ValueError(F"method {method!r} can't be computed incrementally")
+        self.name = name
+        self.method = method
+        self.boards = {}   # board id -> Board
+        self._raw = {}     # board id -> score -> matchpoints or IMP sum of N/S
+        self._pairs = {}   # pair -> board id -> Score
+        self._totals = {}  # pair -> Total
+
+    def __len__(self):
+        return len(self.boards)
+
+    def __iter__(self): # the boards in order
+        return iter(sorted(self.boards.values(), key=lambda board: board.id))
+
+    def __contains__(self, pair):
+        return pair in self._pairs
+
+    @property
+    def pairs(self):
+        return sorted(self._pairs)
+
+    def addBoard(self, board):
+        """ Adds a board (with scores)."""
+        if board.id in self.boards:
+            raise KeyError(F"board {board.id} is already in the event")
+        scores = board.clearScores()
+        self.boards[board.id] = board
+        self._raw[board.id] = {}
+        for score in scores:
+            self.addScore(board.id, score)
+        return board
+
+    def board(self, id):
+        """ The board id, a new board without hands if not yet in the event."""
+        board = self.boards.get(id)
+        if board is None:
+            board = self.addBoard(Board(id))
+        return board
+
+    def addScore(self, id, score):
+        """ Adds a score to board id and updates the points of the board and the pairs.
+        Raises KeyError if a pair of the score has already played the board.
+        """
+        board = self.board(id)
+        for pair in score.pairs:
+            if pair is not None and board.playedBy(pair):
+                raise KeyError(F"pair {pair} has already played board {id}")
+        raw = self._raw[id]
+        value = score.value
+        new = 0
+        if self.method == Points.MATCHPOINTS:
+            for other in board.entries:
+                if other.value > value:
+                    raw[other] += 2
+                elif other.value == value:
+                    raw[other] += 1
+                    new += 1
+                else:
+                    new += 2
+        else:
+            for other in board.entries:
+                imps = Points.imp(other.value - value)
+                raw[other] += imps
+                new -= imps
+        board.addScore(score)
+        raw[score] = new
+        score.points = None
+        for pair in score.pairs:
+            if pair is None: continue
+            self._pairs.setdefault(pair, {})[id] = score
+            total = self._totals.get(pair)
+            if total is None:
+                total = self._totals[pair] = Total(pair)
+            total.boards += 1
+        self._update(board)
+
+    def _update(self, board):
+        """ Sets the points of the scores of board and adds the differences to the totals."""
+        scores, raw = board.entries, self._raw[board.id]
+        count = len(scores)
+        top = 2 * (count - 1)
+        for score in scores:
+            if self.method == Points.MATCHPOINTS:
+                points = [raw[score], top - raw[score]]
+            else:
+                ns = raw[score] / (count - 1) if count > 1 else 0
+                points = [ns, -ns]
+            old = score.points or [0, 0]
+            added = 2 if score.points else top # the others gain one comparison, the new score all
+            score.points = points
+            for side, pair in enumerate(score.pairs):
+                total = self._totals.get(pair)
+                if total is None: continue
+                total.points += points[side] - old[side]
+                if self.method == Points.MATCHPOINTS:
+                    total.top += added
+        return board
+
+    # -----------------------------------------------------------------------------------
+
+    def scores(self, pair):
+        """ The scores of pair by board id."""
+        return self._pairs.get(pair, {})
+
+    def total(self, pair):
+        return self._totals[pair]
+
+    def ranking(self, pairs=None):
+        """ The ranks and totals of pairs (default: all), best first, equal totals share a rank."""
+        key = (lambda total: total.percent) if self.method == Points.MATCHPOINTS else (lambda total: total.points)
+        totals = sorted( (self._totals[pair] for pair in (self._totals if pairs is None else pairs)),
+                         key=key, reverse=True )
+        ranking, rank = [], 0
+        for position, total in enumerate(totals, start=1):
+            if not ranking or key(total) != key(ranking[-1][1]):
+                rank = position
+            ranking.append((rank, total))
+        return ranking
+
+    def report(self, pair):
+        """ The lines of the boards played by pair."""
+        lines = [Board.formatHeader()]
+        for id in sorted(self.scores(pair)):
+            lines.append(self.boards[id].formatForPair(pair))
+        return lines
+
+# ============================================================================
+if __name__ == '__main__':
+    import random
+    import time
+
+    rng = random.Random(0)
+    tables, rounds = 100, 26
+    values = [620, 650, 170, 140, -100, -200, 100, 590, 1430, -50, 420, 450]
+    event = Event('Demo')
+    start = time.perf_counter()
+    for round in range(rounds):
+        for table in range(1, tables + 1):
+            ns, ew = table, tables + (table + round) % tables + 1
+            for id in (2 * round + 1, 2 * round + 2):
+                contract = Contract(SOUTH, 4, SPADES)
+                event.addScore(id, Score([ns, ew], contract, 0, rng.choice(values)))
+    print(F"{tables * rounds * 2} scores: {time.perf_counter() - start:.2f}s")
+
+    for board in event: # the same as computing the boards at the end
+        expected = Points.points([score.value for score in board.entries], event.method)
+        assert [score.points for score in board.entries] == expected
+    for pair in event.pairs:
+        total = event.total(pair)
+        assert abs(total.points - sum(score.points[score.pairs.index(pair)] for score in event.scores(pair).values())) < 1e-6
+        assert total.top == sum(2 * (len(event.boards[id].entries) - 1) for id in event.scores(pair))
+    for rank, total in event.ranking()[:5]:
+        print(F"{rank:3}. {total}")
+
+    # the points follow the scores, not their order on the board
+    small = Event('Sorted')
+    for ns, value in [(1, 620), (2, 420), (3, 100)]:
+        small.addScore(1, Score([ns, ns + 10], Contract(SOUTH, 4, SPADES), 0, value))
+    small.boards[1].sortScores()
+    small.addScore(1, Score([4, 14], Contract(SOUTH, 4, SPADES), 0, 450))
+    assert [(score.value, score.points) for score in small.boards[1].scores] == \
+           [(620, [6, 0]), (450, [4, 2]), (420, [2, 4]), (100, [0, 6])]
+    try:
+        small.addScore(1, Score([2, 12], Contract(SOUTH, 4, SPADES), 0, 420))
+        assert False
+    except KeyError as error:
+        print(error)
+    assert small.total(2).boards == 1
@@ -0,0 +1,196 @@
+"""
+Instrument module
+counts the calls and measures the time of the hot paths
+
+Instrumentation is off by default and then costs nothing: enable() replaces
+the functions and methods of TARGETS by wrappers which count the calls and
+the time (total and without the instrumented calls within), disable() puts
+the originals back. The wrappers keep a stack of the instrumented calls, so
+the time can be written in the collapsed stack format of flamegraph.pl:
+
+    Instrument.enable()
+    ... the job ...
+    Instrument.disable()
+    print(Instrument.report())
+    Instrument.dump('job.folded')   # flamegraph.pl job.folded > job.svg
+
+The hit rates of the caches (functools.lru_cache) in CACHES are part of the snapshot.
+Functions imported by name into other modules (from SquashedOrder import choose)
+are not replaced there.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import contextlib
+import functools
+import time
+
+import Bridge
+import SquashedOrder
+
+# (owner, attribute): owner is a module or a class
+TARGETS = [ (SquashedOrder, 'choose'), (SquashedOrder, 'index52_13'), (SquashedOrder, 'seq52_13'),
+            (Bridge, 'decode'),
+            (Bridge.Hand, '__init__'), (Bridge.Rating, '__init__'), (Bridge.Type, '__init__'),
+            (Bridge.Board, 'addHands'), (Bridge.Board, 'index'),
+            (Bridge.Board, '__str__'), (Bridge.Board, 'formatForPair'), (Bridge.Score, '__str__') ]
+
+# name -> the cached function
+CACHES = { 'Bridge.decode': lambda: Bridge.decode }
+
+class Counter:
+    """ The calls and the time of one target."""
+    __slots__ = ('calls', 'total', 'own')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0 # seconds including the instrumented calls within
+        self.own = 0.0   # seconds without them
+
+_counters = {}   # name -> Counter
+_stacks = {}     # stack of names (tuple) -> own seconds
+_stack = []      # the active calls: [name, seconds of the instrumented calls within]
+_originals = {}  # (owner, attribute) -> original
+
+def _name(owner, attribute):
+    return F"{owner.__name__}.{attribute}"
+
+def _wrap(name, function):
+    counter = _counters.setdefault(name, Counter())
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        frame = [name, 0.0]
+        _stack.append(frame)
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = clock() - start
+            _stack.pop()
+            counter.calls += 1
+            counter.total += elapsed
+            own = elapsed - frame[1]
+            counter.own += own
+            if _stack:
+                _stack[-1][1] += elapsed
+            key = tuple(f[0] for f in _stack) + (name,)
+            _stacks[key] = _stacks.get(key, 0.0) + own
+    for method in ('cache_info', 'cache_clear'): # lru_cache
+        if hasattr(function, method):
+            setattr(wrapper, method, getattr(function, method))
+    return wrapper
+
+def enable(targets=None):
+    """ Instruments the targets (default TARGETS), the counters are kept (see reset)."""
+    for owner, attribute in targets or TARGETS:
+        if (owner, attribute) in _originals: continue
+        original = owner.__dict__[attribute]
+        name = _name(owner, attribute)
+        if isinstance(original, property):
+            wrapped = property(_wrap(name, original.fget), original.fset, original.fdel, original.__doc__)
+        else:
+            wrapped = _wrap(name, original)
+        _originals[(owner, attribute)] = original
+        setattr(owner, attribute, wrapped)
+
+def disable():
+    """ Puts the original functions back."""
+    for (owner, attribute), original in _originals.items():
+        setattr(owner, attribute, original)
+    _originals.clear()
+
+def enabled():
+    return bool(_originals)
+
+def reset():
+    """ Clears the counters."""
+    _counters.clear()
+    _stacks.clear()
+
+@contextlib.contextmanager
+def instrumented(targets=None):
+    """ Instruments the targets within a with block."""
+    enable(targets)
+    try:
+        yield
+    finally:
+        disable()
+
+# ---------------------------------------------------------------------------------------
+
+def snapshot():
+    """ The counters and the cache statistics as a dictionary (e.g. for JSON)."""
+    caches = {}
+    for name, cached in CACHES.items():
+        info = cached().cache_info()
+        lookups = info.hits + info.misses
+        caches[name] = { 'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+                         'maxsize': info.maxsize, 'rate': info.hits / lookups if lookups else None }
+    return { 'calls': { name: { 'calls': counter.calls, 'total': counter.total, 'own': counter.own }
+                        for name, counter in _counters.items() if counter.calls },
+             'caches': caches }
+
+def collapsed():
+    """ The own time per stack of instrumented calls in microseconds,
+    one line per stack in the collapsed format of flamegraph.pl.
+    """
+    return '\n'.join(F"{';'.join(stack)} {round(seconds * 1e6)}"
+                     for stack, seconds in sorted(_stacks.items()) if seconds >= 5e-7)
+
+def dump(path):
+    """ Writes the collapsed stacks to path."""
+    with open(path, 'w') as file:
+        file.write(collapsed())
+        file.write('\n')
+
+def report():
+    """ The counters as a table, sorted by own time."""
+    data = snapshot()
+    lines = [F"{'':28} {'calls':>10} {'total s':>10} {'own s':>10} {'us/call':>9}"]
+    for name, c in sorted(data['calls'].items(), key=lambda item: -item[1]['own']):
+        lines.append(F"{name:28} {c['calls']:10} {c['total']:10.3f} {c['own']:10.3f}"
+                     F" {c['total'] / c['calls'] * 1e6:9.1f}")
+    for name, c in data['caches'].items():
+        rate = F"{c['rate']:.1%}" if c['rate'] is not None else '-'
+        lines.append(F"{name:28} {c['hits']:10} hits {c['misses']:10} misses  {rate}")
+    return '\n'.join(lines)
+
+# ============================================================================
+if __name__ == '__main__':
+    import random
+
+    def job(count):
+        rng = random.Random(0)
+        boards = []
+        for id in range(1, count + 1):
+            board = Bridge.Board(id, SquashedOrder.sample(1, rng)[0] if id % 4 else 4)
+            board.addScore(Bridge.Score([1, 2], Bridge.Contract(Bridge.SOUTH, 4, Bridge.SPADES), 0, 420, (1, 1)))
+            boards.append(board)
+        for board in boards:
+            str(board)
+            board.formatForPair(1)
+            [str(score) for score in board.scores]
+            board.index
+
+    Bridge.decode.cache_clear()
+    original = Bridge.Board.__dict__['__str__']
+    start = time.perf_counter()
+    job(2000)
+    plain = time.perf_counter() - start
+
+    Bridge.decode.cache_clear()
+    with instrumented():
+        start = time.perf_counter()
+        job(2000)
+        measured = time.perf_counter() - start
+    assert not enabled() and Bridge.Board.__dict__['__str__'] is original
+    assert snapshot()['calls']['SquashedOrder.seq52_13']['calls'] == snapshot()['caches']['Bridge.decode']['misses']
+    print(report())
+    print()
+    print('\n'.join(collapsed().splitlines()[:8]))
+    print(F"\n{plain:.3f}s plain, {measured:.3f}s instrumented")
@@ -0,0 +1,233 @@
+"""
+Live module
+collects the scores of a running event with asyncio and publishes the standings
+
+Producers (scoring devices, the socket server) submit scores to a queue.
+One consumer checks every score against the scoring rules and adds it to
+the Event, which only updates the board of the score and the totals of the
+pairs. After the queue is drained a snapshot of the standings is published
+to the subscribers, so a burst of scores costs one snapshot.
+
+The socket protocol is one line per score:
+  <board> <pair N/S> <pair E/W> <contract> <declarer> <tricks> <score N/S>
+e.g. '12 3 17 4SX S 9 -100' or '12 3 17 Pass - - 0', answered by 'ok' or 'error <reason>'.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import asyncio
+import time
+
+from Bridge import *
+import Event
+import Pbn
+import Scoring
+
+class ScoreError(Exception):
+    pass
+
+class Snapshot:
+    """ The standings after count scores."""
+    __slots__ = ('count', 'time', 'boards', 'ranking')
+
+    def __init__(self, count, boards, ranking):
+        self.count = count
+        self.time = time.monotonic()
+        self.boards = boards   # ids of the boards changed since the last snapshot
+        self.ranking = ranking # (rank, pair, points, percent)
+
+class LiveScoring:
+    """ The pipeline of an event.
+    live = LiveScoring(event); task = asyncio.ensure_future(live.run())
+    await live.submit(id, score); queue = live.subscribe(); snapshot = await queue.get()
+    """
+    def __init__(self, event=None):
+        self.event = event or Event.Event()
+        self.count = 0
+        self.rejected = []  # (board id, score, reason)
+        self._queue = asyncio.Queue()
+        self._subscribers = []
+
+    def subscribe(self):
+        """ A queue receiving the snapshots, only the latest snapshot is kept."""
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.remove(queue)
+
+    async def submit(self, id, score):
+        """ Submits a score for board id, the answer is None or the reason of the rejection."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((id, score, future))
+        return await future
+
+    def check(self, id, score):
+        """ Raises ScoreError if the score does not follow the rules or the board."""
+        board = self.event.boards.get(id)
+        vulnerable = board.vulnerable if board is not None else Board(id).vulnerable
+        try:
+            expected = Scoring.value(score.contract, score.result, vulnerable)
+        except ValueError as error:
+            raise ScoreError(str(error)) from None
+        if score.value != expected:
+            raise ScoreError(F"score {score.value} for {score.contract} {score.result or 0:+}, expected {expected}")
+        if board is not None:
+            for pair in score.pairs:
+                if board.playedBy(pair):
+                    raise ScoreError(F"pair {pair} has already played board {id}")
+
+    def _add(self, id, score, future):
+        try:
+            self.check(id, score)
+        except ScoreError as error:
+            self.rejected.append((id, score, str(error)))
+            future.set_result(str(error))
+            return False
+        self.event.addScore(id, score)
+        self.count += 1
+        future.set_result(None)
+        return True
+
+    def snapshot(self, boards=()):
+        ranking = [ (rank, total.pair, total.points, total.percent)
+                    for rank, total in self.event.ranking() ]
+        return Snapshot(self.count, sorted(boards), ranking)
+
+    def _publish(self, snapshot):
+        for queue in self._subscribers:
+            if queue.full(): # a slow subscriber only gets the latest snapshot
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+    def _consume(self, id, score, future, boards):
+        """ Adds one score, an unexpected error only fails the submit of this score."""
+        try:
+            if self._add(id, score, future): boards.add(id)
+        except Exception as error:
+            if not future.done(): future.set_exception(error)
+
+    async def run(self):
+        """ Consumes the submitted scores until cancelled."""
+        queue = self._queue
+        while True:
+            boards = set()
+            self._consume(*await queue.get(), boards)
+            while not queue.empty(): # the scores submitted meanwhile
+                self._consume(*queue.get_nowait(), boards)
+            if boards:
+                self._publish(self.snapshot(boards))
+
+# ---------------------------------------------------------------------------------------
+
+def parseLine(line):
+    """ The board id and the score of a line of the socket protocol."""
+    fields = line.split()
+    if len(fields) != 7:
+        raise ScoreError(F"7 fields expected: {line!r}")
+    id, ns, ew, contract, declarer, tricks, value = fields
+    try:
+        contract = Pbn.parseContract(contract, declarer)
+    except Pbn.PbnError as error:
+        raise ScoreError(str(error)) from None
+    if not id.isdigit() or (contract and not tricks.isdigit()) or not value.lstrip('-').isdigit():
+        raise ScoreError(F"numbers expected: {line!r}")
+    if contract and int(tricks) not in Scoring.TRICKS:
+        raise ScoreError(F"{tricks} tricks, 0..13 expected: {line!r}")
+    return int(id), Score([ns, ew], contract, Pbn.parseResult(tricks, contract), int(value))
+
+def formatLine(id, score):
+    contract, declarer = Pbn.formatContract(score.contract)
+    tricks = 6 + score.contract.level + (score.result or 0) if score.contract else '-'
+    return F"{id} {score.pairs[0]} {score.pairs[1]} {contract} {declarer or '-'} {tricks} {score.value}"
+
+async def serve(live, host='127.0.0.1', port=0):
+    """ Starts a server accepting scores on a socket, returns the asyncio server."""
+    async def connection(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line: break
+            try:
+                reason = await live.submit(*parseLine(line.decode('utf-8')))
+            except Exception as error: # a bad line or an unexpected error of this score
+                reason = str(error) or type(error).__name__
+            writer.write(b'ok\n' if reason is None else F"error {reason}\n".encode('utf-8'))
+            await writer.drain()
+        writer.close()
+    return await asyncio.start_server(connection, host, port)
+
+async def produce(host, port, lines, pause=0.0):
+    """ A scoring device: sends lines to the server, returns the answers."""
+    reader, writer = await asyncio.open_connection(host, port)
+    answers = []
+    for line in lines:
+        writer.write(line.encode('utf-8') + b'\n')
+        await writer.drain()
+        answers.append((await reader.readline()).decode('utf-8').strip())
+        if pause: await asyncio.sleep(pause)
+    writer.close()
+    return answers
+
+# ============================================================================
+if __name__ == '__main__':
+    import random
+
+    async def main(tables=200, rounds=3, boards=2):
+        rng = random.Random(0)
+        contracts = [ (Contract(SOUTH, 4, SPADES), 0), (Contract(SOUTH, 4, SPADES), 1),
+                      (Contract(NORTH, 3, NT), 0), (Contract(WEST, 5, CLUBS, DOUBLED), -2), (PASS, None) ]
+        live = LiveScoring(Event.Event('Live'))
+        consumer = asyncio.ensure_future(live.run())
+        server = await serve(live)
+        host, port = server.sockets[0].getsockname()[:2]
+
+        def lines(table):
+            result = []
+            for round in range(rounds):
+                ns, ew = table, tables + (table + round) % tables + 1
+                for id in range(round * boards + 1, (round + 1) * boards + 1):
+                    contract, over = rng.choice(contracts)
+                    value = Scoring.value(contract, over, Board(id).vulnerable)
+                    result.append(formatLine(id, Score([ns, ew], contract, over, value)))
+            return result
+
+        snapshots = live.subscribe()
+        latencies = []
+        async def watch():
+            while True:
+                snapshot = await snapshots.get()
+                latencies.append(time.monotonic() - snapshot.time)
+        watcher = asyncio.ensure_future(watch())
+
+        start = time.monotonic()
+        producers = [produce(host, port, lines(table), pause=0.001) for table in range(1, tables + 1)]
+        producers.append(produce(host, port, ['1 1 201 4S S 9 420', '1 1 202 4S S 14 0'])) # wrong score, tricks
+        answers = await asyncio.gather(*producers)
+        elapsed = time.monotonic() - start
+        # an unexpected error fails the submit of its score only, the consumer goes on
+        assert await live.submit(1, Score([1, 203], Contract(SOUTH, 4, SPADES), 15, 0)) is not None
+        try:
+            await live.submit(1, Score(None, PASS, None, 0))
+            assert False
+        except TypeError:
+            pass
+        assert not consumer.done() and await live.submit(1, Score([1, 203], PASS, None, 0)) is None
+        await asyncio.sleep(0.01)
+        watcher.cancel()
+        consumer.cancel()
+        server.close()
+        await server.wait_closed()
+
+        print(F"{live.count} scores from {tables} tables in {elapsed:.2f}s, {len(latencies)} snapshots")
+        print(F"rejected: {live.rejected[0][2] if live.rejected else None}  ({answers[-1][0]})")
+        print(F"rejected: {answers[-1][1]}")
+        assert answers[-1][1].startswith('error')
+        for rank, pair, points, percent in live.snapshot().ranking[:3]:
+            print(F"{rank:3}. {pair:>4} {points:6.1f} {percent:6.2f}%")
+        assert live.count == tables * rounds * boards + 1 and len(live.rejected) == 2
+
+    asyncio.run(main())
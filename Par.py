@@ -0,0 +1,129 @@
+"""
+Par module
+computes the par score and the par contracts from the double dummy table of a board
+
+Par is the result of an auction in which both sides know the tricks of every
+contract: a side passes or outbids the last contract, a contract which makes
+is played undoubled, a contract which fails (a sacrifice) is doubled.
+The value of holding bid b is computed from the highest bid down, keeping the
+best overcall of the other side as running max (N/S) or min (E/W), so a board
+takes 2 x 35 steps of table lookups. The par contracts are the lowest bids per
+denomination scoring par which the other side cannot outbid without loss.
+
+The table is dd[denomination.index][position.index] = tricks of declarer (DoubleDummy.table).
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import math
+
+from Bridge import *
+import Scoring
+
+BIDS = [ (level, denomination) for level in Scoring.LEVELS for denomination in Denominations ]
+
+def _results(dd, vulnerable):
+    """ The score for N/S of every bid played by N/S and by E/W, by the better hand of the side."""
+    results = [[], []]
+    for direction in Directions:
+        first, second = direction.positions
+        vul = direction in vulnerable.directions
+        factor = direction.factor
+        for level, denomination in BIDS:
+            row = dd[denomination.index]
+            tricks = max(row[first.index], row[second.index])
+            risk = UNDOUBLED if tricks >= 6 + level else DOUBLED
+            value = Scoring.TABLE[level][denomination.index][risk.index][vul][tricks]
+            results[direction.index].append(factor * value)
+    return results
+
+def par(dd, vulnerable, dealer=NORTH):
+    """ The par score for N/S and the par contracts as (Contract, over/undertricks).
+    The side of the dealer bids first, which matters if both sides can make a contract.
+    """
+    results = _results(dd, vulnerable)
+    count = len(BIDS)
+    # stable[side][b]: side holds bid b and every overcall of the other side is worse for it
+    stable = [[False] * count, [False] * count]
+    best = [-math.inf, math.inf] # best overcall of N/S (max) and of E/W (min) above b
+    for b in range(count - 1, -1, -1):
+        stable[0][b] = results[0][b] < best[1]
+        stable[1][b] = results[1][b] > best[0]
+        ns = min(results[0][b], best[1]) # E/W may outbid N/S
+        ew = max(results[1][b], best[0]) # N/S may outbid E/W
+        if ns > best[0]: best[0] = ns
+        if ew < best[1]: best[1] = ew
+    # the opening: dealer's side, the other side, dealer's partner, the other partner
+    score = 0
+    for side in ([1, 0, 1, 0] if dealer.direction == NS else [0, 1, 0, 1]):
+        score = max(score, best[0]) if side == 0 else min(score, best[1])
+    contracts = []
+    for direction in Directions if score else []: # the side making or sacrificing
+        side = direction.index
+        found = set() # lowest level per denomination
+        for b, (level, denomination) in enumerate(BIDS):
+            if denomination in found or results[side][b] != score or not stable[side][b]: continue
+            found.add(denomination)
+            row = dd[denomination.index]
+            tricks = max(row[position.index] for position in direction.positions)
+            risk = UNDOUBLED if tricks >= 6 + level else DOUBLED
+            for position in direction.positions:
+                if row[position.index] == tricks:
+                    contracts.append((Contract(position, level, denomination, risk), tricks - 6 - level))
+    return score, contracts
+
+def solve(board):
+    """ Computes and sets board.par from board.dd."""
+    board.par = par(board.dd, board.vulnerable, board.dealer)
+    return board.par
+
+def pars(boards):
+    """ Yields the par of the boards (with dd), setting board.par."""
+    for board in boards:
+        yield solve(board)
+
+def formatPar(score, contracts):
+    if not contracts: return 'Pass 0'
+    return ' '.join(F"{contract!s}{result:+}" if result else F"{contract!s}=" for contract, result in contracts) \
+           + F" {score:+}"
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+
+    dd = [ [ 6,  7,  6,  7], # clubs
+           [ 5,  8,  5,  8], # diamonds
+           [ 9,  4,  9,  4], # hearts
+           [10,  3, 10,  3], # spades
+           [ 8,  4,  8,  4] ] # NT
+    for vulnerable in Vulnerables:
+        print(F"{vulnerable!s:5}", formatPar(*par(dd, vulnerable)))
+
+    dd = [ [ 4,  9,  4,  9],
+           [ 3, 10,  3, 10],
+           [10,  3, 10,  3],
+           [10,  3, 10,  3],
+           [ 6,  6,  6,  6] ]
+    for vulnerable in Vulnerables:
+        print(F"{vulnerable!s:5}", formatPar(*par(dd, vulnerable)))
+
+    # a sacrifice of the side bidding first at the level of the other side's best contract
+    sacrifices = [ ([ [ 7,  5,  7,  5], [ 5,  7,  4,  7], [ 9,  3,  9,  3], [ 8,  6,  7,  6], [13,  5, 12,  5] ], VUL_NS, '7SAx'),
+                   ([ [ 7, 12,  6, 12], [ 5,  4,  5,  4], [ 4, 11,  4, 11], [13, 11, 13, 11], [ 9,  3,  8,  3] ], VUL_NONE, '7♠x') ]
+    for table, vulnerable, sacrifice in sacrifices:
+        score, contracts = par(table, vulnerable, EAST)
+        print(F"{vulnerable!s:5}", formatPar(score, contracts))
+        assert contracts and all(str(contract).endswith(sacrifice) for contract, _ in contracts)
+    for table in [dd] + [table for table, _, _ in sacrifices]:
+        for vulnerable in Vulnerables:
+            for dealer in Positions:
+                score, contracts = par(table, vulnerable, dealer)
+                assert contracts or not score, (table, vulnerable, dealer)
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        par(dd, VUL_NS)
+    print(F"{(time.perf_counter() - start) / 10000 * 1e6:.0f} us per board")
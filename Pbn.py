@@ -0,0 +1,283 @@
+"""
+Pbn module
+reads and writes games in the Portable Bridge Notation (PBN)
+
+Reading is a generator over the lines, one game at a time. A game only keeps
+its tags, Board, Hand, Contract and Score are built when they are used.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import os
+import re
+
+from Bridge import *
+
+# ---------------------------------------------------------------------------------------
+"""Notation
+"""
+TAG = re.compile(r'\[(\w+)\s+"(.*)"\]')
+ESCAPE = re.compile(r'\\(.)') # \" and \\ within a tag value
+
+PBN_POSITIONS = 'NESW'       # clockwise, as Positions
+PBN_SUITS = 'SHDC'           # order of the suits within a hand
+PBN_RANKS = '23456789TJQKA'  # as RANKS
+
+PBN_DENOMINATIONS = dict(zip(['C', 'D', 'H', 'S', 'NT'], Denominations))
+PBN_RISKS = dict(zip(['', 'X', 'XX'], Risks))
+PBN_VULNERABLES = { 'None': VUL_NONE, 'Love': VUL_NONE, '-': VUL_NONE,
+                    'NS': VUL_NS, 'EW': VUL_EW,
+                    'All': VUL_ALL, 'Both': VUL_ALL }
+
+_DENOMINATION_NAMES = {denomination: name for name, denomination in PBN_DENOMINATIONS.items()}
+_RISK_NAMES = {risk: name for name, risk in PBN_RISKS.items()}
+_VULNERABLE_NAMES = dict(zip(Vulnerables, ['None', 'NS', 'EW', 'All']))
+
+class PbnError(Exception):
+    pass
+
+# ---------------------------------------------------------------------------------------
+
+def parsePosition(text):
+    try:
+        return Position.get(PBN_POSITIONS.index(text.strip().upper()))
+    except ValueError:
+        raise PbnError(F"unknown position {text!r}") from None
+
+def parseHand(text):
+    """ A hand 'S.H.D.C', e.g. 'AK3.QT2..J98765', '-' is an unknown hand."""
+    if text == '-': return Hand()
+    suits = text.split('.')
+    if len(suits) != len(Suits):
+        raise PbnError(F"hand {text!r} has not 4 suits")
+    cards = []
+    for name, ranks in zip(PBN_SUITS, suits):
+        suit = Suit.get(3 - PBN_SUITS.index(name))
+        for rank in ranks.upper():
+            if rank not in PBN_RANKS:
+                raise PbnError(F"unknown rank {rank!r} in hand {text!r}")
+            cards.append(Card.card(suit, PBN_RANKS.index(rank)))
+    return Hand(cards=cards)
+
+def formatHand(hand):
+    if not len(hand): return '-'
+    return '.'.join(''.join(PBN_RANKS[rank] for rank in hand[suit])
+                    for suit in sorted(Suits, reverse=True))
+
+def parseDeal(text):
+    """ A deal 'N:<hand> <hand> <hand> <hand>' (clockwise), returns the hands of Positions."""
+    first, _, hands = text.partition(':')
+    hands = hands.split()
+    if len(hands) != len(Positions):
+        raise PbnError(F"deal {text!r} has not 4 hands")
+    first = parsePosition(first).index
+    hands = [parseHand(hand) for hand in hands]
+    return hands[-first:] + hands[:-first] if first else hands
+
+def formatDeal(board, first=NORTH):
+    positions = Positions[first.index:] + Positions[:first.index]
+    return F"{PBN_POSITIONS[first.index]}:" + ' '.join(formatHand(board[position]) for position in positions)
+
+def parseContract(text, declarer):
+    """ A contract '4SX' or 'Pass' and the declarer 'S'."""
+    text = text.strip().upper()
+    if text in ['', 'PASS']: return PASS
+    match = re.fullmatch(r'([1-7])(NT|[CDHS])(X{0,2})', text)
+    if not match:
+        raise PbnError(F"unknown contract {text!r}")
+    level, denomination, risk = match.groups()
+    return Contract(parsePosition(declarer), int(level), PBN_DENOMINATIONS[denomination], PBN_RISKS[risk])
+
+def formatContract(contract):
+    """ Returns the contract and the declarer."""
+    if not contract: return 'Pass', ''
+    return ( F"{contract.level}{_DENOMINATION_NAMES[contract.denomination]}{_RISK_NAMES[contract.risk]}",
+             PBN_POSITIONS[contract.declarer.index] )
+
+def parseNumber(text, name):
+    try:
+        return int(text)
+    except ValueError:
+        raise PbnError(F"{name} {text!r} is not a number") from None
+
+def parseScore(text, contract):
+    """ A score 'NS 620', 'EW -100' or '620' (declarer), returns the value for N/S."""
+    parts = text.split()
+    if not parts: return 0
+    if parts[0] in ['NS', 'EW']:
+        if len(parts) < 2:
+            raise PbnError(F"score {text!r} has no value")
+        value = parseNumber(parts[1], 'score')
+        return value if parts[0] == 'NS' else -value
+    value = parseNumber(parts[0], 'score')
+    return -value if EW in contract.direction else value
+
+def parseResult(text, contract):
+    """ The tricks taken by declarer, returns the over/undertricks."""
+    if not contract or not text.isdigit(): return None
+    return int(text) - 6 - contract.level
+
+# ---------------------------------------------------------------------------------------
+
+class Game:
+    """ A game holds the tags of one result of a board.
+    Board, contract and score are built when first used.
+    """
+    __slots__ = ('tags', '_board', '_contract')
+
+    def __init__(self, tags):
+        self.tags = tags
+        self._board = None
+        self._contract = None
+
+    @property
+    def id(self):
+        return parseNumber(self.tags.get('Board') or 0, 'board')
+
+    @property
+    def board(self):
+        if self._board is None:
+            tags = self.tags
+            dealer = tags.get('Dealer')
+            vulnerable = tags.get('Vulnerable')
+            self._board = Board( self.id,
+                                 parseDeal(tags['Deal']) if tags.get('Deal') else None,
+                                 dealer=parsePosition(dealer) if dealer else None,
+                                 vulnerable=PBN_VULNERABLES.get(vulnerable) )
+        return self._board
+
+    @property
+    def contract(self):
+        if self._contract is None and 'Contract' in self.tags:
+            self._contract = parseContract(self.tags['Contract'], self.tags.get('Declarer', ''))
+        return self._contract
+
+    @property
+    def score(self):
+        """ The score of the game, None if there is no contract."""
+        contract = self.contract
+        if contract is None: return None
+        pairs = [self.tags.get('PairId_NS'), self.tags.get('PairId_EW')]
+        return Score( pairs, contract,
+                      parseResult(self.tags.get('Result', ''), contract),
+                      parseScore(self.tags.get('Score', ''), contract) )
+
+def read(source):
+    """ Yields the games of a file (path or iterable of lines)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding='utf-8', errors='replace') as file:
+            yield from read(file)
+        return
+    tags, previous = {}, {}
+    comment = False
+    for line in source:
+        line = line.strip()
+        if comment: # within { ... }
+            comment = '}' not in line
+            continue
+        if not line: # games are separated by empty lines
+            if tags:
+                yield Game(tags)
+                tags, previous = {}, tags
+            continue
+        if line[0] == '{':
+            comment = '}' not in line
+        elif line[0] == '[':
+            match = TAG.match(line)
+            if match:
+                name, value = match.groups()
+                value = ESCAPE.sub(r'\1', value)
+                tags[name] = previous.get(name, '') if value == '#' else value # '#' repeats
+        # ; and % are comments, auction and play sections are skipped
+    if tags:
+        yield Game(tags)
+
+def boards(games):
+    """ Yields a board per run of games with the same board, with the scores of the games."""
+    board, id = None, None
+    for game in games:
+        if board is None or game.tags.get('Board') != id:
+            if board is not None:
+                yield board
+            board, id = game.board, game.tags.get('Board')
+        score = game.score
+        if score is not None:
+            board.addScore(score)
+    if board is not None:
+        yield board
+
+# ---------------------------------------------------------------------------------------
+
+def _tags(file, tags):
+    for name, value in tags:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        file.write(F'[{name} "{value}"]\n')
+    file.write('\n')
+
+def write(target, boards, event=''):
+    """ Writes the boards, one game per score, to a file (path or file object).
+    Returns the number of games.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'w', encoding='utf-8') as file:
+            return write(file, boards, event)
+    count = 0
+    for board in boards:
+        tags = [ ('Event', event),
+                 ('Board', board.id),
+                 ('Dealer', PBN_POSITIONS[board.dealer.index]),
+                 ('Vulnerable', _VULNERABLE_NAMES[board.vulnerable]),
+                 ('Deal', formatDeal(board)) ]
+        scores = board.scores
+        if not scores:
+            _tags(target, tags)
+            count += 1
+        for score in scores:
+            contract, declarer = formatContract(score.contract)
+            result = ( 6 + score.contract.level + (score.result or 0)
+                       if score.contract and score.result is not None else '' )
+            game = tags + [ ('Declarer', declarer),
+                            ('Contract', contract),
+                            ('Result', result),
+                            ('Score', F"NS {score.value}") ]
+            if score.pairs[0] is not None: game.append(('PairId_NS', score.pairs[0]))
+            if score.pairs[1] is not None: game.append(('PairId_EW', score.pairs[1]))
+            _tags(target, game)
+            count += 1
+    return count
+
+# ============================================================================
+if __name__ == '__main__':
+    import io
+
+    board = Board(21, 35817416954748550972957151064)
+    board.addScore(Score([17,31], Contract(SOUTH, 4, SPADES, UNDOUBLED), -1, -50))
+    board.addScore(Score([11,24], Contract(WEST, 5, CLUBS, DOUBLED), 0, -550))
+    board.addScore(Score([12,25], PASS, None, 0))
+
+    text = io.StringIO()
+    write(text, [board], 'Demo')
+    print(text.getvalue())
+
+    text.seek(0)
+    again = list(boards(read(text)))
+    assert len(again) == 1 and again[0].index == board.index
+    assert [str(score) for score in again[0].scores] == [str(score) for score in board.scores]
+    assert again[0].dealer == board.dealer and again[0].vulnerable == board.vulnerable
+
+    # quotes and backslashes in tag values survive a round trip
+    text = io.StringIO()
+    write(text, [board], 'The "Demo" \\ Cup')
+    text.seek(0)
+    assert next(read(text)).tags['Event'] == 'The "Demo" \\ Cup'
+    # malformed numbers raise PbnError
+    for tags in [{'Board': 'x'}, {'Board': '1', 'Contract': '4S', 'Declarer': 'S', 'Score': 'NS 6x0'}]:
+        try:
+            game = next(read(F'[{name} "{value}"]' for name, value in tags.items()))
+            game.id, game.score
+            assert False
+        except PbnError as error:
+            print(error)
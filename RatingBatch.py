@@ -0,0 +1,95 @@
+"""
+RatingBatch module
+implements Rating and Type for whole batches of hands (numpy)
+
+A batch of hands is an array of 13 bit rank masks with the suits in the last axis
+(shape (..., 4)), e.g. (N, 4, 4) for N deals: masks[deal, seat, suit].
+The results are columns with the leading shape of the masks.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import numpy as np
+import Bridge
+
+# columns of Bridge.SuitRatings
+_table = np.array(Bridge.SuitRatings, dtype=np.float64)
+HCP     = _table[:, 0].astype(np.int16)
+LOSER   = _table[:, 1].astype(np.int16)
+DS      = _table[:, 2]
+ADJUST  = _table[:, 3].astype(np.int16)
+DP      = _table[:, 4].astype(np.int16)
+ACES    = _table[:, 5].astype(np.int16)
+QUEENS  = _table[:, 6].astype(np.int16)
+HONORS  = _table[:, 7].astype(np.int16)
+LENGTH  = np.array([bin(mask).count('1') for mask in range(len(_table))], dtype=np.int16)
+
+METRICS = ('hcp', 'loser', 'ds', 'adjust', 'dp', 'type', 'isFlat')
+
+_RANK_BITS = (1 << np.arange(len(Bridge.RANKS))).astype(np.uint16)
+
+def masks(seats):
+    """ Computes the masks (N, 4, 4) [deal, seat, suit] from an (N, 52) array of seats."""
+    seats = np.asarray(seats)
+    shape = (len(seats), len(Bridge.Suits), len(Bridge.RANKS))
+    return np.stack([((seats == seat).reshape(shape) * _RANK_BITS).sum(axis=2, dtype=np.uint16)
+                     for seat in range(len(Bridge.Positions))], axis=1)
+
+def fromHands(hands):
+    """ Computes the masks (N, 4) from a list of Bridge.Hand."""
+    return np.array([hand.masks for hand in hands], dtype=np.uint16).reshape(-1, len(Bridge.Suits))
+
+def rate(masks):
+    """ Computes the columns of Rating and Type for an array of masks (..., 4).
+    Returns a dictionary metric -> array with the values of Bridge.Rating and Bridge.Type,
+    'type' has the suit lengths in the last axis.
+    """
+    masks = np.asarray(masks, dtype=np.intp)
+    numA = ACES[masks].sum(axis=-1)
+    numQ = QUEENS[masks].sum(axis=-1)
+    loser = LOSER[masks].sum(axis=-1)
+    # extra D's are loser
+    loser += np.maximum(numQ - numA, 0)
+    # some extra A's reduce the losers
+    loser -= (numA > 2) * np.maximum(numA - np.maximum(numQ, 2), 0)
+    # +- overrated/underrated honors
+    adjust = ADJUST[masks].sum(axis=-1) + HONORS[masks].sum(axis=-1) // 3
+    dp = DP[masks].sum(axis=-1)
+    return { 'hcp':    HCP[masks].sum(axis=-1),
+             'loser':  loser,
+             'ds':     DS[masks].sum(axis=-1),
+             'adjust': adjust,
+             'dp':     dp,
+             'type':   LENGTH[masks],
+             'isFlat': dp < 2 }
+
+def rateSeats(seats):
+    """ Computes the columns (N, 4) [deal, seat] of Rating and Type for an (N, 52) array of seats."""
+    return rate(masks(seats))
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+    import SquashedBatch
+
+    rng = np.random.default_rng(0)
+    count = 1000000
+    seats = np.argsort(rng.random((count, 52)), axis=1).astype(np.uint8) // 13
+
+    start = time.perf_counter()
+    columns = rateSeats(seats)
+    print(F"rateSeats: {count / (time.perf_counter() - start):10.0f} deals/s")
+
+    for deal in range(1000):
+        for seat, cards in enumerate(SquashedBatch.toSets(seats[deal:deal+1])[0]):
+            hand = Bridge.Hand(cards=cards)
+            assert columns['hcp'][deal, seat] == hand.rating.hcp
+            assert columns['loser'][deal, seat] == hand.rating.loser
+            assert columns['ds'][deal, seat] == hand.rating.ds
+            assert columns['adjust'][deal, seat] == hand.rating.adjust
+            assert columns['dp'][deal, seat] == hand.rating.dp
+            assert list(columns['type'][deal, seat]) == hand.type.type
+            assert columns['isFlat'][deal, seat] == hand.type.isFlat
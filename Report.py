@@ -0,0 +1,257 @@
+"""
+Report module
+renders the result sheets of an event (per pair and per board) as text, CSV or HTML
+
+The parts of a line which depend only on the board (the rating and the type of
+the partnerships and of the hands) or only on the score (the contract) are
+rendered once and reused for every pair, and the lines of all sheets are
+written in blocks to one stream. The text lines are the same as
+Board.formatForPair, Board.__str__ and Score.__str__.
+
+    with open('results.txt', 'w') as file:
+        Report.write(file, event)                     # a sheet per pair
+        Report.write(file, event, sheets=BOARDS)      # a sheet per board
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import csv
+import html
+import io
+import os
+
+from Bridge import *
+
+TEXT, CSV, HTML = 'text', 'csv', 'html'
+PAIRS, BOARDS = 'pairs', 'boards'
+
+BLOCK = 1 << 16 # characters written at once
+
+# ---------------------------------------------------------------------------------------
+
+class _Board:
+    """ The parts of the lines of a board, rendered once."""
+    __slots__ = ('board', 'ratings', 'partnerships', 'hands')
+
+    def __init__(self, board):
+        self.board = board
+        self.ratings, self.partnerships, self.hands = {}, {}, {}
+        if not bool(board): return
+        for direction in Directions:
+            rating = board.rating(direction)
+            self.ratings[direction] = rating
+            self.partnerships[direction] = F"{rating}{board.type(direction)}"
+        for position in Positions:
+            hand = board[position]
+            self.hands[position] = F"{hand.rating} {hand.type}"
+
+class _Score:
+    """ The parts of the lines of a score, rendered once."""
+    __slots__ = ('contract', 'text')
+
+    def __init__(self, score):
+        result = F"{score.result:+}" if score.result else "="
+        self.contract = F"{score.contract!s:7}{result:>2}" if score.contract else 'Pass'
+        self.text = str(score)
+
+class Renderer:
+    """ Renders the sheets of an event, the parts of boards and scores are kept."""
+    def __init__(self, event):
+        self.event = event
+        self._boards = {}  # board id -> _Board
+        self._scores = {}  # score -> _Score
+
+    def _board(self, board):
+        parts = self._boards.get(board.id)
+        if parts is None or parts.board is not board:
+            parts = self._boards[board.id] = _Board(board)
+        return parts
+
+    def _score(self, score):
+        parts = self._scores.get(score)
+        if parts is None:
+            parts = self._scores[score] = _Score(score)
+        return parts
+
+    def _rows(self, pair):
+        """ The values of the lines of pair: board, score, direction, value, points, declared."""
+        for id, score in sorted(self.event.scores(pair).items()):
+            board = self.event.boards[id]
+            direction = NS if pair == score.pairs[0] else EW
+            positions = direction.positions
+            declared = [' ', ' ', ' ']
+            if score.contract.declarer in positions:
+                declared[0] = '*'
+                declared[1 if score.contract.declarer == positions[0] else 2] = '*'
+            value = score.value if direction == NS else -score.value
+            points = score.points[0] if direction == NS else score.points[1]
+            yield board, score, direction, value, points, declared
+
+    # -- text
+
+    def pairText(self, pair):
+        """ The lines of the sheet of pair (as Event.report and the total)."""
+        lines = [Board.formatHeader()]
+        for board, score, direction, value, points, declared in self._rows(pair):
+            parts, first, second = self._board(board), *direction.positions
+            lines.append( F"{board.id:3}   {self._score(score).contract:9} {value:+5}  {int(points):+4}"
+                          F"  {declared[0]!s:1}{direction!s:3}: {parts.partnerships[direction]}"
+                          F"  {declared[1]!s:1}{first!s:1}: {parts.hands[first]}"
+                          F"  {declared[2]!s:1}{second!s:1}: {parts.hands[second]}" )
+        lines.append(F"{self.event.total(pair)}")
+        return lines
+
+    def boardText(self, board):
+        """ The lines of the sheet of board (Board.__str__ and the scores)."""
+        parts = self._board(board)
+        lines = []
+        if bool(board):
+            star = lambda position: '*' if board.dealer == position else ' '
+            vul = lambda direction: 'VUL' if direction in board.vulnerable.directions else ''
+            lines += [ F"Board: {board.id:2}  ({board.index})", "",
+                       F"{NS!s:3}: {parts.ratings[NS]}  {star(NORTH)}{NORTH}: {parts.hands[NORTH]}  "
+                       F"{EW!s:3}: {parts.ratings[EW]}  {star(EAST)}{EAST}: {parts.hands[EAST]}  ",
+                       F"{vul(NS):15s}{star(SOUTH)}{SOUTH}: {parts.hands[SOUTH]}  "
+                       F"{vul(EW):15s}{star(WEST)}{WEST}: {parts.hands[WEST]}  " ]
+        else:
+            lines.append(F"Board: {board.id:2}")
+        lines.append("")
+        lines += [self._score(score).text for score in board.scores]
+        return lines
+
+    # -- CSV
+
+    PAIR_COLUMNS = [ 'pair', 'board', 'direction', 'contract', 'declarer', 'value', 'points',
+                     'hcp', 'loser', 'ds' ]
+    BOARD_COLUMNS = [ 'board', 'ns', 'ew', 'contract', 'declarer', 'value', 'ns points', 'ew points' ]
+
+    def pairRows(self, pair):
+        for board, score, direction, value, points, declared in self._rows(pair):
+            rating = self._board(board).ratings.get(direction)
+            yield [ pair, board.id, direction.name, self._score(score).contract.strip(),
+                    score.contract.declarer.name if score.contract else '', value, points,
+                    *( [rating.hcp, rating.loser, rating.ds] if rating else ['', '', ''] ) ]
+
+    def boardRows(self, board):
+        for score in board.scores:
+            yield [ board.id, score.pairs[0], score.pairs[1], self._score(score).contract.strip(),
+                    score.contract.declarer.name if score.contract else '', score.value,
+                    *(score.points or ['', '']) ]
+
+    # -- HTML
+
+    @staticmethod
+    def _table(caption, header, rows):
+        cells = lambda tag, values: ''.join(F"<{tag}>{html.escape(str(value))}</{tag}>" for value in values)
+        lines = [ F"<table><caption>{html.escape(str(caption))}</caption>",
+                  F"<tr>{cells('th', header)}</tr>" ]
+        lines += [F"<tr>{cells('td', row)}</tr>" for row in rows]
+        lines.append("</table>")
+        return lines
+
+    def pairHtml(self, pair):
+        return self._table(self.event.total(pair), self.PAIR_COLUMNS[1:], (row[1:] for row in self.pairRows(pair)))
+
+    def boardHtml(self, board):
+        return self._table(F"Board {board.id}", self.BOARD_COLUMNS[1:], (row[1:] for row in self.boardRows(board)))
+
+# ---------------------------------------------------------------------------------------
+
+def _blocks(target, lines):
+    """ Writes lines to target, BLOCK characters at a time."""
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line) + 1
+        if size >= BLOCK:
+            block.append('')
+            target.write('\n'.join(block))
+            block, size = [], 0
+    if block:
+        block.append('')
+        target.write('\n'.join(block))
+
+def write(target, event, sheets=PAIRS, format=TEXT, selection=None, renderer=None):
+    """ Writes the sheets (PAIRS or BOARDS) of event to a file (path or file object),
+    selection: the pairs or the board ids (default: all). Returns the number of sheets.
+    A renderer may be passed to keep the rendered parts across calls.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'w', encoding='utf-8', newline='') as file:
+            return write(file, event, sheets, format, selection, renderer)
+    renderer = renderer or Renderer(event)
+    if sheets == PAIRS:
+        items = event.pairs if selection is None else selection
+    elif sheets == BOARDS:
+        items = list(event) if selection is None else [event.boards[id] for id in selection]
+    else:
+        raise ValueError(F"unknown sheets {sheets!r}")
+    if format == TEXT:
+        render = renderer.pairText if sheets == PAIRS else renderer.boardText
+        _blocks(target, (line for item in items for line in render(item) + ['']))
+    elif format == CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(Renderer.PAIR_COLUMNS if sheets == PAIRS else Renderer.BOARD_COLUMNS)
+        rows = renderer.pairRows if sheets == PAIRS else renderer.boardRows
+        for item in items:
+            writer.writerows(rows(item))
+            if buffer.tell() >= BLOCK:
+                target.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+        target.write(buffer.getvalue())
+    elif format == HTML:
+        render = renderer.pairHtml if sheets == PAIRS else renderer.boardHtml
+        _blocks(target, ( ["<!DOCTYPE html>", F"<html><head><meta charset=\"utf-8\"><title>{html.escape(event.name)}</title></head><body>"]
+                          + [line for item in items for line in render(item)]
+                          + ["</body></html>"] ))
+    else:
+        raise ValueError(F"unknown format {format!r}")
+    return len(items)
+
+# ============================================================================
+if __name__ == '__main__':
+    import random
+    import time
+    import Event
+    import SquashedOrder
+
+    rng = random.Random(0)
+    tables, rounds = 150, 15
+    values = [620, 650, 170, 140, -100, -200, 100, 590, 1430, -50, 420, 450]
+    event = Event.Event('Demo')
+    for id in range(1, 2 * rounds + 1):
+        event.addBoard(Board(id, SquashedOrder.sample(1, rng)[0]))
+    for round in range(rounds):
+        for table in range(1, tables + 1):
+            ns, ew = table, tables + (table + round) % tables + 1
+            for id in (2 * round + 1, 2 * round + 2):
+                contract = rng.choice([Contract(SOUTH, 4, SPADES), Contract(WEST, 3, NT, DOUBLED), PASS])
+                event.addScore(id, Score([ns, ew], contract, rng.choice([-1, 0, 1]), rng.choice(values)))
+
+    start = time.perf_counter()
+    expected = io.StringIO()
+    for pair in event.pairs:
+        expected.write('\n'.join(event.report(pair) + [F"{event.total(pair)}", '']) + '\n')
+    before = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = io.StringIO()
+    write(text, event)
+    after = time.perf_counter() - start
+    assert text.getvalue() == expected.getvalue()
+    print(F"{len(event.pairs)} pair sheets: {before:.3f}s formatForPair, {after:.3f}s Report")
+
+    boards = io.StringIO()
+    write(boards, event, BOARDS)
+    board = event.boards[1]
+    assert boards.getvalue().startswith('\n'.join([str(board), ''] + [str(score) for score in board.scores]))
+    for format in (CSV, HTML):
+        start = time.perf_counter()
+        out = io.StringIO()
+        write(out, event, PAIRS, format)
+        print(F"{format}: {time.perf_counter() - start:.3f}s, {len(out.getvalue())} characters")
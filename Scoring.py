@@ -0,0 +1,119 @@
+"""
+Scoring module
+computes duplicate scores from contract, tricks and vulnerability
+
+All scores are precomputed: TABLE[level][denomination][risk][vulnerable][tricks]
+is the score of declarer, so scoring is a lookup.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+from Bridge import *
+
+LEVELS = range(1, 8)
+TRICKS = range(14)
+
+def _score(level, denomination, risk, vulnerable, tricks):
+    """ The score of declarer, computed by the rules."""
+    factor = 2 ** risk.index # 1, 2, 4
+    over = tricks - 6 - level
+    if over < 0: # undertricks
+        down = -over
+        if risk == UNDOUBLED:
+            return -down * (100 if vulnerable else 50)
+        # doubled: 1st 100/200, 2nd and 3rd 200/300, then 300 each
+        first = 200 if vulnerable else 100
+        second = 300 if vulnerable else 200
+        value = first + second * min(down - 1, 2) + 300 * max(down - 3, 0)
+        return -value * factor // 2 # redoubled counts twice
+    trick = 20 if denomination in [CLUBS, DIAMONDS] else 30
+    points = (trick * level + (10 if denomination == NT else 0)) * factor
+    value = points
+    value += (500 if vulnerable else 300) if points >= 100 else 50
+    if level == 6: value += 750 if vulnerable else 500
+    if level == 7: value += 1500 if vulnerable else 1000
+    if risk != UNDOUBLED:
+        value += 50 * factor // 2 # for the insult
+        value += over * (200 if vulnerable else 100) * factor // 2
+    else:
+        value += over * trick
+    return value
+
+TABLE = [ None ] + [ [ [ [ [ _score(level, denomination, risk, vulnerable, tricks) for tricks in TRICKS ]
+                           for vulnerable in [False, True] ]
+                         for risk in Risks ]
+                       for denomination in Denominations ]
+                     for level in LEVELS ]
+
+# ---------------------------------------------------------------------------------------
+
+def isVulnerable(contract, vulnerable):
+    """ Is declarer vulnerable?"""
+    return bool(contract) and contract.declarer.direction in vulnerable.directions
+
+def score(contract, tricks, vulnerable):
+    """ The score for N/S of contract with tricks taken by declarer on a board with vulnerable.
+    Raises ValueError if tricks is not in TRICKS.
+    """
+    if not contract: return 0
+    if tricks not in TRICKS:
+        raise ValueError(F"{tricks} tricks, 0..13 expected")
+    value = TABLE[contract.level][contract.denomination.index][contract.risk.index][
+                  isVulnerable(contract, vulnerable)][tricks]
+    return value * contract.declarer.direction.factor
+
+def value(contract, result, vulnerable):
+    """ The score for N/S of contract with result (over/undertricks, None or 0 = made)."""
+    if not contract: return 0
+    return score(contract, 6 + contract.level + (result or 0), vulnerable)
+
+def setValues(board):
+    """ Computes the value of every score on the board."""
+    vulnerable = board.vulnerable
+    for entry in board.entries:
+        entry.value = value(entry.contract, entry.result, vulnerable)
+
+def check(boards):
+    """ Yields (board, score, value) for every score whose value differs from the computed value."""
+    for board in boards:
+        vulnerable = board.vulnerable
+        for entry in board.entries:
+            expected = value(entry.contract, entry.result, vulnerable)
+            if entry.value != expected:
+                yield board, entry, expected
+
+# ============================================================================
+if __name__ == '__main__':
+    examples = [ (Contract(SOUTH, 4, SPADES), 10, VUL_NONE, 420),
+                 (Contract(SOUTH, 4, SPADES), 11, VUL_NS, 650),
+                 (Contract(WEST, 3, NT), 9, VUL_NONE, -400),
+                 (Contract(NORTH, 1, NT), 7, VUL_NONE, 90),
+                 (Contract(NORTH, 2, HEARTS, DOUBLED), 8, VUL_NONE, 470),
+                 (Contract(NORTH, 1, CLUBS, REDOUBLED), 9, VUL_ALL, 1030),
+                 (Contract(EAST, 6, DIAMONDS), 12, VUL_EW, -1370),
+                 (Contract(EAST, 7, NT), 13, VUL_EW, -2220),
+                 (Contract(SOUTH, 4, HEARTS), 9, VUL_NS, -100),
+                 (Contract(SOUTH, 4, HEARTS, DOUBLED), 9, VUL_NONE, -100),
+                 (Contract(SOUTH, 4, HEARTS, DOUBLED), 6, VUL_NONE, -800),
+                 (Contract(SOUTH, 4, HEARTS, DOUBLED), 6, VUL_NS, -1100),
+                 (Contract(SOUTH, 4, HEARTS, REDOUBLED), 7, VUL_NS, -1600),
+                 (Contract(SOUTH, 5, CLUBS, DOUBLED), 11, VUL_NONE, 550),
+                 (PASS, 0, VUL_ALL, 0) ]
+    for contract, tricks, vulnerable, expected in examples:
+        print(F"{contract!s:8} {tricks:2} {vulnerable!s:5} {score(contract, tricks, vulnerable):+6}")
+        assert score(contract, tricks, vulnerable) == expected, expected
+
+    board = Board(21, 35817416954748550972957151064)
+    board.addScore(Score([17,31], Contract(SOUTH, 4, SPADES, UNDOUBLED), -1, -50))
+    board.addScore(Score([11,24], Contract(WEST, 5, CLUBS, DOUBLED), 0, 550))
+    for board, entry, expected in check([board]):
+        print(F"{board.id}: {entry}  expected {expected:+}")
+    for contract, result in [(Contract(SOUTH, 4, SPADES), 4), (Contract(SOUTH, 1, NT), -8)]:
+        try:
+            value(contract, result, VUL_NONE)
+            assert False, (contract, result)
+        except ValueError as error:
+            print(error)
@@ -0,0 +1,586 @@
+"""
+Service module
+serves decoding, rating, scoring and double dummy tables to local clients with asyncio
+
+Tools which import Bridge each pay the warm-up and fill their own caches; the
+service does it once for all of them. The requests of all connections are put
+on one queue, the batcher takes every waiting request, groups them by operation
+and makes one batched call (SquashedBatch, RatingBatch) for the distinct deals
+not found in the shared caches (least recently used), so a burst of requests
+costs one numpy call per operation. Double dummy tables are solved for the
+canonical deal (Canonical.CLASSES) on a pool of processes and mapped back, so
+equivalent deals and concurrent requests for them share one solution. Scores
+are looked up in Scoring.TABLE directly, a batch wouldn't save anything.
+
+The service listens on a Unix socket (path) or on a localhost port. Every
+request carries an id, answers are sent when they are ready, in any order.
+JSON requests are one object per line, deal numbers are ints or strings
+(they need 96 bits) and are answered as strings:
+  {"id": 1, "op": "decode", "deal": "35817416954748550972957151064"}  -> {"id": 1, "deal": "N:..."}
+  {"id": 2, "op": "encode", "deal": "N:AK3.QT2.A.J98765 ..."}          -> {"id": 2, "index": "..."}
+  {"id": 3, "op": "rate", "deal": ...}   -> {"id": 3, "rating": [{"hcp": .., "loser": .., ...} per position]}
+  {"id": 4, "op": "score", "contract": "4SX", "declarer": "S", "tricks": 9, "vulnerable": "NS"}
+                                         -> {"id": 4, "value": -200}   (or "board": id for the vulnerability)
+  {"id": 5, "op": "dd", "deal": ...}     -> {"id": 5, "dd": [[tricks per position] per denomination]}
+  {"id": 6, "op": "stats"}               -> {"id": 6, "stats": {...}}
+errors are answered as {"id": .., "error": "<reason>"}.
+Binary requests and answers are frames of a header (FRAME, 8 bytes) and a payload:
+  decode  deal number (SquashedBatch.DEAL, 12 bytes)  -> the seats of the cards (52 bytes)
+  encode  the seats of the cards (52 bytes)           -> deal number (12 bytes)
+  rate    deal number                                 -> a record of DealArchive.record(RATING)
+  dd      deal number                                 -> tricks (20 bytes) [denomination][position]
+the status of an answer is 0 or ERROR with the reason as payload. A frame
+never starts with '{', so both kinds may be mixed on one connection.
+
+    service = Service(); task = asyncio.ensure_future(service.run())
+    server = await serve(service, path='/tmp/bridge.sock')
+    client = await Client.connect(path='/tmp/bridge.sock')
+    await client.call('rate', deal=index); await client.fetch(DD, index)
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+
+import numpy as np
+
+import Bridge
+import Canonical
+import DealArchive
+import DoubleDummy
+import Pbn
+import RatingBatch
+import Scoring
+import SquashedBatch
+import SquashedOrder
+
+DECODE, ENCODE, RATE, SCORE, DD = 'decode', 'encode', 'rate', 'score', 'dd'
+OPS = (DECODE, ENCODE, RATE, SCORE, DD) # the op of a frame is OPS.index(op) + 1
+
+CACHE = 1 << 16 # entries per operation
+
+FRAME = np.dtype([('op', 'u1'), ('status', 'u1'), ('length', '<u2'), ('id', '<u4')])
+ERROR = 1
+
+RATING = DealArchive.record(DealArchive.RATING)
+
+_SEATS = len(Bridge.CARDS)
+_POSITIONS = len(Bridge.Positions)
+
+class ServiceError(Exception):
+    pass
+
+class Cache:
+    """ A least recently used cache with the number of hits and misses."""
+    def __init__(self, maxsize=CACHE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """ The value of key or None."""
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+# ---------------------------------------------------------------------------------------
+
+def _decode(keys):
+    """ The seats (52 bytes) of deal numbers."""
+    return list(SquashedBatch.seq52_13(SquashedBatch.fromInt(keys)))
+
+def _encode(keys):
+    """ The deal numbers of deals given as the cards of the 4 positions."""
+    return SquashedBatch.toInt(SquashedBatch.index52_13(SquashedBatch.fromSets(keys)))
+
+def _rate(keys):
+    """ The rating records of deal numbers."""
+    deals = SquashedBatch.fromInt(keys)
+    columns = RatingBatch.rateSeats(SquashedBatch.seq52_13(deals))
+    records = np.zeros(len(keys), dtype=RATING)
+    records['deal'] = deals
+    for name in RatingBatch.METRICS:
+        records[name] = columns[name]
+    return list(records)
+
+_BATCHES = { DECODE: _decode, ENCODE: _encode, RATE: _rate }
+
+def _table(index):
+    """ The double dummy table of a deal number (within a worker process)."""
+    return DoubleDummy.table(Bridge.decode(index))
+
+def _mapped(futures, symmetry, solving):
+    """ Answers the requests of a deal with the table of its canonical deal."""
+    error = None if solving.cancelled() else solving.exception()
+    for future in futures:
+        if future.done(): continue
+        if solving.cancelled():
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(Canonical.mapTable(solving.result(), symmetry))
+
+class Service:
+    """ Answers the requests of all clients in batches.
+    processes: the workers solving double dummy tables (None: one per cpu, 0: a thread).
+    window: seconds to wait for more requests after the first one of a batch.
+    """
+    def __init__(self, processes=None, size=CACHE, window=0.0):
+        self.processes = processes
+        self.window = window
+        self.caches = {op: Cache(size) for op in OPS if op != SCORE} # DD: by canonical deal number
+        self.requests = collections.Counter()  # op -> requests
+        self.batches = collections.Counter()   # op -> batched calls
+        self.computed = collections.Counter()  # op -> deals computed
+        self._queue = asyncio.Queue()
+        self._solving = {}    # canonical deal number -> the future of its table
+        self._executor = None
+
+    async def submit(self, op, key):
+        """ The result of a request: key is the deal number (decode, rate, dd), the cards of
+        the positions (encode) or (contract, tricks, vulnerable) (score).
+        """
+        self.requests[op] += 1
+        if op == SCORE:
+            return Scoring.score(*key)
+        if op not in self.caches:
+            raise ServiceError(F"unknown op {op!r}")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, key, future))
+        return await future
+
+    def stats(self):
+        """ The counters and the caches as a dictionary (e.g. for JSON)."""
+        return { 'requests': dict(self.requests), 'batches': dict(self.batches),
+                 'computed': dict(self.computed), 'solving': len(self._solving),
+                 'caches': { op: { 'hits': cache.hits, 'misses': cache.misses, 'size': len(cache) }
+                             for op, cache in self.caches.items() } }
+
+    def _batch(self, op, requests):
+        """ Answers the requests (key -> futures) of op with one batched call for the keys not cached."""
+        cache = self.caches[op]
+        values, missing = {}, []
+        for key in requests:
+            value = cache.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            self.batches[op] += 1
+            self.computed[op] += len(missing)
+            try:
+                computed = _BATCHES[op](missing)
+            except Exception as error:
+                for key in missing:
+                    for future in requests[key]:
+                        if not future.done(): future.set_exception(error)
+                computed = []
+            for key, value in zip(missing, computed):
+                cache.put(key, value)
+                values[key] = value
+        for key, value in values.items():
+            for future in requests[key]:
+                if not future.done(): future.set_result(value)
+
+    def _solve(self, requests):
+        """ Answers the requests (key -> futures) for double dummy tables, every canonical deal
+        which is neither cached nor being solved is solved in the pool.
+        """
+        keys = list(requests)
+        deals, best = Canonical.canonicalBatch(SquashedBatch.fromInt(keys))
+        cache = self.caches[DD]
+        loop = asyncio.get_running_loop()
+        for key, number, symmetry in zip(keys, SquashedBatch.toInt(deals), best.tolist()):
+            symmetry = Canonical.CLASSES[symmetry]
+            table = cache.get(number)
+            if table is not None:
+                for future in requests[key]:
+                    if not future.done(): future.set_result(Canonical.mapTable(table, symmetry))
+                continue
+            solving = self._solving.get(number)
+            if solving is None:
+                if self._executor is None:
+                    # spawned workers: forked ones would keep the sockets of the connections open
+                    self._executor = ( concurrent.futures.ThreadPoolExecutor(1) if self.processes == 0
+                                       else concurrent.futures.ProcessPoolExecutor(
+                                                self.processes, multiprocessing.get_context('spawn')) )
+                self.batches[DD] += 1
+                self.computed[DD] += 1
+                solving = self._solving[number] = loop.run_in_executor(self._executor, _table, number)
+                solving.add_done_callback(functools.partial(self._solved, number))
+            solving.add_done_callback(functools.partial(_mapped, requests[key], symmetry))
+
+    def _solved(self, number, solving):
+        del self._solving[number]
+        if not solving.cancelled() and solving.exception() is None:
+            self.caches[DD].put(number, solving.result())
+
+    async def run(self):
+        """ Answers the submitted requests until cancelled."""
+        queue = self._queue
+        try:
+            while True:
+                pending = collections.defaultdict(dict) # op -> key -> futures
+                op, key, future = await queue.get()
+                pending[op].setdefault(key, []).append(future)
+                if self.window: await asyncio.sleep(self.window)
+                while not queue.empty(): # the requests submitted meanwhile
+                    op, key, future = queue.get_nowait()
+                    pending[op].setdefault(key, []).append(future)
+                for op, requests in pending.items():
+                    if op == DD:
+                        self._solve(requests)
+                    else:
+                        self._batch(op, requests)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# ---------------------------------------------------------------------------------------
+
+def parseDeal(value):
+    """ A deal number of a request (int or string)."""
+    try:
+        index = int(value)
+    except (TypeError, ValueError):
+        raise ServiceError(F"deal number expected: {value!r}") from None
+    if not 0 <= index < SquashedOrder.max52:
+        raise ServiceError(F"no deal number: {index}")
+    return index
+
+def _cards(hands):
+    """ The key of encode: the cards of the 4 hands, which must be a deal."""
+    seen = 0
+    for hand in hands:
+        if not hand or seen & hand.bits:
+            raise ServiceError("4 hands of 13 different cards expected")
+        seen |= hand.bits
+    return tuple(tuple(sorted(hand.cards)) for hand in hands)
+
+def _seatCards(seats):
+    """ The key of encode for an array of 52 seats."""
+    if len(seats) != _SEATS or (seats >= _POSITIONS).any():
+        raise ServiceError("52 seats 0..3 expected")
+    return _cards([Bridge.Hand(cards=np.flatnonzero(seats == seat).tolist()) for seat in range(_POSITIONS)])
+
+def parseRequest(request):
+    """ The op and the key of a JSON request (a dictionary)."""
+    op = request.get('op')
+    try:
+        if op in (DECODE, RATE, DD):
+            return op, parseDeal(request.get('deal'))
+        if op == ENCODE:
+            return op, _cards(Pbn.parseDeal(str(request.get('deal', ''))))
+        if op == SCORE:
+            contract = Pbn.parseContract(str(request.get('contract', '')), str(request.get('declarer', '')))
+            if 'board' in request:
+                vulnerable = Bridge.Board(int(request['board'])).vulnerable
+            else:
+                vulnerable = Pbn.PBN_VULNERABLES[request.get('vulnerable', 'None')]
+            tricks = int(request['tricks']) if contract else 0
+            if contract and tricks not in Scoring.TRICKS:
+                raise ServiceError(F"no number of tricks: {tricks}")
+            return op, (contract, tricks, vulnerable)
+    except Pbn.PbnError as error:
+        raise ServiceError(str(error)) from None
+    except (KeyError, TypeError, ValueError) as error:
+        raise ServiceError(F"bad {op} request: {error}") from None
+    raise ServiceError(F"unknown op {op!r}")
+
+def formatAnswer(op, value):
+    """ The JSON answer (without id) of a result."""
+    if op == DECODE:
+        hands = { position: Bridge.Hand(cards=np.flatnonzero(value == position.index).tolist())
+                  for position in Bridge.Positions }
+        return {'deal': Pbn.formatDeal(hands)}
+    if op == ENCODE:
+        return {'index': str(value)}
+    if op == RATE:
+        return {'rating': [ {name: value[name][position].tolist() for name in RatingBatch.METRICS}
+                            for position in range(_POSITIONS) ]}
+    if op == SCORE:
+        return {'value': value}
+    return {'dd': value}
+
+def parseFrame(op, payload):
+    """ The key of a binary request."""
+    if op == ENCODE:
+        return _seatCards(np.frombuffer(payload, dtype=np.uint8))
+    if op in (DECODE, RATE, DD):
+        if len(payload) != SquashedBatch.DEAL.itemsize:
+            raise ServiceError(F"{SquashedBatch.DEAL.itemsize} bytes expected")
+        return parseDeal(SquashedBatch.toInt(np.frombuffer(payload, dtype=SquashedBatch.DEAL))[0])
+    raise ServiceError(F"no binary frame for {op}")
+
+def formatFrame(op, value):
+    """ The payload of a binary answer."""
+    if op == DECODE:
+        return value.tobytes()
+    if op == ENCODE:
+        return SquashedBatch.fromInt([value]).tobytes()
+    if op == RATE:
+        return value.tobytes()
+    return bytes(tricks for row in value for tricks in row)
+
+def _frame(op, id, payload, status=0):
+    header = np.zeros((), dtype=FRAME)
+    header['op'], header['status'], header['length'], header['id'] = op, status, len(payload), id
+    return header.tobytes() + payload
+
+async def _readFrame(reader, first):
+    """ The header and the payload of a frame starting with the byte first."""
+    header = np.frombuffer(first + await reader.readexactly(FRAME.itemsize - 1), dtype=FRAME)[0]
+    return header, await reader.readexactly(int(header['length']))
+
+async def _answerLine(service, line):
+    id = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ServiceError("JSON object expected")
+        id = request.get('id')
+        if request.get('op') == 'stats':
+            answer = {'stats': service.stats()}
+        else:
+            op, key = parseRequest(request)
+            answer = formatAnswer(op, await service.submit(op, key))
+    except json.JSONDecodeError as error:
+        answer = {'error': F"bad JSON: {error}"}
+    except Exception as error:
+        answer = {'error': str(error) or type(error).__name__}
+    answer['id'] = id
+    return json.dumps(answer).encode('utf-8') + b'\n'
+
+async def _answerFrame(service, header, payload):
+    code, id = int(header['op']), int(header['id'])
+    try:
+        if not 1 <= code <= len(OPS):
+            raise ServiceError(F"unknown op {code}")
+        op = OPS[code - 1]
+        return _frame(code, id, formatFrame(op, await service.submit(op, parseFrame(op, payload))))
+    except Exception as error:
+        return _frame(code, id, (str(error) or type(error).__name__).encode('utf-8'), ERROR)
+
+async def serve(service, path=None, host='127.0.0.1', port=0):
+    """ Starts a server on the Unix socket path or on host and port, returns the asyncio server."""
+    async def connection(reader, writer):
+        answers = set()
+        def send(task):
+            answers.discard(task)
+            if not writer.is_closing(): writer.write(task.result())
+        try:
+            while True:
+                first = await reader.read(1)
+                if not first: break
+                if first == b'{':
+                    answer = _answerLine(service, first + await reader.readline())
+                else:
+                    answer = _answerFrame(service, *await _readFrame(reader, first))
+                task = asyncio.ensure_future(answer) # the next request is read meanwhile
+                answers.add(task)
+                task.add_done_callback(send)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        if answers:
+            await asyncio.wait(answers)
+        writer.close()
+    if path is not None:
+        return await asyncio.start_unix_server(connection, path)
+    return await asyncio.start_server(connection, host, port)
+
+# ---------------------------------------------------------------------------------------
+
+class Client:
+    """ A client of the service, e.g. for a tool or a notebook; requests may be sent concurrently.
+    client = await Client.connect(path); await client.call('rate', deal=index); await client.fetch(DD, index)
+    """
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._id = 0
+        self._pending = {} # id -> (op, future)
+        self._task = asyncio.ensure_future(self._receive())
+
+    @staticmethod
+    async def connect(path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return Client(reader, writer)
+
+    async def close(self):
+        """ Waits for the pending answers and closes the connection."""
+        self._writer.write_eof()
+        await self._task
+        self._writer.close()
+
+    async def _receive(self):
+        reader = self._reader
+        try:
+            while True:
+                first = await reader.read(1)
+                if not first: break
+                if first == b'{':
+                    answer = json.loads(first + await reader.readline())
+                    op, future = self._pending.pop(answer.pop('id'))
+                    if 'error' in answer:
+                        future.set_exception(ServiceError(answer['error']))
+                    else:
+                        future.set_result(answer)
+                else:
+                    header, payload = await _readFrame(reader, first)
+                    op, future = self._pending.pop(int(header['id']))
+                    if header['status']:
+                        future.set_exception(ServiceError(payload.decode('utf-8')))
+                    else:
+                        future.set_result(_parseAnswer(op, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        for op, future in self._pending.values():
+            future.set_exception(ConnectionError("the service closed the connection"))
+        self._pending.clear()
+
+    def _request(self, op):
+        self._id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._id] = (op, future)
+        return self._id, future
+
+    async def call(self, op, **fields):
+        """ A JSON request, returns the answer as a dictionary without the id."""
+        id, future = self._request(op)
+        self._writer.write(json.dumps({'id': id, 'op': op, **fields}).encode('utf-8') + b'\n')
+        await self._writer.drain()
+        return await future
+
+    async def fetch(self, op, argument):
+        """ A binary request for a deal number (decode, rate, dd) or an array of 52 seats (encode).
+        Returns the seats, the deal number, the rating record or the table.
+        """
+        id, future = self._request(op)
+        if op == ENCODE:
+            payload = np.asarray(argument, dtype=np.uint8).tobytes()
+        else:
+            payload = SquashedBatch.fromInt([argument]).tobytes()
+        self._writer.write(_frame(OPS.index(op) + 1, id, payload))
+        await self._writer.drain()
+        return await future
+
+def _parseAnswer(op, payload):
+    """ The result of a binary answer."""
+    if op == DECODE:
+        return np.frombuffer(payload, dtype=np.uint8)
+    if op == ENCODE:
+        return SquashedBatch.toInt(np.frombuffer(payload, dtype=SquashedBatch.DEAL))[0]
+    if op == RATE:
+        return np.frombuffer(payload, dtype=RATING)[0]
+    return [list(payload[row:row + _POSITIONS]) for row in range(0, len(payload), _POSITIONS)]
+
+# ============================================================================
+if __name__ == '__main__':
+    import os
+    import random
+    import tempfile
+    import time
+
+    async def main(clients=50, requests=200, deals=500):
+        rng = random.Random(0)
+        indices = SquashedOrder.sample(deals, rng)
+        service = Service()
+        batcher = asyncio.ensure_future(service.run())
+        path = os.path.join(tempfile.mkdtemp(), 'bridge.sock')
+        server = await serve(service, path=path)
+        tcp = await serve(service)
+
+        async def tool(number):
+            # a tool asks for decoding and rating of some deals, all requests at once
+            client = await Client.connect(path)
+            local = random.Random(number)
+            chosen = [local.choice(indices) for _ in range(requests)]
+            answers = await asyncio.gather(*( client.call(DECODE if i % 2 else RATE, deal=str(index))
+                                              for i, index in enumerate(chosen) ))
+            await client.close()
+            return chosen, answers
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(tool(number) for number in range(clients)))
+        elapsed = time.perf_counter() - start
+        for chosen, answers in results:
+            for i, (index, answer) in enumerate(zip(chosen, answers)):
+                board = Bridge.Board(1, index)
+                if i % 2:
+                    assert answer['deal'] == Pbn.formatDeal(board)
+                else:
+                    assert [rating['hcp'] for rating in answer['rating']] == [board[p].rating.hcp for p in Bridge.Positions]
+                    assert [rating['type'] for rating in answer['rating']][0] == board[Bridge.NORTH].type.type
+        stats = service.stats()
+        total = clients * requests
+        print(F"{total} requests of {clients} clients in {elapsed:.2f}s ({total / elapsed:.0f}/s), "
+              F"{stats['batches']} batches, {stats['computed']} deals computed")
+        assert sum(stats['computed'].values()) <= 2 * deals and sum(stats['batches'].values()) < total / 10
+
+        client = await Client.connect(host='127.0.0.1', port=tcp.sockets[0].getsockname()[1])
+        index = indices[0]
+        board = Bridge.Board(1, index)
+        assert int((await client.call(ENCODE, deal=Pbn.formatDeal(board, Bridge.WEST)))['index']) == index
+        seats = await client.fetch(DECODE, index)
+        assert (seats == SquashedBatch.seq52_13(SquashedBatch.fromInt([index]))[0]).all()
+        assert await client.fetch(ENCODE, seats) == index
+        record = await client.fetch(RATE, index)
+        assert record['loser'].tolist() == [board[p].rating.loser for p in Bridge.Positions]
+        answer = await client.call(SCORE, contract='4SX', declarer='S', tricks=9, vulnerable='NS')
+        assert answer['value'] == Scoring.value(Bridge.Contract(Bridge.SOUTH, 4, Bridge.SPADES, Bridge.DOUBLED), -1, Bridge.VUL_NS)
+        for bad in [ {'op': DECODE, 'deal': str(SquashedOrder.max52)}, {'op': ENCODE, 'deal': 'N:AK.. - - -'},
+                     {'op': SCORE, 'contract': '8S', 'declarer': 'S', 'tricks': 9}, {'op': 'solve'} ]:
+            try:
+                await client.call(**bad)
+                assert False, bad
+            except ServiceError as error:
+                print(F"{bad['op']:7} {error}")
+
+        # double dummy: one table for equivalent deals, solved once for all requests
+        suits = [Bridge.Hand(cards=range(13 * suit, 13 * suit + 13)) for suit in range(4)]
+        simple = SquashedOrder.index52_13([hand.cards for hand in suits])
+        rotated = SquashedOrder.index52_13([hand.cards for hand in suits[1:] + suits[:1]])
+        start = time.perf_counter()
+        tables = await asyncio.gather(*( client.fetch(DD, simple) if i % 2 else client.call(DD, deal=rotated)
+                                         for i in range(20) ))
+        print(F"20 double dummy requests: {time.perf_counter() - start:.2f}s, {service.computed[DD]} solved")
+        assert tables[1] == DoubleDummy.table(suits) and tables[0]['dd'] == DoubleDummy.table(suits[1:] + suits[:1])
+        assert service.computed[DD] == 1
+        print(json.dumps((await client.call('stats'))['stats']['caches']))
+        await client.close()
+
+        for listening in (server, tcp):
+            listening.close()
+            await listening.wait_closed()
+        batcher.cancel()
+
+    asyncio.run(main())
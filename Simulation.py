@@ -0,0 +1,302 @@
+"""
+Simulation module
+simulates the unknown hands of a deal when one or two hands are known
+
+Only the unseen cards are dealt: with 26 unseen cards a layout is a number
+0..choose(26, 13)-1, the first unknown hand is the sequence (SquashedOrder.mask)
+of 13 of the unseen cards, the second gets the rest; with 39 unseen cards a
+layout is i39 * choose(26, 13) + i26, numbered as the last two hands of
+SquashedOrder.seq52_13. The layouts are sampled uniformly or enumerated
+(SquashedOrder.iterMasks), the layouts not matching the constraints on the
+unknown hands (e.g. DealGenerator.Constraint from the bidding) are skipped;
+sampling gives up after ATTEMPTS layouts per matching layout wanted.
+
+evaluate(hands) is called with the 4 hands (in the order of Positions) of
+every matching layout and returns a number or a dictionary name -> number,
+e.g. the double dummy tricks per lead. The values are aggregated in Stats
+(count, mean, deviation, min, max and the frequency of every value) per name,
+per chunk of layouts on a pool of worker processes and merged in order, so
+the results only depend on the seed.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import collections
+import itertools
+import math
+import multiprocessing
+import random
+
+import Bridge
+import SquashedOrder
+from SquashedOrder import choose
+
+ATTEMPTS = 1000 # layouts sampled per matching layout wanted, at most
+
+# ---------------------------------------------------------------------------------------
+
+class Stats:
+    """ Streaming statistics of numbers: count, mean, variance (Welford), min, max, frequencies."""
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max', 'values')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.values = collections.Counter()
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.values[value] += 1
+
+    def merge(self, other):
+        """ Adds the numbers of other (Chan et al.)."""
+        if not other.count: return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.values.update(other.values)
+        return self
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def deviation(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def error(self): # standard error of the mean
+        return self.deviation / math.sqrt(self.count) if self.count else 0.0
+
+    def frequency(self, predicate):
+        """ The share of the numbers for which predicate(number) is true."""
+        return sum(n for value, n in self.values.items() if predicate(value)) / self.count if self.count else 0.0
+
+    def __str__(self):
+        return F"{self.mean:8.3f} ± {self.error:.3f}  ({self.count}, {self.min}..{self.max})"
+
+def _merge(summary, other):
+    for name, stats in other.items():
+        summary.setdefault(name, Stats()).merge(stats)
+    return summary
+
+# ---------------------------------------------------------------------------------------
+
+_work = None # the simulation within a worker process
+
+def _init(simulation):
+    global _work
+    _work = simulation
+
+def _chunk(number):
+    """ Evaluates one chunk, returns the number of layouts and the statistics by name."""
+    return _work._evaluate(_work._layouts(number))
+
+class Simulation:
+    """ Simulates the unknown hands, given known (position -> Hand, complete hands).
+    constraints: picklable callables taking the 4 hands, e.g. DealGenerator.Constraint.
+    evaluate: a picklable callable taking the 4 hands, returning a number or name -> number.
+    processes = 0 evaluates within the calling process.
+    """
+    def __init__(self, known, evaluate, constraints=(), seed=0, processes=None, chunk=1000):
+        self.known = [known.get(position) for position in Bridge.Positions]
+        if not 1 <= len(known) <= 2 or not all(hand for hand in known.values()):
+            raise ValueError("one or two complete hands must be known")
+        seen = 0
+        for hand in known.values():
+            if seen & hand.bits: raise ValueError("a card is in two known hands")
+            seen |= hand.bits
+        self.unseen = ((1 << len(Bridge.CARDS)) - 1) ^ seen
+        self.unknown = [position.index for position, hand in zip(Bridge.Positions, self.known) if hand is None]
+        self.size = choose(26, 13) * (choose(39, 13) if len(self.unknown) == 3 else 1) # layouts
+        self.evaluate = evaluate
+        self.constraints = list(constraints)
+        self.seed = seed
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.chunk = chunk
+        self.exhaustive = False
+        self.dealt = 0
+        self.accepted = 0
+
+    def hands(self, layout):
+        """ The 4 hands of a layout number."""
+        if len(self.unknown) == 2:
+            return self._hands([SquashedOrder.mask(layout, 26, 13)])
+        i39, i26 = divmod(layout, choose(26, 13))
+        return self._hands([SquashedOrder.mask(i39, 39, 13), SquashedOrder.mask(i26, 26, 13)])
+
+    def _hands(self, masks):
+        """ The 4 hands of the sequences (relative masks) of the unknown hands but the last."""
+        hands = list(self.known)
+        free = self.unseen
+        for position, mask in zip(self.unknown, masks):
+            bits = SquashedOrder.expand(mask, free)
+            hands[position] = Bridge.Hand(bits=bits)
+            free ^= bits
+        hands[self.unknown[-1]] = Bridge.Hand(bits=free)
+        return hands
+
+    def _layouts(self, number):
+        """ The sequences (relative masks) of the layouts of chunk number."""
+        if not self.exhaustive:
+            rng = random.Random(F"{self.seed}:{number}")
+            if len(self.unknown) == 2:
+                return [(SquashedOrder.mask(rng.randrange(self.size), 26, 13),) for _ in range(self.chunk)]
+            return [ tuple(SquashedOrder.mask(i, n, 13)
+                           for i, n in zip(divmod(rng.randrange(self.size), choose(26, 13)), (39, 26)))
+                     for _ in range(self.chunk) ]
+        start, stop = number * self.chunk, min((number + 1) * self.chunk, self.size)
+        if len(self.unknown) == 2:
+            return ((mask,) for mask in SquashedOrder.iterMasks(26, 13, start, stop))
+        return self._layouts39(start, stop)
+
+    def _layouts39(self, start, stop):
+        """ The layouts start..stop-1 of 39 cards, skipping the layouts of a first hand
+        which doesn't match the constraints on its position (e.g. DealGenerator.Constraint).
+        """
+        first, low = divmod(start, choose(26, 13))
+        last, high = divmod(stop - 1, choose(26, 13))
+        position = self.unknown[0]
+        prune = [c for c in self.constraints if getattr(c, 'position', None) == position]
+        hands = [None] * len(Bridge.Positions)
+        for i39, mask in enumerate(SquashedOrder.iterMasks(39, 13, first, last + 1), start=first):
+            if prune:
+                hands[position] = Bridge.Hand(bits=SquashedOrder.expand(mask, self.unseen))
+                if not all(constraint(hands) for constraint in prune): continue
+            for inner in SquashedOrder.iterMasks(26, 13, low if i39 == first else 0,
+                                                 high + 1 if i39 == last else choose(26, 13)):
+                yield (mask, inner)
+
+    def _evaluate(self, layouts):
+        """ Evaluates the matching layouts, returns their number and the statistics by name."""
+        dealt, summary = 0, {}
+        for masks in layouts:
+            dealt += 1
+            hands = self._hands(masks)
+            if not all(constraint(hands) for constraint in self.constraints): continue
+            values = self.evaluate(hands)
+            for name, value in (values.items() if isinstance(values, dict) else [(None, values)]):
+                stats = summary.get(name)
+                if stats is None:
+                    stats = summary[name] = Stats()
+                stats.add(value)
+        return dealt, summary
+
+    def _chunks(self, count):
+        """ Yields the results of count chunks (None: endless) in order."""
+        numbers = range(count) if count is not None else itertools.count()
+        if self.processes < 1:
+            _init(self)
+            for number in numbers:
+                yield _chunk(number)
+            return
+        with multiprocessing.Pool(self.processes, _init, (self,)) as pool:
+            pending = collections.deque()
+            for number in numbers:
+                pending.append(pool.apply_async(_chunk, (number,)))
+                if len(pending) >= 2 * self.processes:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def stream(self, count=None, attempts=ATTEMPTS):
+        """ Yields the statistics (name -> Stats, a single number has the name None)
+        after every chunk: of count matching layouts sampled or,
+        with count None, of all layouts (enumerated in order).
+        Sampling stops after attempts * count layouts, with fewer matching layouts,
+        and raises ValueError if none of them matches the constraints.
+        """
+        self.exhaustive = count is None
+        chunks = self._chunks(-(-self.size // self.chunk) if self.exhaustive else None)
+        summary, dealt = {}, 0
+        try:
+            for part in chunks:
+                dealt += part[0]
+                self.dealt += part[0]
+                _merge(summary, part[1])
+                self.accepted = max((stats.count for stats in summary.values()), default=0)
+                yield summary
+                if count is None: continue
+                if self.accepted >= count: return
+                if dealt >= attempts * count:
+                    if not self.accepted:
+                        raise ValueError(F"no layout of {dealt} matches the constraints")
+                    return
+        finally:
+            chunks.close()
+
+    def run(self, count=None, attempts=ATTEMPTS):
+        """ The statistics of count matching layouts (None: all layouts)."""
+        summary = {}
+        for summary in self.stream(count, attempts): pass
+        return summary
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+    import DealGenerator
+
+    def east(hands): # the spades and the hcp of East
+        return {'east spades': hands[1].type.type[Bridge.SPADES.index], 'east hcp': hands[1].rating.hcp}
+
+    rng = random.Random(3)
+    cards = rng.sample(Bridge.CARDS, 52)
+    north, south = Bridge.Hand(cards=cards[:13]), Bridge.Hand(cards=cards[13:26])
+    print(F"N: {north}\nS: {south}")
+    known = {Bridge.NORTH: north, Bridge.SOUTH: south}
+
+    # without constraints East expects half of the unseen spades and hcp
+    start = time.perf_counter()
+    sampled = Simulation(known, east, seed=1, processes=0, chunk=2000).run(10000)
+    print(F"{sampled['east hcp'].count} samples: {time.perf_counter() - start:.1f}s")
+    exact = { 'east spades': (13 - north.type.type[Bridge.SPADES.index] - south.type.type[Bridge.SPADES.index]) / 2,
+              'east hcp': (40 - north.rating.hcp - south.rating.hcp) / 2 }
+    for name, stats in sampled.items():
+        print(F"{name:12} {stats}   exact {exact[name]:.3f}")
+        assert abs(stats.mean - exact[name]) < 5 * stats.error
+
+    # the layouts are numbered as SquashedOrder.mask of the East hand
+    simulation = Simulation(known, east, processes=0, chunk=1000)
+    simulation.exhaustive = True
+    for layout, masks in zip(range(3000, 4000), simulation._layouts(3)):
+        assert simulation.hands(layout) == simulation._hands(masks)
+
+    opening = DealGenerator.Constraint(Bridge.EAST, hcp=(12, 21))
+    sampled = Simulation(known, east, [opening], seed=1, processes=0, chunk=1000).run(2000)
+    assert sampled['east hcp'].min >= 12
+    print(F"east opens:  {sampled['east hcp']}")
+    again = Simulation(known, east, [opening], seed=1, processes=1, chunk=1000).run(2000)
+    assert again['east spades'].values == sampled['east spades'].values
+    try:
+        Simulation(known, east, [DealGenerator.Constraint(Bridge.EAST, hcp=(38, 40))], processes=0).run(10, 100)
+        assert False
+    except ValueError as error:
+        print(error)
+
+    # one known hand: the layouts of 39 cards are enumerated in the order of their numbers
+    simulation = Simulation({Bridge.NORTH: north}, lambda hands: hands[1].rating.hcp, processes=0, chunk=500)
+    simulation.exhaustive = True
+    for layout, masks in zip(range(1000, 1500), simulation._layouts(2)):
+        assert simulation.hands(layout) == simulation._hands(masks)
+    east = DealGenerator.Constraint(Bridge.EAST, hcp=(20, 37))
+    simulation = Simulation({Bridge.NORTH: north}, lambda hands: hands[1].rating.hcp, [east], processes=0,
+                            chunk=choose(26, 13) * 10) # the first 10 East hands have no 20 hcp
+    simulation.exhaustive = True
+    dealt, summary = simulation._evaluate(simulation._layouts(0))
+    assert dealt == 0 and not summary
@@ -0,0 +1,242 @@
+"""
+SquashedBatch module
+implements the deal numbers of SquashedOrder for whole batches of deals (numpy)
+
+A batch of deals is either an (N, 52) array of seats (seats[i, card] = 0..3)
+or an array of N deal numbers with dtype DEAL (12 byte records).
+Large batches are converted CHUNK deals at a time, so the temporary arrays stay small.
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import numpy as np
+import SquashedOrder
+
+# a deal number is < 2**96: 64 low bits and 32 high bits, 12 bytes per deal
+DEAL = np.dtype([('lo', '<u8'), ('hi', '<u4')])
+
+BINOM = np.array(SquashedOrder.BINOM, dtype=np.uint64)
+
+C13 = SquashedOrder.max13                 # choose(52, 13)
+C39 = SquashedOrder.max39 // SquashedOrder.max26  # choose(39, 13)
+C26 = SquashedOrder.max26                 # choose(26, 13)
+
+# the 96 bit arithmetic works on 6 limbs with 16 bits each,
+# so that limb * factor (< 2**34) + carry fits into an uint64
+_LIMBS = 6
+_BITS = np.uint64(16)
+_MASK = np.uint64(0xFFFF)
+
+CHUNK = 1 << 14 # deals converted at once, bounds the temporary arrays
+
+# ---------------------------------------------------------------------------------------
+
+def _limbs(value):
+    """ Splits an uint64 array into limbs."""
+    limbs = []
+    for _ in range(_LIMBS):
+        limbs.append(value & _MASK)
+        value = value >> _BITS
+    return limbs
+
+def _mulAdd(limbs, factor, add):
+    """ limbs = limbs * factor + add, in place."""
+    factor = np.uint64(factor)
+    carry = add
+    for j in range(_LIMBS):
+        t = limbs[j] * factor + carry
+        limbs[j] = t & _MASK
+        carry = t >> _BITS
+
+def _divMod(limbs, divisor):
+    """ limbs = limbs // divisor, in place; returns the remainder."""
+    divisor = np.uint64(divisor)
+    remainder = np.zeros_like(limbs[0])
+    for j in range(_LIMBS - 1, -1, -1):
+        t = (remainder << _BITS) | limbs[j]
+        limbs[j] = t // divisor
+        remainder = t % divisor
+    return remainder
+
+def _pack(limbs):
+    deals = np.empty(len(limbs[0]), dtype=DEAL)
+    deals['lo'] = limbs[0] | limbs[1] << _BITS | limbs[2] << np.uint64(32) | limbs[3] << np.uint64(48)
+    deals['hi'] = limbs[4] | limbs[5] << _BITS
+    return deals
+
+def _unpack(deals):
+    lo = deals['lo'].astype(np.uint64)
+    hi = deals['hi'].astype(np.uint64)
+    return _limbs(lo)[:4] + _limbs(hi)[:2]
+
+# ---------------------------------------------------------------------------------------
+
+def fromInt(indices):
+    """ Converts python ints (deal numbers) to an array of DEAL records."""
+    deals = np.empty(len(indices), dtype=DEAL)
+    deals['lo'] = [index & 0xFFFFFFFFFFFFFFFF for index in indices]
+    deals['hi'] = [index >> 64 for index in indices]
+    return deals
+
+def toInt(deals):
+    """ Converts an array of DEAL records to a list of python ints (deal numbers)."""
+    return [int(hi) << 64 | int(lo) for lo, hi in zip(deals['lo'].tolist(), deals['hi'].tolist())]
+
+def fromSets(sets):
+    """ Converts deals given as 4 lists of cards each to an (N, 52) array of seats."""
+    seats = np.empty((len(sets), 52), dtype=np.uint8)
+    for i, deal in enumerate(sets):
+        for seat, cards in enumerate(deal):
+            seats[i, list(cards)] = seat
+    return seats
+
+def toSets(seats):
+    """ Converts an (N, 52) array of seats to deals given as 4 lists of cards each."""
+    return [[np.flatnonzero(row == seat).tolist() for seat in range(4)] for row in seats]
+
+# ---------------------------------------------------------------------------------------
+
+_PATTERN = np.repeat(np.arange(4, dtype=np.uint8), 13) # the seats of a deal, sorted
+_BOUNDS = [0, 12, 13, 25, 26, 38, 39, 51]
+_K = np.arange(1, 14)                                    # 1..13 for the members in order
+
+def _index(positions):
+    """ Sequence numbers of the (N, 13) ascending positions of the members."""
+    return BINOM[positions, _K].sum(axis=1, dtype=np.uint64)
+
+def _index52_13(seats):
+    order = np.argsort(seats, axis=1, kind='stable') # the cards of A, B, C, D, ascending each
+    # the sorted seats are 13 times 0, 1, 2, 3 iff they change at the right places
+    if not (np.take_along_axis(seats, order[:, _BOUNDS], axis=1) == _PATTERN[_BOUNDS]).all():
+        raise ValueError("every seat must have 13 cards")
+    A, B, C = order[:, :13], order[:, 13:26], order[:, 26:39]
+    # the position of a card among the eligible cards: the card less the cards of the seats before
+    before = np.cumsum(seats == 0, axis=1, dtype=np.int8)
+    iB = _index(B - np.take_along_axis(before, B, axis=1))
+    before = np.cumsum(seats <= 1, axis=1, dtype=np.int8)
+    iC = _index(C - np.take_along_axis(before, C, axis=1))
+    limbs = _limbs(_index(A))
+    _mulAdd(limbs, C39, iB)
+    _mulAdd(limbs, C26, iC)
+    return _pack(limbs)
+
+def index52_13(seats):
+    """Computes the deal numbers for an (N, 52) array of seats, CHUNK deals at a time."""
+    seats = np.asarray(seats, dtype=np.uint8)
+    assert seats.ndim == 2 and seats.shape[1] == 52
+    deals = np.empty(len(seats), dtype=DEAL)
+    for start in range(0, len(seats), CHUNK):
+        deals[start:start + CHUNK] = _index52_13(seats[start:start + CHUNK])
+    return deals
+
+_COLUMNS = [np.ascontiguousarray(BINOM[:, k]) for k in range(14)] # nondecreasing in n
+
+def _members(index, n):
+    """ The (N, 13) ascending positions (0..n-1) of the sequences of length 13 for the sequence numbers:
+    the largest x with choose(x, k) <= index is the k-th member, for k = 13..1.
+    """
+    members = np.empty((len(index), 13), dtype=np.intp)
+    for k in range(13, 0, -1):
+        x = np.searchsorted(_COLUMNS[k][:n], index, side='right') - 1
+        members[:, k - 1] = x
+        index = index - _COLUMNS[k][x]
+    return members
+
+def _rest(seats, count):
+    """ The (N, count) ascending cards still with seat 3."""
+    rows = np.arange(0, seats.size, 52)[:, np.newaxis]
+    return np.flatnonzero(seats == 3).reshape(len(seats), count) - rows
+
+def _seq52_13(deals):
+    limbs = _unpack(deals)
+    i26 = _divMod(limbs, C26)
+    i39 = _divMod(limbs, C39)
+    i52 = limbs[0] | limbs[1] << _BITS | limbs[2] << np.uint64(32) | limbs[3] << np.uint64(48)
+    if (limbs[4] | limbs[5]).any() or (i52 >= np.uint64(C13)).any():
+        raise ValueError("deal numbers must be below SquashedOrder.max52")
+    seats = np.full((len(deals), 52), 3, dtype=np.uint8)
+    np.put_along_axis(seats, _members(i52, 52), 0, axis=1)
+    np.put_along_axis(seats, np.take_along_axis(_rest(seats, 39), _members(i39, 39), axis=1), 1, axis=1)
+    np.put_along_axis(seats, np.take_along_axis(_rest(seats, 26), _members(i26, 26), axis=1), 2, axis=1)
+    return seats
+
+def seq52_13(deals):
+    """Computes the (N, 52) array of seats for an array of DEAL records, CHUNK deals at a time."""
+    deals = np.asarray(deals, dtype=DEAL).reshape(-1)
+    seats = np.empty((len(deals), 52), dtype=np.uint8)
+    for start in range(0, len(deals), CHUNK):
+        seats[start:start + CHUNK] = _seq52_13(deals[start:start + CHUNK])
+    return seats
+
+def _add(limbs, value):
+    """ limbs = limbs + value (python int), in place."""
+    carry = np.zeros_like(limbs[0])
+    for j in range(_LIMBS):
+        t = limbs[j] + np.uint64((value >> (16 * j)) & 0xFFFF) + carry
+        limbs[j] = t & _MASK
+        carry = t >> _BITS
+
+def sample(count, seed=None, start=0, stop=SquashedOrder.max52):
+    """ Draws count uniform deal numbers from start..stop-1 (default: all deals).
+    The same seed gives the same deals, seed may also be a numpy Generator.
+    """
+    rng = np.random.default_rng(seed)
+    size = stop - start
+    assert 0 < size and stop <= 1 << 96
+    bits = (size - 1).bit_length()
+    maxLo = np.uint64(size & 0xFFFFFFFFFFFFFFFF)
+    maxHi = np.uint32(size >> 64)
+    parts, missing = [], count
+    while missing > 0:
+        # draw bits random bits and reject the numbers >= size (less than half)
+        draw = 2 * missing + 16
+        lo = rng.integers(0, 1 << 64, size=draw, dtype=np.uint64)
+        hi = rng.integers(0, 1 << 32, size=draw, dtype=np.uint32)
+        if bits < 64:
+            lo &= np.uint64((1 << bits) - 1)
+            hi[:] = 0
+        else:
+            hi &= np.uint32((1 << (bits - 64)) - 1)
+        accept = (hi < maxHi) | (hi == maxHi) & (lo < maxLo)
+        deals = np.empty(int(accept.sum()), dtype=DEAL)
+        deals['lo'] = lo[accept]
+        deals['hi'] = hi[accept]
+        parts.append(deals[:missing])
+        missing -= len(parts[-1])
+    deals = np.concatenate(parts) if parts else np.empty(0, dtype=DEAL)
+    if start:
+        limbs = _unpack(deals)
+        _add(limbs, start)
+        deals = _pack(limbs)
+    return deals
+
+def sampleShard(count, number, shards, seed=None):
+    """ Draws count uniform deal numbers within shard number (0..shards-1) of all deals,
+    seeded from seed and number, so every shard is reproducible on its own (seed None: random).
+    """
+    span = SquashedOrder.shard(number, shards)
+    entropy = None if seed is None else np.random.SeedSequence([number, shards, seed])
+    return sample(count, entropy, span.start, span.stop)
+
+# ============================================================================
+if __name__ == '__main__':
+    import random
+    import time
+
+    rng = random.Random(0)
+    count = 100000
+    indices = [rng.randrange(SquashedOrder.max52) for _ in range(count)]
+    deals = fromInt(indices)
+
+    start = time.perf_counter()
+    seats = seq52_13(deals)
+    print(F"seq52_13:   {count / (time.perf_counter() - start):10.0f} deals/s")
+    start = time.perf_counter()
+    again = index52_13(seats)
+    print(F"index52_13: {count / (time.perf_counter() - start):10.0f} deals/s")
+
+    assert toInt(again) == indices
+    assert toSets(seats[:100]) == [SquashedOrder.seq52_13(i) for i in indices[:100]]
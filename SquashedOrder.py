@@ -9,6 +9,7 @@ __version__ = '0.5'
 __author__ = "Michael Sube"
 
 import math
+import random
 
 #   choose(n-1,k) = choose(n,k) / n * (n-k)
 #   choose(n-1,k-1) = choose(n,k) / n * k
@@ -16,82 +17,309 @@ import math
 #   n! / (n-k)! / k! = n! / (n-a)! / a! * (n-a)! / (n-a-k+a)! / (k-a) !
 #                    = n!          / a!          / (n-k)!     / (k-a) !
 
+MAXN = 52
+
+# Pascal triangle, BINOM[n][k] = choose(n, k) for 0 <= n, k <= MAXN (0 if k > n)
+BINOM = [[0] * (MAXN + 1) for n in range(MAXN + 1)]
+for n in range(MAXN + 1):
+    BINOM[n][0] = 1
+    for k in range(1, n + 1):
+        BINOM[n][k] = BINOM[n - 1][k - 1] + BINOM[n - 1][k]
+
 def choose(n, k):
     """ Computes the binomial coefficient."""
+    if 0 <= k <= MAXN and 0 <= n <= MAXN:
+        return BINOM[n][k]
     return 0 if n < k else math.factorial(n) // math.factorial(n - k) // math.factorial(k)
 
+max13 = choose(52, 13)
 max26 = choose(26, 13)
 max39 = choose(39, 13) * max26
+max52 = max13 * max39   # number of deals
 
 def index(seq):
     """Computes the sequence number for a given sequence.
     seq must be in ascending order.
     """
-    return sum(choose(x, i) for i, x in enumerate(seq, start=1))
+    result = 0
+    for i, x in enumerate(seq, start=1):
+        result += BINOM[x][i]
+    return result
 
 def index52_13(sets):
     """Computes the sequence number for a sequence 0..51 splitted into 4 groups of 13 elements ."""
     assert len(sets) in [3,4]
     assert all(len(set) == 13 for set in sets)
-    assert all(0 <= min(set) and max(set) < 52 for set in sets)
-    A = sorted(sets[0]) # 0..51
-    B = sorted(sets[1]) # 0..51
-    C = sorted(sets[2]) # 0..51
+    # membership as bit masks, the sets don't need to be sorted
+    A, B, C = 0, 0, 0
+    for element in sets[0]: A |= 1 << element
+    for element in sets[1]: B |= 1 << element
+    for element in sets[2]: C |= 1 << element
+    assert (A | B | C) >> 52 == 0
+    # B is numbered within 0..38 (without A), C within 0..25 (without A and B)
     a, b, c = 0, 0, 0
+    iA, iB, iC = 0, 0, 0
     for element in range(52):
-        if a < 13 and element == A[a]:
+        if A >> element & 1:
             a += 1
-        elif b < 13 and element == B[b]:
-            B[b] -= a
+            iA += BINOM[element][a]
+        elif B >> element & 1:
             b += 1
-        elif c < 13 and element == C[c]:
-            C[c] -= a + b
+            iB += BINOM[element - a][b]
+        elif C >> element & 1:
             c += 1
-    assert min(A) >= 0 and min(B) >= 0 and min(C) >= 0
-    assert max(A) < 52 and max(B) < 39 and max(C) < 26
-    return index(A) * max39 + index(B) * max26 + index(C)
+            iC += BINOM[element - a - b][c]
+    assert a == 13 and b == 13 and c == 13 # disjoint sets
+    return iA * max39 + iB * max26 + iC
+
+def mask(index, n, l):
+    """Computes the bit mask of the sequence of length l from a given sequence number."""
+    result = 0
+    for x in range(n - 1, -1, -1):
+        if not index: # the remaining elements are 0..l-1
+            return result | ((1 << l) - 1)
+        c = BINOM[x][l]
+        if c <= index: # x is included
+            index -= c
+            result |= 1 << x
+            l -= 1
+    return result
 
 def seq(index, n, l):
     """Computes a sequence of length l from a given sequence number."""
-    set = []
-    c = choose(n - 1, l)
-    for n in range(n - 1, 0, -1):
-        if index < c: # n is included
-            c = (c * (n - l)) // n
-            continue
-        # n is not included
-        set.append(n)
-        index -= c
-        c = (c * l) // n
-        l -= 1
-    set = [e for e in range(l)] + sorted(set) # add missing numbers
-    return sorted(set)
+    set = list(range(l))
+    for x in range(n - 1, -1, -1):
+        if not index: # the remaining elements are 0..l-1
+            break
+        c = BINOM[x][l]
+        if c <= index: # x is included
+            index -= c
+            l -= 1
+            set[l] = x
+    return set
 
 def seq52_13(index):
     """Computes a sequence 0..51 splitted into 4 groups with 13 elements from a given sequence number."""
     i52, i39 = divmod(index, max39)
     i39, i26 = divmod(i39, max26)
-    A = seq(i52, 52, 13)
-    B = seq(i39, 39, 13)
-    C = seq(i26, 26, 13)
-    D = []
-    a, b, c = 0, 0, 0
+    mA = mask(i52, 52, 13)
+    mB = mask(i39, 39, 13) # numbered without A
+    mC = mask(i26, 26, 13) # numbered without A and B
+    A, B, C, D = [], [], [], []
     for element in range(52):
-        if a < 13 and A[a] == element:
-            a += 1
-        elif b < 13 and B[b] == (element - a):
-            B[b] = element
-            b += 1
-        elif c < 13 and C[c] == (element - a - b):
-            C[c] = element
-            c += 1
+        if mA & 1:
+            A.append(element)
         else:
-            D.append(element)
+            if mB & 1:
+                B.append(element)
+            else:
+                if mC & 1:
+                    C.append(element)
+                else:
+                    D.append(element)
+                mC >>= 1
+            mB >>= 1
+        mA >>= 1
     sets = [A, B, C, D]
     assert all(len(set) == 13 for set in sets)
-    assert all(0 <= min(set) and max(set) < 52 for set in sets)
     return sets
 
+def shard(number, shards, start=0, stop=max52):
+    """Returns the range of sequence numbers of shard number (0..shards-1).
+    The shards split start..stop-1 into contiguous, disjoint ranges of (almost) equal size.
+    """
+    assert 0 <= number < shards
+    size = stop - start
+    return range(start + size * number // shards, start + size * (number + 1) // shards)
+
+def sample(count, seed=None, start=0, stop=max52):
+    """Draws count uniform sequence numbers from start..stop-1 (default: all deals).
+    The same seed gives the same numbers, seed may also be a random.Random.
+    """
+    rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+    return [start + rng.randrange(stop - start) for _ in range(count)]
+
+def sampleShard(count, number, shards, seed=None):
+    """Draws count uniform sequence numbers of deals within shard number (0..shards-1),
+    seeded from seed and number, so every shard is reproducible on its own (seed None: random).
+    """
+    span = shard(number, shards)
+    return sample(count, None if seed is None else F"{seed}:{number}:{shards}", span.start, span.stop)
+
+# ---------------------------------------------------------------------------------------
+#   successors: the sequence numbers count the sequences in colexicographic order,
+#   which is the numeric order of their bit masks, so the next sequence is the
+#   next larger mask with the same number of bits (Gosper), amortized O(1).
+
+def nextMask(mask):
+    """Computes the bit mask of the sequence with the next sequence number (same number of bits)."""
+    c = mask & -mask
+    r = mask + c
+    return ((r ^ mask) >> (c.bit_length() + 1)) | r
+
+def nextSeq(seq, n):
+    """Computes the sequence with the next sequence number in place, False after the last one.
+    seq must be in ascending order with elements 0..n-1.
+    """
+    l = len(seq)
+    for i in range(l):
+        if seq[i] + 1 < (seq[i + 1] if i + 1 < l else n):
+            seq[i] += 1
+            seq[:i] = range(i)
+            return True
+    return False
+
+def iterMasks(n, l, start=0, stop=None):
+    """Yields the bit masks of the sequences of length l of 0..n-1 with the numbers start..stop-1."""
+    stop = choose(n, l) if stop is None else min(stop, choose(n, l))
+    if start >= stop: return
+    current = mask(start, n, l)
+    for _ in range(stop - start - 1):
+        yield current
+        current = nextMask(current)
+    yield current
+
+def iterSeq(n, l, start=0, stop=None):
+    """Yields the sequences (tuples) of length l of 0..n-1 with the numbers start..stop-1."""
+    stop = choose(n, l) if stop is None else min(stop, choose(n, l))
+    if start >= stop: return
+    current = seq(start, n, l)
+    for _ in range(stop - start):
+        yield tuple(current)
+        nextSeq(current, n)
+
+def _bits(mask):
+    return bin(mask).count('1')
+
+def _expander(free):
+    """Tables expanding a mask relative to the elements of free into the elements, 8 bits a table."""
+    elements = [x for x in range(MAXN) if free >> x & 1]
+    tables = []
+    for chunk in range(0, len(elements), 8):
+        part = elements[chunk:chunk + 8]
+        table = [0] * 256
+        for relative in range(1, 1 << len(part)):
+            low = relative & -relative
+            table[relative] = table[relative ^ low] | 1 << part[low.bit_length() - 1]
+        tables.append(table)
+    return tables
+
+def _compress(mask, free):
+    """The mask relative to the elements of free."""
+    result, bit = 0, 1
+    while free:
+        low = free & -free
+        if mask & low: result |= bit
+        bit <<= 1
+        free ^= low
+    return result
+
+def _first(free, required, k, least):
+    """The smallest mask >= least with required and k elements of free."""
+    allowed = free | required
+    if not least & ~allowed and least & required == required and _bits(least & free) == k:
+        return least
+    for p in range(allowed.bit_length()):
+        if least >> p & 1: continue
+        high = (least >> (p + 1) << (p + 1)) | (1 << p) # differs from least at p first
+        low = (1 << p) - 1
+        need = k - _bits(high & free)
+        spare = free & low
+        if high & ~allowed or (required & ~low) & ~high or need < 0 or _bits(spare) < need: continue
+        for _ in range(need): # the lowest elements
+            bit = spare & -spare
+            high |= bit
+            spare ^= bit
+        return high | (required & low)
+    return None
+
+def _subsets(free, required, k, least=0):
+    """Yields the masks of required and k elements of free in increasing order, from least on."""
+    if k < 0 or k > _bits(free): return
+    if least:
+        least = _first(free, required, k, least)
+        if least is None: return
+    if not k:
+        yield required
+        return
+    tables = _expander(free)
+    s = _compress(least & free, free) if least else (1 << k) - 1
+    limit = 1 << _bits(free)
+    if len(tables) <= 4:
+        t0, t1, t2, t3 = tables + [[0] * 256] * (4 - len(tables))
+        while s < limit:
+            yield required | t0[s & 255] | t1[s >> 8 & 255] | t2[s >> 16 & 255] | t3[s >> 24]
+            c = s & -s
+            r = s + c
+            s = ((r ^ s) >> (c.bit_length() + 1)) | r
+    else:
+        while s < limit:
+            result, rest = required, s
+            for table in tables:
+                result |= table[rest & 255]
+                rest >>= 8
+            yield result
+            c = s & -s
+            r = s + c
+            s = ((r ^ s) >> (c.bit_length() + 1)) | r
+
+def expand(relative, free):
+    """The absolute mask of a mask relative to the elements of free (bit masks):
+    bit i of relative selects the i-th lowest element of free, e.g. a mask(index, n, k)
+    of the n elements left after other sets were taken.
+    """
+    result = 0
+    while relative:
+        low = free & -free
+        if relative & 1: result |= low
+        relative >>= 1
+        free ^= low
+    return result
+
+ALL = (1 << MAXN) - 1
+
+def _masks52_13(index):
+    """The absolute masks of the first three sets of a sequence number."""
+    i52, i39 = divmod(index, max39)
+    i39, i26 = divmod(i39, max26)
+    A = mask(i52, 52, 13)
+    B = expand(mask(i39, 39, 13), ALL ^ A)
+    return A, B, expand(mask(i26, 26, 13), ALL ^ A ^ B)
+
+def iter52_13(start=0, stop=max52, fixed=None, prune=None):
+    """Yields the 4 groups (bit masks) of the sequences 0..51 splitted into 4 groups of 13 elements
+    with the numbers start..stop-1, in order.
+    fixed: bit masks of elements each group must hold, only these sequences are enumerated.
+    prune(masks): called with the first 1, 2 or 3 groups, True skips all sequences starting so.
+    """
+    fixed = list(fixed or [0, 0, 0, 0])
+    assert len(fixed) == 4 and _bits(fixed[0] | fixed[1] | fixed[2] | fixed[3]) == sum(map(_bits, fixed))
+    if start >= stop: return
+    sA, sB, sC = _masks52_13(start)
+    eA, eB, eC = _masks52_13(stop - 1) # the last one
+    f0, f1, f2, f3 = fixed
+    kC = 13 - _bits(f2)
+    for A in _subsets(ALL & ~(f0 | f1 | f2 | f3), f0, 13 - _bits(f0), sA):
+        if A > eA: return
+        if prune and prune((A,)): continue
+        first, end = A == sA, A == eA # B and C start at sB, sC / end at eB, eC
+        rest = ALL ^ A
+        for B in _subsets(rest & ~(f1 | f2 | f3), f1, 13 - _bits(f1), sB if first else 0):
+            if end and B > eB: return
+            if prune and prune((A, B)): continue
+            rest2 = rest ^ B
+            if not kC and not prune: # C is fixed, the fast path for the layouts of two hands
+                if first and B == sB and f2 < sC: continue
+                if end and B == eB and f2 > eC: return
+                yield A, B, f2, rest2 ^ f2
+                continue
+            least = sC if first and B == sB else 0
+            last = eC if end and B == eB else None
+            for C in _subsets(rest2 & ~(f2 | f3), f2, kC, least):
+                if last is not None and C > last: return
+                if prune and prune((A, B, C)): continue
+                yield A, B, C, rest2 ^ C
+
 # ============================================================================
 if __name__ == '__main__':
     def test(l, n=None):
@@ -0,0 +1,270 @@
+"""
+Statistics module
+computes exact distributions of the features of Rating and Type by counting
+
+The share of a suit in the rating (Bridge.SuitRatings) only depends on the
+honors A K D B 10 and on the number of spot cards (2..9), so the holdings of a
+suit are counted as the subsets of the free honors times choose(free spots, k).
+A dynamic program combines the counts of the minor and of the major suits and
+joins both on the number of cards, keeping only the sums the queried features
+need (e.g. the number of aces and queens per hand for the losers).
+Partnerships split every free honor to the first hand, the second hand or the
+rest (3^5 ways) and the spots by two binomials; features which only depend on
+the cards of both hands together are counted as one hand of 26 cards.
+Results are cached per query.
+
+Cards are given as 52 bit masks (Hand.bits): the cards each queried hand holds
+and the cards held by the other hands. The counts are the number of holdings
+(pairs of holdings for a partnership); every holding is completed to the same
+number of deals, so the counts are proportional to the number of deals.
+
+Features:
+  hcp, loser, ds, adjust, dp   as Rating (summed over a partnership, as Rating.__add__)
+  isFlat                        as Type (all hands of a partnership flat)
+  type                          the suit lengths (summed over a partnership)
+  shape                         the suit lengths, descending
+  fit                           the longest (combined) suit
+
+Michael Sube (@msube) 2018
+"""
+
+__version__ = '0.5'
+__author__ = "Michael Sube"
+
+import functools
+import operator
+
+import Bridge
+from SquashedOrder import choose
+
+FEATURES = ('hcp', 'loser', 'ds', 'adjust', 'dp', 'isFlat', 'type', 'shape', 'fit')
+
+# positions of the terms in Bridge.SuitRatings
+HCP, LOSER, DS, ADJUST, DP, ACES, QUEENS, HONORS = range(8)
+
+# terms a feature needs per hand (the value is not linear in them)
+_HAND = { 'loser': (ACES, QUEENS), 'adjust': (HONORS,), 'isFlat': (DP,) }
+# terms a feature only needs summed over the hands
+_SUM = { 'hcp': (HCP,), 'loser': (LOSER,), 'ds': (DS,), 'adjust': (ADJUST,), 'dp': (DP,) }
+# features of a partnership which only depend on the cards of both hands together
+_UNION = {'hcp', 'type', 'shape', 'fit'}
+
+_SUIT = (1 << len(Bridge.RANKS)) - 1
+_SPOTS = (1 << Bridge.TEN) - 1          # 2..9
+_HONORS = _SUIT ^ _SPOTS                # 10 B D K A
+
+def _subsets(mask):
+    """ Yields all subsets of mask."""
+    subset = mask
+    while True:
+        yield subset
+        if not subset: return
+        subset = (subset - 1) & mask
+
+def _spots(mask):
+    return bin(mask & _SPOTS).count('1')
+
+def _share(honors, spots, terms):
+    """ The length and the terms of a holding with honors and a number of spots."""
+    rating = Bridge.SuitRatings[honors | ((1 << spots) - 1)]
+    return (bin(honors).count('1') + spots,) + tuple(rating[term] for term in terms)
+
+@functools.lru_cache(maxsize=None)
+def _suit(fixed, free, terms):
+    """ The holdings of a suit of one hand: (length, terms) -> count."""
+    counts = {}
+    spots = _spots(free)
+    for honors in _subsets(free & _HONORS):
+        for k in range(spots + 1):
+            share = _share((fixed | honors) & _HONORS, _spots(fixed) + k, terms)
+            counts[share] = counts.get(share, 0) + choose(spots, k)
+    return counts
+
+@functools.lru_cache(maxsize=None)
+def _suit2(fixed1, fixed2, free, terms):
+    """ The holdings of a suit of two hands: ((length, terms), (length, terms)) -> count."""
+    counts = {}
+    spots = _spots(free)
+    freeHonors = free & _HONORS
+    for honors1 in _subsets(freeHonors):
+        for honors2 in _subsets(freeHonors ^ honors1):
+            for k1 in range(spots + 1):
+                share1 = _share((fixed1 | honors1) & _HONORS, _spots(fixed1) + k1, terms)
+                for k2 in range(spots - k1 + 1):
+                    share2 = _share((fixed2 | honors2) & _HONORS, _spots(fixed2) + k2, terms)
+                    key = (share1, share2)
+                    counts[key] = counts.get(key, 0) + choose(spots, k1) * choose(spots - k1, k2)
+    return counts
+
+def _project(table, terms, handTerms, sumTerms, lengths):
+    """ Reduces the holdings of a suit to states of the dynamic program.
+    A state is a vector of the number of cards per hand, the hand terms per hand and
+    the summed terms, and the (combined) suit lengths, the longest suit or None,
+    as lengths asks for.
+    """
+    result = {}
+    for shares, count in table.items():
+        totals = [share[0] for share in shares]
+        vector = ( totals + [share[1 + terms.index(t)] for share in shares for t in handTerms]
+                 + [sum(share[1 + terms.index(t)] for share in shares) for t in sumTerms] )
+        key = (sum(totals),) if lengths == 'suits' else sum(totals) if lengths == 'max' else None
+        state = (tuple(vector), key)
+        result[state] = result.get(state, 0) + count
+    return result
+
+def _add(first, second, lengths):
+    """ The state of the holdings of first and second."""
+    return ( tuple(map(operator.add, first[0], second[0])),
+             first[1] + second[1] if lengths == 'suits' else
+             max(first[1], second[1]) if lengths == 'max' else None )
+
+def _combine(first, second, lengths, hands, size):
+    """ One step of the dynamic program: the states of the holdings of two (groups of) suits."""
+    result = {}
+    for state, count in first.items():
+        for other, number in second.items():
+            if any(a + b > size for a, b in zip(state[0][:hands], other[0][:hands])): continue
+            state2 = _add(state, other, lengths)
+            result[state2] = result.get(state2, 0) + count * number
+    return result
+
+def _value(feature, vector, key, hands, handTerms, sumTerms):
+    """ The value of a feature for one hand or for the hands of a partnership."""
+    def terms(t): # per hand
+        offset = hands + handTerms.index(t)
+        return vector[offset:hands + hands * len(handTerms):len(handTerms)]
+    def term(t): # summed
+        if t in sumTerms: return vector[hands + hands * len(handTerms) + sumTerms.index(t)]
+        return sum(terms(t))
+    if feature == 'loser':
+        return term(LOSER) + sum( max(numQ - numA, 0) - (numA > 2) * max(numA - max(numQ, 2), 0)
+                                  for numA, numQ in zip(terms(ACES), terms(QUEENS)) )
+    if feature == 'adjust':
+        return term(ADJUST) + sum(honors // 3 for honors in terms(HONORS))
+    if feature in _SUM: return term(_SUM[feature][0])
+    if feature == 'isFlat': return all(dp < 2 for dp in terms(DP))
+    if feature == 'type': return key
+    if feature == 'shape': return tuple(sorted(key, reverse=True))
+    return key if isinstance(key, int) else max(key) # fit
+
+def _query(features, fixed, others):
+    features = tuple(features)
+    for feature in features:
+        if feature not in FEATURES: raise ValueError(F"unknown feature {feature}")
+    for hand in fixed:
+        if bin(hand).count('1') > len(Bridge.RANKS): raise ValueError("more than 13 cards fixed")
+    known = others
+    for hand in fixed:
+        if known & hand: raise ValueError("a card is fixed twice")
+        known |= hand
+    handTerms = tuple(sorted({t for feature in features for t in _HAND.get(feature, ())}))
+    sumTerms = tuple(sorted({t for feature in features for t in _SUM.get(feature, ())} - set(handTerms)))
+    terms = handTerms + sumTerms
+    lengths = ( 'suits' if {'type', 'shape'} & set(features)
+                else 'max' if 'fit' in features else None )
+    free = ~known
+    size = len(Bridge.RANKS)
+    factor = 1
+    if len(fixed) == 2 and set(features) <= _UNION: # count the partnership as one hand of 26 cards
+        first, second = (bin(hand).count('1') for hand in fixed)
+        factor = choose(2 * size - first - second, size - first) # splits of the free cards
+        fixed, size = (fixed[0] | fixed[1],), 2 * size
+    suits = []
+    for suit in Bridge.Suits:
+        shift = suit.index * len(Bridge.RANKS)
+        masks = [(hand >> shift) & _SUIT for hand in fixed]
+        if len(fixed) == 1:
+            table = {(share,): count for share, count in _suit(masks[0], (free >> shift) & _SUIT, terms).items()}
+        else:
+            table = _suit2(masks[0], masks[1], (free >> shift) & _SUIT, terms)
+        suits.append(_project(table, terms, handTerms, sumTerms, lengths))
+    # the minor and the major suits, joined on the number of cards
+    hands = len(fixed)
+    minors = _combine(suits[0], suits[1], lengths, hands, size)
+    majors = {}
+    for state, count in _combine(suits[2], suits[3], lengths, hands, size).items():
+        majors.setdefault(state[0][:hands], []).append((state, count))
+    states = {}
+    for state, count in minors.items():
+        for other, number in majors.get(tuple(size - total for total in state[0][:hands]), ()):
+            state2 = _add(state, other, lengths)
+            states[state2] = states.get(state2, 0) + count * number
+    counts = {}
+    for (vector, key), count in states.items():
+        values = tuple(_value(feature, vector, key, hands, handTerms, sumTerms) for feature in features)
+        value = values[0] if len(values) == 1 else values
+        counts[value] = counts.get(value, 0) + count * factor
+    return counts
+
+@functools.lru_cache(maxsize=256)
+def hand(features, fixed=0, others=0):
+    """ The exact distribution of the features (a name or a tuple of names) of one hand.
+    fixed: the cards the hand holds, others: the cards of the other hands.
+    Returns a dictionary value -> number of holdings (values are tuples for several features).
+    """
+    return _query((features,) if isinstance(features, str) else features, (fixed,), others)
+
+@functools.lru_cache(maxsize=256)
+def partnership(features, fixed=(0, 0), others=0):
+    """ The exact joint distribution of the features of the two hands of a partnership.
+    fixed: the cards each hand holds, others: the cards of the other hands.
+    Returns a dictionary value -> number of pairs of holdings.
+    """
+    return _query((features,) if isinstance(features, str) else features, tuple(fixed), others)
+
+def probabilities(counts):
+    """ The probability of every value of a distribution."""
+    total = sum(counts.values())
+    return { value: count / total for value, count in sorted(counts.items()) }
+
+def probability(counts, predicate):
+    """ The probability of the values for which predicate(value) is true."""
+    return sum(count for value, count in counts.items() if predicate(value)) / sum(counts.values())
+
+def mean(counts):
+    """ The expected value of a numeric distribution."""
+    return sum(value * count for value, count in counts.items()) / sum(counts.values())
+
+# ============================================================================
+if __name__ == '__main__':
+    import time
+
+    start = time.perf_counter()
+    hcp = hand('hcp')
+    assert sum(hcp.values()) == choose(52, 13)
+    print(F"hcp: mean {mean(hcp):.2f}, P(>= 15) = {probability(hcp, lambda h: h >= 15):.4f}")
+    shapes = probabilities(hand('shape'))
+    for shape in sorted(shapes, key=shapes.get, reverse=True)[:5]:
+        print(F"{shape}: {shapes[shape]:.4f}")
+    both = partnership(('hcp', 'fit'))
+    print(F"N/S 25+ hcp and an 8+ fit: {probability(both, lambda v: v[0] >= 25 and v[1] >= 8):.4f}")
+    print(F"{time.perf_counter() - start:.2f}s")
+
+    # against counting every holding, with most cards fixed
+    import itertools
+    import random
+    rng = random.Random(1)
+    cards = rng.sample(Bridge.CARDS, 52)
+    fixed, others, unknown = cards[:5], cards[5:39], cards[39:]
+    features = ('hcp', 'loser', 'ds', 'adjust', 'dp', 'isFlat', 'type')
+    expected = {}
+    for rest in itertools.combinations(unknown, 8):
+        h = Bridge.Hand(cards=fixed + list(rest))
+        key = tuple([getattr(h.rating, f) for f in features[:5]] + [h.type.isFlat, tuple(h.type.type)])
+        expected[key] = expected.get(key, 0) + 1
+    mask = lambda cards: sum(1 << card for card in cards)
+    assert hand(features, mask(fixed), mask(others)) == expected
+
+    north, south, others, unknown = cards[:9], cards[9:18], cards[18:44], cards[44:]
+    for features in [features, ('hcp', 'fit', 'shape')]:
+        expected = {}
+        for rest in itertools.combinations(unknown, 4):
+            n = Bridge.Hand(cards=north + list(rest))
+            s = Bridge.Hand(cards=south + [card for card in unknown if card not in rest])
+            rating, type = n.rating + s.rating, n.type + s.type
+            values = { 'isFlat': n.type.isFlat and s.type.isFlat, 'type': tuple(type.type),
+                       'shape': tuple(sorted(type.type, reverse=True)), 'fit': max(type.type) }
+            key = tuple(values[f] if f in values else getattr(rating, f) for f in features)
+            expected[key] = expected.get(key, 0) + 1
+        assert partnership(features, (mask(north), mask(south)), mask(others)) == expected
+    print("ok")